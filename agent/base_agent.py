@@ -1,30 +1,52 @@
+from dataclasses import dataclass
+
 from pydantic_ai import Agent, RunContext, Tool
-from tools.file_tools import (
+from tools.async_file_tools import (
     list_files,
     read_file,
     write_file,
     delete_file,
-    answer_question_about_files
+    answer_question_about_files,
+    batch_file_operations,
+    search_files,
+    find_related_files,
+    list_changes
 )
-from pathlib import Path
+from agent.prompt_cache import load_prompt
+from agent.traced_model import TracedModel
+
+MODEL_NAME = "openai:gpt-4o"
+SYSTEM_PROMPT_FILE = "base_agent_prompt.txt"
+
+@dataclass(frozen=True)
+class AgentProfile:
+    """
+    The model name and system prompts a file agent is built with, passed along
+    with the agent to the code that replays or caches its runs (the fast path and
+    the response cache), which must not read them from the agent's private fields.
+    """
+    model_name: str = ""
+    system_prompts: tuple = ()
+
+def agent_profile(model_name: str = MODEL_NAME) -> AgentProfile:
+    """The profile of the agent build_agent builds."""
+    return AgentProfile(model_name=model_name, system_prompts=(load_prompt(SYSTEM_PROMPT_FILE),))
 
 def build_agent(base_directory: str) -> Agent:
     """
     Initializes the file agent scoped to a specific base directory.
     """
-    prompt_path = Path(__file__).parent / "prompts" / "base_agent_prompt.txt"
-    with open(prompt_path, "r") as f:
-        system_prompt = f.read()
-        
+    system_prompt = load_prompt(SYSTEM_PROMPT_FILE)
+
     agent = Agent(
-        model='openai:gpt-4o',
+        model=TracedModel(MODEL_NAME),
         tools = [Tool(
                     name="list_files",
-                    description="List all files in the workspace with their modification times and sizes.",
+                    description="List files in the workspace with their modification times and sizes. Supports recursion, glob/extension/size/time filters, sorting and cursor pagination.",
                     function=list_files
                 ), Tool(
                     name="read_file",
-                    description="Read the content of a file within the workspace.",
+                    description="Read a file within the workspace. Large files are paginated: pass offset/limit (bytes), start_line/end_line, or the cursor from the previous page.",
                     function=read_file
                 ), Tool(
                     name="write_file",
@@ -36,8 +58,24 @@ def build_agent(base_directory: str) -> Agent:
                     function=delete_file
                 ), Tool(
                     name="answer_question_about_files",
-                    description="Answer questions about files by analyzing their contents.",
+                    description="Answer questions about files by retrieving the top-ranked passages (with filename and byte offsets) that match the question.",
                     function=answer_question_about_files
+                ), Tool(
+                    name="search_files",
+                    description="Search file contents for a keyword or regular expression. Returns matching lines with filename, line and column, optionally with surrounding context lines.",
+                    function=search_files
+                ), Tool(
+                    name="find_related_files",
+                    description="Find the files most similar in content to a given file (or to a text description), ranked by similarity with their best-matching chunks. Use this instead of reading every file.",
+                    function=find_related_files
+                ), Tool(
+                    name="list_changes",
+                    description="List the files created, modified or deleted since a point in time (e.g. 'yesterday', '2h', 'session'), and by whom, from the workspace change journal. Use this instead of listing and reading every file to find out what changed.",
+                    function=list_changes
+                ), Tool(
+                    name="batch_file_operations",
+                    description="Read, write, append or delete several files in one call. Prefer this whenever a task touches more than one file.",
+                    function=batch_file_operations
                 )],
         system_prompt=system_prompt
     )
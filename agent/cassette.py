@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+from contextlib import asynccontextmanager
+
+from pydantic_ai.messages import ModelMessagesTypeAdapter, ModelResponse, UserPromptPart
+from pydantic_ai.models.function import FunctionModel
+from pydantic_ai.models.wrapper import WrapperModel
+
+CASSETTE_VERSION = 1
+
+class CassetteMismatchError(RuntimeError):
+    """Raised when a replayed run asks for something the cassette did not record."""
+
+def _latest_prompt(messages: list) -> str:
+    """The most recent user prompt in a request's messages, used to check replay order."""
+    for message in reversed(messages):
+        for part in getattr(message, "parts", []):
+            if isinstance(part, UserPromptPart):
+                return part.content if isinstance(part.content, str) else str(part.content)
+    return ""
+
+def _dump_response(response: ModelResponse) -> dict:
+    return ModelMessagesTypeAdapter.dump_python([response], mode="json")[0]
+
+def _load_response(data: dict) -> ModelResponse:
+    return ModelMessagesTypeAdapter.validate_python([data])[0]
+
+class Cassette:
+    """
+    Recorded model exchanges, kept per channel (e.g. "filter" and "file") so
+    concurrently running agents replay independently and deterministically.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.channels = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        cassette = cls(path)
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version in '{path}'.")
+        cassette.channels = data["channels"]
+        return cassette
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({"version": CASSETTE_VERSION, "channels": self.channels}, f, indent=1)
+
+    def record(self, channel: str, messages: list, response: ModelResponse) -> None:
+        with self._lock:
+            self.channels.setdefault(channel, []).append({
+                "prompt": _latest_prompt(messages),
+                "response": _dump_response(response),
+            })
+
+    def next_response(self, channel: str, messages: list) -> ModelResponse:
+        """
+        Serve the channel's next recorded response. A request for another prompt
+        does not use up the exchange, so a speculative request that was never
+        recorded (its run was cancelled) leaves the replay in step.
+        """
+        prompt = _latest_prompt(messages)
+        with self._lock:
+            exchanges = self.channels.get(channel, [])
+            position = self._positions.get(channel, 0)
+            if position >= len(exchanges):
+                raise CassetteMismatchError(f"Cassette has no more '{channel}' exchanges (used {position}).")
+            exchange = exchanges[position]
+            if exchange["prompt"] != prompt:
+                raise CassetteMismatchError(
+                    f"'{channel}' exchange {position} was recorded for prompt {exchange['prompt']!r}, "
+                    f"but the run asked about {prompt!r}."
+                )
+            self._positions[channel] = position + 1
+        return _load_response(exchange["response"])
+
+    def recording_model(self, channel: str, model) -> "RecordingModel":
+        """Wrap a real model so every response it returns is written to this cassette."""
+        return RecordingModel(model, self, channel)
+
+    def replay_model(self, channel: str) -> FunctionModel:
+        """A local stand-in model that serves the recorded responses of a channel in order."""
+        return FunctionModel(
+            lambda messages, info: self.next_response(channel, messages),
+            model_name=f"cassette:{channel}",
+        )
+
+class RecordingModel(WrapperModel):
+    """Passes requests through to the wrapped model and records its responses."""
+
+    def __init__(self, wrapped, cassette: Cassette, channel: str):
+        super().__init__(wrapped)
+        self.cassette = cassette
+        self.channel = channel
+
+    async def request(self, messages, model_settings, model_request_parameters) -> ModelResponse:
+        response = await self.wrapped.request(messages, model_settings, model_request_parameters)
+        self.cassette.record(self.channel, messages, response)
+        return response
+
+    @asynccontextmanager
+    async def request_stream(self, messages, model_settings, model_request_parameters):
+        async with self.wrapped.request_stream(messages, model_settings, model_request_parameters) as stream:
+            yield stream
+        self.cassette.record(self.channel, messages, stream.get())
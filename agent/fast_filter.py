@@ -0,0 +1,94 @@
+import re
+from collections import OrderedDict
+
+# A request naming a file operation together with a file-ish object is accepted
+# without asking the filter model.
+_FILE_VERBS = re.compile(
+    r"\b(list|read|show|open|view|display|print|write|create|make|save|add|append|update|edit|"
+    r"overwrite|delete|remove|erase|rename|search|find|grep|summari[sz]e|contain|contains)\b"
+)
+_FILE_NOUNS = re.compile(r"\b(files?|folders?|director(y|ies)|workspace|documents?|notes?|contents?|logs?)\b")
+_FILENAME = re.compile(r"\b[\w-]+\.[a-z0-9]{1,5}\b")
+
+# Clearly off-topic requests that mention nothing file-related are rejected locally.
+_OFF_TOPIC = re.compile(
+    r"\b(jokes?|weather|poems?|songs?|recipes?|meaning of life|capital of|who won|stock prices?|"
+    r"how are you|tell me about yourself|your favou?rite|horoscope|lottery)\b"
+)
+
+DEFAULT_DECISION_CACHE_SIZE = 1024
+
+def normalize_message(message: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so equivalent prompts share a key."""
+    return re.sub(r"\s+", " ", message.strip().lower()).rstrip(" .!?")
+
+def classify_locally(message: str):
+    """
+    Rule-based pre-classification of a normalized message.
+    Returns "accept" or "reject" for high-confidence cases and None when the filter model must decide.
+    """
+    has_filename = bool(_FILENAME.search(message))
+    has_noun = bool(_FILE_NOUNS.search(message))
+    if _FILE_VERBS.search(message) and (has_filename or has_noun):
+        return "accept"
+    if _OFF_TOPIC.search(message) and not (has_filename or has_noun):
+        return "reject"
+    return None
+
+def parse_decision(output) -> str:
+    """Normalize the filter model's reply; anything other than an explicit reject is accepted."""
+    decision = (output or "").strip().lower().replace("`", "")
+    return "reject" if decision == "reject" else "accept"
+
+class FilterGate:
+    """
+    Decides whether a message may reach the file agent, consulting the filter
+    model only when neither the local rules nor the decision cache can answer.
+    """
+
+    def __init__(self, filter_agent, cache_size: int = DEFAULT_DECISION_CACHE_SIZE):
+        self.filter_agent = filter_agent
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.local_accepts = 0
+        self.local_rejects = 0
+        self.cache_hits = 0
+        self.upstream_calls = 0
+
+    async def decide(self, message: str) -> str:
+        """Return "accept" or "reject" for the message."""
+        key = normalize_message(message)
+        decision = classify_locally(key)
+        if decision is not None:
+            if decision == "accept":
+                self.local_accepts += 1
+            else:
+                self.local_rejects += 1
+            return decision
+
+        decision = self._cache.get(key)
+        if decision is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return decision
+
+        self.upstream_calls += 1
+        result = await self.filter_agent.run(message)
+        decision = parse_decision(result.output)
+        self._cache[key] = decision
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return decision
+
+    @property
+    def skipped_upstream_calls(self) -> int:
+        return self.local_accepts + self.local_rejects + self.cache_hits
+
+    def stats(self) -> dict:
+        return {
+            "local_accepts": self.local_accepts,
+            "local_rejects": self.local_rejects,
+            "cache_hits": self.cache_hits,
+            "upstream_calls": self.upstream_calls,
+            "skipped_upstream_calls": self.skipped_upstream_calls,
+        }
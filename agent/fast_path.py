@@ -0,0 +1,150 @@
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+from pydantic_ai.messages import (
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+
+from tools import async_file_tools
+from tools.file_tools import _safe_path
+from tools.tracing import span
+
+# Plain filenames only: no directories, so nothing here can leave the workspace.
+_FILENAME = r"['\"`]?(?P<filename>[\w-][\w.-]*\.[A-Za-z0-9]{1,8})['\"`]?"
+_END = r"[.!?]*"
+
+def _command(pattern: str) -> re.Pattern:
+    """Compile a command template; spaces match any run of whitespace."""
+    pattern = pattern.replace(" ", r"\s+").replace("FILENAME", _FILENAME)
+    return re.compile(rf"(?:please\s+)?{pattern}", re.IGNORECASE | re.DOTALL)
+
+# (tool, pattern) in match order. Write and append keep their content verbatim,
+# so only the filename commands tolerate trailing punctuation.
+_COMMANDS = [
+    ("list_files", _command(rf"(?:list|show)(?: me)?(?: all)?(?: the)? files(?: in the workspace)?(?: again| one last time)?{_END}")),
+    ("read_file", _command(rf"(?:read|show|display|open|print)(?: me)?(?: the)?(?: contents? of)?(?: the)?(?: file)? FILENAME{_END}")),
+    ("delete_file", _command(rf"(?:delete|remove)(?: the)?(?: file)? FILENAME{_END}")),
+    ("write_file", _command(r"(?:create|write|make)(?: a)?(?: new)?(?: file)?(?: called| named)? FILENAME with(?: the)? content:?(?: (?P<content>.*))?")),
+    ("append_file", _command(rf"append (?P<content>.+?) to(?: the end of)?(?: the)?(?: file)? FILENAME{_END}")),
+]
+# "Append a line about X to notes.txt" describes the text instead of giving it.
+_DESCRIBED_CONTENT = re.compile(r"(?:a|an|the|some)\s+(?:line|note|sentence|paragraph|section|summary|text)\b", re.IGNORECASE)
+_READ_ERRORS = ("Permission denied when reading", "Error reading", "Cannot extract text from", "Invalid range for")
+
+def parse_command(message: str):
+    """
+    Recognize an unambiguous single-file command.
+    Returns (tool, arguments) for the file tool to call, or None when the agent must handle the message.
+    """
+    message = message.strip()
+    for tool, pattern in _COMMANDS:
+        match = pattern.fullmatch(message)
+        if match is None:
+            continue
+        arguments = {"filename": match.group("filename")} if "filename" in pattern.groupindex else {}
+        if tool == "write_file":
+            arguments["content"] = (match.group("content") or "").strip()
+        elif tool == "append_file":
+            content = match.group("content").strip()
+            if _DESCRIBED_CONTENT.match(content):
+                return None
+            tool, arguments = "write_file", {**arguments, "content": content, "mode": "a"}
+        return tool, arguments
+    return None
+
+def _format_listing(files: list) -> str:
+    if files and "error" in files[0]:
+        return f"Could not list files: {files[0]['error']}"
+    lines = []
+    for entry in files:
+        if "next_cursor" in entry:
+            lines.append(f"...and {entry['total_matches'] - len(lines)} more files.")
+        else:
+            lines.append(f"- {entry['filename']} ({entry['size_bytes']} bytes, modified {entry['modified_time_human']})")
+    if not lines:
+        return "The workspace has no files."
+    return "Files in the workspace:\n" + "\n".join(lines)
+
+def _format_read(filename: str, path: str, text: str) -> str:
+    if not os.path.isfile(path) or text.startswith(_READ_ERRORS):
+        return text
+    if text == "":
+        return f"File '{filename}' is empty."
+    return f"Content of '{filename}':\n\n{text}"
+
+@dataclass
+class FastPathResult:
+    """Stands in for an agent run result: the templated reply and the messages recording the tool call."""
+    output: str
+    messages: list = field(default_factory=list)
+
+    def new_messages(self) -> list:
+        return self.messages
+
+class FastPath:
+    """
+    Serves literal file commands ("List all files", "Read the content of notes.txt",
+    "Delete the file notes.txt", ...) by calling the matching file tool directly,
+    with a templated reply and without any model call. Everything else is left
+    to the filter and the file agent.
+    """
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = enabled if enabled is not None else os.environ.get("FILE_AGENT_FAST_PATH", "1") != "0"
+        self.requests = 0
+        self.served = 0
+        self.seconds = 0.0
+        self.by_tool = {}
+
+    async def serve(self, message: str, deps: dict, message_history=None, system_prompts=()):
+        """Run the message as a direct tool call and return a FastPathResult, or None to fall back to the agent."""
+        self.requests += 1
+        command = parse_command(message) if self.enabled else None
+        if command is None:
+            return None
+        tool, arguments = command
+        started = time.perf_counter()
+        with span("fast_path", tool):
+            output, tool_result = await self._run(tool, arguments, deps)
+        self.seconds += time.perf_counter() - started
+        self.served += 1
+        self.by_tool[tool] = self.by_tool.get(tool, 0) + 1
+
+        # A history that starts here still needs the agent's system prompt.
+        request_parts = [] if message_history else [SystemPromptPart(prompt) for prompt in system_prompts]
+        call = ToolCallPart(tool, arguments)
+        return FastPathResult(output=output, messages=[
+            ModelRequest(parts=request_parts + [UserPromptPart(message)]),
+            ModelResponse(parts=[call]),
+            ModelRequest(parts=[ToolReturnPart(tool, tool_result, tool_call_id=call.tool_call_id)]),
+            ModelResponse(parts=[TextPart(output)]),
+        ])
+
+    async def _run(self, tool: str, arguments: dict, deps: dict):
+        """Call the tool; return (templated reply, raw tool result)."""
+        ctx = SimpleNamespace(deps=deps)
+        result = await getattr(async_file_tools, tool)(ctx, **arguments)
+        if tool == "list_files":
+            return _format_listing(result), result
+        if tool == "read_file":
+            path = _safe_path(ctx, arguments["filename"])
+            return _format_read(arguments["filename"], path, result), result
+        return result, result
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "served": self.served,
+            "fraction_served": round(self.served / self.requests, 3) if self.requests else 0.0,
+            "mean_latency_ms": round(self.seconds / self.served * 1000, 3) if self.served else 0.0,
+            "by_tool": dict(self.by_tool),
+        }
@@ -0,0 +1,151 @@
+import os
+from dataclasses import replace
+
+from pydantic_ai.messages import (
+    ModelRequest,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+
+DEFAULT_HISTORY_TOKENS = 8000
+DEFAULT_KEEP_RECENT_TURNS = 3
+DEFAULT_TOOL_OUTPUT_CHARS = 400
+SUMMARY_SNIPPET_CHARS = 160
+ELIDED_SUFFIX = "characters elided]"
+SUMMARY_PREFIX = "Summary of earlier conversation:"
+
+def estimate_tokens(messages: list) -> int:
+    """Rough token count (about four characters per token) of a message list."""
+    chars = 0
+    for message in messages:
+        for part in message.parts:
+            if isinstance(part, ToolCallPart):
+                chars += len(part.tool_name) + len(part.args_as_json_str())
+            else:
+                content = getattr(part, "content", "")
+                chars += len(content if isinstance(content, str) else str(content))
+    return chars // 4
+
+def _snippet(text: str, limit: int = SUMMARY_SNIPPET_CHARS) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+def _split_turns(messages: list):
+    """Split history into (system_parts, turns); a turn starts at each user prompt."""
+    system_parts = []
+    turns = []
+    for message in messages:
+        if isinstance(message, ModelRequest):
+            system_parts.extend(p for p in message.parts if isinstance(p, SystemPromptPart))
+            parts = [p for p in message.parts if not isinstance(p, SystemPromptPart)]
+            if not parts:
+                continue
+            message = replace(message, parts=parts)
+            if any(isinstance(p, UserPromptPart) for p in parts) or not turns:
+                turns.append([])
+        elif not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return system_parts, turns
+
+def _elide_tool_outputs(turn: list, max_chars: int) -> list:
+    """Return the turn with long tool results cut down to max_chars."""
+    compacted = []
+    for message in turn:
+        if isinstance(message, ModelRequest):
+            parts = []
+            for part in message.parts:
+                if isinstance(part, ToolReturnPart):
+                    text = part.model_response_str()
+                    if len(text) > max_chars and not text.endswith(ELIDED_SUFFIX):
+                        elided = f"{text[:max_chars]}\n[... {len(text) - max_chars} {ELIDED_SUFFIX}"
+                        part = replace(part, content=elided)
+                parts.append(part)
+            message = replace(message, parts=parts)
+        compacted.append(message)
+    return compacted
+
+def _summarize_turn(turn: list) -> str:
+    """One-line extractive summary of a turn: the request, the tools used and the reply."""
+    prompt = ""
+    tools = []
+    reply = ""
+    for message in turn:
+        for part in message.parts:
+            if isinstance(part, UserPromptPart) and not prompt:
+                prompt = part.content if isinstance(part.content, str) else str(part.content)
+            elif isinstance(part, ToolCallPart):
+                tools.append(part.tool_name)
+            elif isinstance(part, TextPart):
+                reply = part.content
+    used = f" [tools: {', '.join(dict.fromkeys(tools))}]" if tools else ""
+    return f"- User: {_snippet(prompt)}{used} -> Agent: {_snippet(reply)}"
+
+class HistoryManager:
+    """
+    Keeps a conversation's message history within a token budget.
+
+    The most recent turns are kept verbatim. Older turns first have their tool
+    outputs elided; if the history is still over budget, the oldest turns are
+    folded into a short extractive summary placed after the system prompt.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = None,
+        keep_recent_turns: int = DEFAULT_KEEP_RECENT_TURNS,
+        max_tool_output_chars: int = DEFAULT_TOOL_OUTPUT_CHARS,
+    ):
+        self.token_budget = token_budget or int(os.environ.get("FILE_AGENT_HISTORY_TOKENS", DEFAULT_HISTORY_TOKENS))
+        self.keep_recent_turns = keep_recent_turns
+        self.max_tool_output_chars = max_tool_output_chars
+        self.messages = []
+        self._summary_lines = []
+        self.compactions = 0
+
+    def extend(self, new_messages: list) -> None:
+        """Add a run's new messages and compact the history if it is over budget."""
+        self.messages = self.messages + list(new_messages)
+        if estimate_tokens(self.messages) > self.token_budget:
+            self.messages = self.compact(self.messages)
+            self.compactions += 1
+
+    def compact(self, messages: list) -> list:
+        system_parts, turns = _split_turns(messages)
+        system_parts = [p for p in system_parts if not p.content.startswith(SUMMARY_PREFIX)]
+        split = max(0, len(turns) - self.keep_recent_turns)
+        older = [_elide_tool_outputs(turn, self.max_tool_output_chars) for turn in turns[:split]]
+        recent = turns[split:]
+
+        def build(summary_lines, older_turns):
+            head_parts = list(system_parts)
+            if summary_lines:
+                head_parts.append(SystemPromptPart(SUMMARY_PREFIX + "\n" + "\n".join(summary_lines)))
+            head = [ModelRequest(parts=head_parts)] if head_parts else []
+            body = [message for turn in older_turns + recent for message in turn]
+            if head and body and isinstance(body[0], ModelRequest):
+                # Merge into the first request so the history starts with a single request.
+                head = [ModelRequest(parts=head_parts + list(body[0].parts))]
+                body = body[1:]
+            return head + body
+
+        compacted = build(self._summary_lines, older)
+        while older and estimate_tokens(compacted) > self.token_budget:
+            self._summary_lines.append(_summarize_turn(older.pop(0)))
+            compacted = build(self._summary_lines, older)
+        while len(self._summary_lines) > 1 and estimate_tokens(compacted) > self.token_budget:
+            self._summary_lines.pop(0)
+            compacted = build(self._summary_lines, older)
+        return compacted
+
+    def stats(self) -> dict:
+        return {
+            "messages": len(self.messages),
+            "estimated_tokens": estimate_tokens(self.messages),
+            "token_budget": self.token_budget,
+            "compactions": self.compactions,
+            "summarized_turns": len(self._summary_lines),
+        }
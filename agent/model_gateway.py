@@ -0,0 +1,282 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import httpx
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.messages import ModelMessagesTypeAdapter
+from pydantic_ai.models.wrapper import WrapperModel
+
+from tools.tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+# provider -> (requests per second, burst, concurrent requests); override with
+# FILE_AGENT_<PROVIDER>_RPS, FILE_AGENT_<PROVIDER>_BURST and FILE_AGENT_<PROVIDER>_CONCURRENCY.
+PROVIDER_LIMITS = {
+    "openai": (5.0, 10, 8),
+    "groq": (10.0, 20, 16),
+}
+DEFAULT_LIMITS = (5.0, 10, 8)
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BACKOFF_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 20.0
+# A 429 halves the request rate, down to this fraction of the configured rate;
+# every successful call then restores this fraction of it.
+MIN_RATE_FRACTION = 0.1
+RATE_RECOVERY_STEP = 0.05
+
+class TokenBucket:
+    """Requests-per-second limit with bursts, whose rate backs off on 429s and recovers on success."""
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        # Waiters are served in arrival order.
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def throttle(self) -> None:
+        self._refill()
+        self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+        self.tokens = 0.0
+
+    def recover(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY_STEP)
+
+def _drop_timestamps(value) -> None:
+    if isinstance(value, dict):
+        value.pop("timestamp", None)
+        for item in value.values():
+            _drop_timestamps(item)
+    elif isinstance(value, list):
+        for item in value:
+            _drop_timestamps(item)
+
+def request_key(model_name: str, messages: list, model_settings, model_request_parameters) -> str:
+    """Identify a model request by its content, ignoring message timestamps."""
+    payload = ModelMessagesTypeAdapter.dump_python(messages, mode="json")
+    _drop_timestamps(payload)
+    raw = json.dumps([model_name, payload, model_settings, repr(model_request_parameters)], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors and connection failures are retried; other errors are not."""
+    if isinstance(error, ModelHTTPError):
+        return error.status_code == 429 or error.status_code >= 500
+    if isinstance(error, httpx.TransportError):
+        return True
+    # The provider SDKs wrap connection failures and timeouts in their own APIConnectionError.
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+class ModelGateway:
+    """
+    Every call to one model provider goes through its gateway, which
+
+    - coalesces identical in-flight requests, so concurrent clients asking the
+      same thing share one upstream call (single-flight);
+    - queues calls for a token-bucket rate limit and a concurrency limit;
+    - retries rate limits, server errors and connection failures with
+      jittered exponential backoff, halving the request rate after a 429.
+
+    Queue depth and in-flight calls are exported as gauges, time spent queued
+    as the "model_queue" latency histogram.
+    """
+
+    def __init__(self, provider: str, rate: float = None, burst: int = None, concurrency: int = None,
+                 max_attempts: int = None, backoff_seconds: float = None):
+        default_rate, default_burst, default_concurrency = PROVIDER_LIMITS.get(provider, DEFAULT_LIMITS)
+        prefix = f"FILE_AGENT_{provider.upper()}"
+        self.provider = provider
+        self.bucket = TokenBucket(
+            rate or float(os.environ.get(f"{prefix}_RPS", default_rate)),
+            burst or int(os.environ.get(f"{prefix}_BURST", default_burst)),
+        )
+        self.concurrency = concurrency or int(os.environ.get(f"{prefix}_CONCURRENCY", default_concurrency))
+        self.max_attempts = max_attempts or int(os.environ.get("FILE_AGENT_MODEL_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        self.backoff_seconds = backoff_seconds if backoff_seconds is not None else float(
+            os.environ.get("FILE_AGENT_MODEL_BACKOFF_SECONDS", DEFAULT_BACKOFF_SECONDS)
+        )
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._inflight = {}
+        self.queued = 0
+        self.peak_queued = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.wait_seconds = 0.0
+
+    def _gauges(self) -> None:
+        labels = (("provider", self.provider),)
+        metrics.set("file_agent_model_queue_depth", labels, self.queued)
+        metrics.set("file_agent_model_in_flight", labels, self.in_flight)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a concurrency slot and a rate token, recording the time spent queued."""
+        started = time.perf_counter()
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        self._gauges()
+        try:
+            await self._slots.acquire()
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                self._slots.release()
+                raise
+        finally:
+            self.queued -= 1
+        waited = time.perf_counter() - started
+        self.wait_seconds += waited
+        metrics.observe("model_queue", self.provider, waited)
+        self.in_flight += 1
+        self._gauges()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            self._gauges()
+
+    async def request(self, model, messages, model_settings, model_request_parameters):
+        key = request_key(model.model_name, messages, model_settings, model_request_parameters)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            metrics.add("file_agent_model_coalesced_total", (("provider", self.provider),), 1)
+            # Each agent appends the response to its own history, so followers get their own copy.
+            return copy.deepcopy(await asyncio.shield(task))
+
+        task = asyncio.ensure_future(self._call_with_retry(
+            lambda: model.request(messages, model_settings, model_request_parameters)
+        ))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded, so one caller giving up does not cancel the call for everyone sharing it.
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here too, in case every caller has gone away
+
+    async def _call_with_retry(self, call):
+        for attempt in range(1, self.max_attempts + 1):
+            async with self.slot():
+                self.calls += 1
+                try:
+                    response = await call()
+                except Exception as e:
+                    self._failed(e, attempt)
+                    error = e
+                else:
+                    self.bucket.recover()
+                    return response
+            await self._backoff(error, attempt)
+
+    def _failed(self, error: Exception, attempt: int) -> None:
+        """Re-raise an error that will not be retried; a 429 halves the request rate."""
+        if not is_retryable(error) or attempt == self.max_attempts:
+            self.failures += 1
+            raise error
+        if isinstance(error, ModelHTTPError) and error.status_code == 429:
+            self.throttled += 1
+            self.bucket.throttle()
+
+    async def _backoff(self, error: Exception, attempt: int) -> None:
+        delay = random.uniform(0, min(BACKOFF_CAP_SECONDS, self.backoff_seconds * 2 ** (attempt - 1)))
+        self.retries += 1
+        metrics.add("file_agent_model_retries_total", (("provider", self.provider),), 1)
+        logger.warning(f"{self.provider} call failed ({error}); retry {attempt} of {self.max_attempts - 1} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def request_stream(self, model, messages, model_settings, model_request_parameters):
+        """
+        Streams are rate and concurrency limited, and opening one is retried like a
+        request. Once it has been handed to the caller it is neither shared nor retried.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            async with AsyncExitStack() as stack:
+                await stack.enter_async_context(self.slot())
+                self.calls += 1
+                try:
+                    stream = await stack.enter_async_context(
+                        model.request_stream(messages, model_settings, model_request_parameters)
+                    )
+                except Exception as e:
+                    self._failed(e, attempt)
+                    error = e
+                else:
+                    self.bucket.recover()
+                    yield stream
+                    return
+            await self._backoff(error, attempt)
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": round(self.bucket.rate, 3),
+            "max_rate_per_second": self.bucket.max_rate,
+            "concurrency": self.concurrency,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "in_flight": self.in_flight,
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "mean_wait_ms": round(self.wait_seconds / self.calls * 1000, 3) if self.calls else 0.0,
+        }
+
+_gateways = {}
+
+def gateway_for(provider: str) -> ModelGateway:
+    """The process-wide gateway of a provider, shared by every agent and session."""
+    gateway = _gateways.get(provider)
+    if gateway is None:
+        gateway = _gateways[provider] = ModelGateway(provider)
+    return gateway
+
+def gateway_stats() -> dict:
+    return {provider: gateway.stats() for provider, gateway in sorted(_gateways.items())}
+
+class GatewayModel(WrapperModel):
+    """Sends a model's requests through a ModelGateway."""
+
+    def __init__(self, wrapped, gateway: ModelGateway):
+        super().__init__(wrapped)
+        self.gateway = gateway
+
+    async def request(self, messages, model_settings, model_request_parameters):
+        return await self.gateway.request(self.wrapped, messages, model_settings, model_request_parameters)
+
+    @asynccontextmanager
+    async def request_stream(self, messages, model_settings, model_request_parameters):
+        async with self.gateway.request_stream(self.wrapped, messages, model_settings, model_request_parameters) as stream:
+            yield stream
@@ -0,0 +1,130 @@
+import asyncio
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from agent.base_agent import AgentProfile
+from agent.streaming import EventGate, run_with_events
+from tools.async_file_tools import path_locks
+from tools.file_tools import apply_mutation
+from tools.mutation_journal import MutationJournal
+from tools.tracing import span
+
+@dataclass
+class GuardedRun:
+    """Outcome of one filtered agent run."""
+    decision: str
+    result: Optional[Any] = None
+    mutation_results: list = field(default_factory=list)
+
+async def _cancel(task: asyncio.Task) -> None:
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        # The speculative run's outcome is irrelevant once the request is rejected.
+        pass
+
+async def _run_agent(file_agent, message: str, on_event=None, stream_text: bool = False, **kwargs):
+    with span("agent", "file_agent"):
+        if on_event is not None:
+            return await run_with_events(file_agent, message, on_event, stream_text=stream_text, **kwargs)
+        return await file_agent.run(message, **kwargs)
+
+async def _commit(journal: MutationJournal, deps: dict) -> list:
+    """Apply the staged mutations holding the write lock of every path they touch, like the tools themselves."""
+    async with AsyncExitStack() as locks:
+        locked = set()
+        while True:
+            for path in sorted(journal.staged_paths() - locked):
+                await locks.enter_async_context(path_locks.writing(path))
+                locked.add(path)
+            if journal.begin_commit(locked):
+                break
+        return await asyncio.to_thread(journal.commit, lambda op: apply_mutation(deps, op))
+
+async def _decide(filter_gate, message: str) -> str:
+    with span("filter", "decide") as attrs:
+        attrs["decision"] = await filter_gate.decide(message)
+        return attrs["decision"]
+
+async def run_guarded(filter_gate, file_agent, message: str, deps: dict, message_history=None, fast_path=None,
+                      response_cache=None, on_event=None, stream_text: bool = False,
+                      speculative: bool = True, profile: AgentProfile = None) -> GuardedRun:
+    """
+    Run the request filter and the file agent concurrently.
+
+    With a FastPath, literal file commands are first served by calling the
+    matching tool directly; neither the filter nor the agent runs for them.
+    With a ResponseCache, a read-only question answered before against the
+    same files is answered from the cache, and new read-only answers are stored.
+    With on_event, the agent's model turns and tool calls (and with stream_text,
+    its reply as it arrives) are passed to `await on_event(AgentEvent)` once
+    the filter has accepted the request.
+
+    The agent starts speculatively with a MutationJournal in its deps, so
+    read-only tools run immediately while writes and deletes are staged. On
+    "accept" the staged mutations are committed and the agent continues with
+    direct writes; on "reject" they are discarded and the agent run is cancelled.
+    With speculative=False the agent only starts once the filter has accepted,
+    so model calls happen exactly for accepted requests (for record/replay).
+    Each mutation result says whether it succeeded ("ok") and what the tool reported ("result").
+
+    The fast path and the response cache take the agent's system prompts and
+    model name from `profile` (see agent_profile()), not from the agent.
+    """
+    profile = profile or AgentProfile()
+    if fast_path is not None:
+        # Fast-path commands all name a file operation and a file, which the filter accepts locally anyway.
+        result = await fast_path.serve(message, deps, message_history, system_prompts=profile.system_prompts)
+        if result is not None:
+            return GuardedRun(decision="accept", result=result)
+    if response_cache is not None:
+        # Only accepted answers are cached, so a hit needs no filter decision either.
+        result = await response_cache.lookup(message, deps, profile, message_history)
+        if result is not None:
+            return GuardedRun(decision="accept", result=result)
+        deps = response_cache.track(message, deps, message_history)
+
+    if not speculative:
+        decision = await _decide(filter_gate, message)
+        if decision == "reject":
+            return GuardedRun(decision=decision)
+        result = await _run_agent(file_agent, message, on_event=on_event, stream_text=stream_text,
+                                  message_history=message_history, deps=deps)
+        if response_cache is not None:
+            await response_cache.store(message, deps, profile, result, message_history)
+        return GuardedRun(decision=decision, result=result)
+
+    journal = MutationJournal()
+    events = EventGate(on_event) if on_event is not None else None
+    agent_task = asyncio.create_task(_run_agent(
+        file_agent,
+        message,
+        on_event=events.emit if events is not None else None,
+        stream_text=stream_text,
+        message_history=message_history,
+        deps={**deps, "mutation_journal": journal},
+    ))
+    try:
+        decision = await _decide(filter_gate, message)
+    except BaseException:
+        journal.discard()
+        await _cancel(agent_task)
+        raise
+
+    if decision == "reject":
+        journal.discard()
+        if events is not None:
+            events.close()
+        await _cancel(agent_task)
+        return GuardedRun(decision=decision)
+
+    if events is not None:
+        await events.open()
+
+    mutation_results = await _commit(journal, deps)
+    result = await agent_task
+    if response_cache is not None and not mutation_results:
+        await response_cache.store(message, deps, profile, result, message_history)
+    return GuardedRun(decision=decision, result=result, mutation_results=mutation_results)
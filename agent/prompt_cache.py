@@ -0,0 +1,10 @@
+from functools import lru_cache
+from pathlib import Path
+
+PROMPTS_DIR = Path(__file__).parent / "prompts"
+
+@lru_cache(maxsize=None)
+def load_prompt(filename: str) -> str:
+    """Read a system prompt from agent/prompts once per process."""
+    with open(PROMPTS_DIR / filename, "r") as f:
+        return f.read()
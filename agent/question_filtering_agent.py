@@ -1,11 +1,9 @@
 from pydantic_ai import Agent
-from pathlib import Path
+from agent.prompt_cache import load_prompt
+from agent.traced_model import TracedModel
 
 def build_filter_agent():
-    prompt_path = Path(__file__).parent / "prompts" / "question_filtering_agent_prompt.txt"
-    with open(prompt_path, "r") as f:
-        system_prompt = f.read()
     return Agent(
-        model="groq:llama-3.1-8b-instant",
-        system_prompt=system_prompt
+        model=TracedModel("groq:llama-3.1-8b-instant"),
+        system_prompt=load_prompt("question_filtering_agent_prompt.txt")
     )
\ No newline at end of file
@@ -0,0 +1,330 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field, replace
+
+from pydantic_ai.messages import ModelMessagesTypeAdapter, ModelRequest, SystemPromptPart, ToolCallPart, UserPromptPart
+
+from tools.change_journal import hash_file
+from tools.tracing import span
+from tools.workspace import iter_workspace_files, state_dir
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILENAME = "response_cache.sqlite3"
+DEFAULT_TTL_SECONDS = 3600.0
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Tools whose answer depends on one file each, on the whole workspace, or on the
+# time of asking. Any other tool, including every write and delete, makes a run uncacheable.
+FILE_TOOLS = {"read_file"}
+WORKSPACE_TOOLS = {"list_files", "search_files", "answer_question_about_files", "find_related_files"}
+# Refers back to the conversation, so the same words can mean something else next time.
+_CONTEXTUAL = re.compile(r"\b(?:it|its|that|those|them|they|again|above|previous|earlier|same|other|else|instead)\b", re.IGNORECASE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    used REAL NOT NULL,
+    size INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    output TEXT NOT NULL,
+    messages TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_use ON responses (used);
+"""
+
+def normalize_prompt(message: str) -> str:
+    """Case, runs of whitespace and trailing punctuation do not change the question."""
+    return " ".join(message.lower().split()).rstrip(" ?.!")
+
+def _agent_key(profile) -> str:
+    """Identifies what answered: a new system prompt or model does not reuse old answers."""
+    return json.dumps([list(profile.system_prompts), profile.model_name])
+
+def touched_files(messages: list):
+    """
+    What the tool calls in a run read: (file names, whether the whole workspace
+    was consulted), or None if a call changed files or depends on the time.
+    """
+    files, workspace = set(), False
+    for message in messages:
+        for part in message.parts:
+            if not isinstance(part, ToolCallPart):
+                continue
+            args = part.args_as_dict()
+            if part.tool_name in FILE_TOOLS:
+                files.add(args.get("filename", ""))
+            elif part.tool_name in WORKSPACE_TOOLS:
+                workspace = True
+            elif part.tool_name == "batch_file_operations" and all(op.get("op") == "read" for op in args.get("operations", [])):
+                files.update(op.get("filename", "") for op in args["operations"])
+            else:
+                return None
+    return files, workspace
+
+def _workspace_digest(base_dir: str) -> str:
+    listing = sorted((rel_path, stat.st_size, stat.st_mtime_ns) for rel_path, stat in iter_workspace_files(base_dir))
+    return hashlib.sha256(json.dumps(listing).encode("utf-8")).hexdigest()
+
+def fingerprint(base_dir: str, files, workspace: bool) -> dict:
+    """
+    Size, mtime and content hash of each file (None if missing), plus a digest of the listing if the workspace was consulted.
+    Files above FILE_AGENT_HASH_MAX_BYTES are not hashed, as in the change journal.
+    """
+    result = {"files": {}, "workspace": _workspace_digest(base_dir) if workspace else None}
+    for filename in sorted(files):
+        path = os.path.abspath(os.path.join(base_dir, filename))
+        try:
+            stat = os.stat(path)
+            result["files"][filename] = [stat.st_size, stat.st_mtime_ns, hash_file(path, stat.st_size)]
+        except OSError:
+            result["files"][filename] = None
+    return result
+
+def is_current(base_dir: str, recorded: dict) -> bool:
+    """Whether the files an answer was based on are unchanged; a file only touched, not edited, still counts as unchanged."""
+    if recorded["workspace"] is not None and _workspace_digest(base_dir) != recorded["workspace"]:
+        return False
+    for filename, entry in recorded["files"].items():
+        path = os.path.abspath(os.path.join(base_dir, filename))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if entry is not None:
+                return False
+            continue
+        if entry is None or stat.st_size != entry[0]:
+            return False
+        if stat.st_mtime_ns != entry[1] and (entry[2] is None or hash_file(path, stat.st_size) != entry[2]):
+            return False
+    return True
+
+class ReadRecorder:
+    """
+    What a run's tools read, as it was when each tool started: the size and mtime of
+    every file read, and a digest of the listing before the first workspace-wide tool.
+    Installed as deps["observe_read"]. An answer is stored only if the fingerprint
+    taken after the run still agrees, so a file edited while the run was reading it
+    does not get the old answer stored under its new fingerprint.
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.files = {}
+        self.workspace = None
+        self._lock = threading.Lock()
+
+    def __call__(self, tool: str, arguments: dict) -> None:
+        # Held while taking the state, so the first state kept for a file is the earliest one.
+        with self._lock:
+            if tool in FILE_TOOLS:
+                filename = arguments.get("filename", "")
+                if filename not in self.files:
+                    try:
+                        stat = os.stat(os.path.abspath(os.path.join(self.base_dir, filename)))
+                        self.files[filename] = [stat.st_size, stat.st_mtime_ns]
+                    except OSError:
+                        self.files[filename] = None
+            elif tool in WORKSPACE_TOOLS and self.workspace is None:
+                self.workspace = _workspace_digest(self.base_dir)
+
+    def agrees_with(self, recorded: dict) -> bool:
+        """Whether a fingerprint describes the same files as the tools saw when they started."""
+        if recorded["workspace"] is not None and recorded["workspace"] != self.workspace:
+            return False
+        for filename, entry in recorded["files"].items():
+            if filename not in self.files:
+                return False
+            state = self.files[filename]
+            if (entry is None) != (state is None) or (entry is not None and entry[:2] != state):
+                return False
+        return True
+
+@dataclass
+class CachedResult:
+    """Stands in for an agent run result: the cached reply and the messages of the run that produced it."""
+    output: str
+    messages: list = field(default_factory=list)
+
+    def new_messages(self) -> list:
+        return self.messages
+
+class ResponseCache:
+    """
+    Answers to repeated read-only questions, kept on disk per workspace in
+    `.file_agent/response_cache.sqlite3` and served without any model call.
+
+    An answer is stored under the normalized prompt, with a fingerprint of the
+    files its tool calls read (size, mtime and SHA-256) or of the workspace
+    listing when it listed or searched the workspace. It is served again only
+    while that fingerprint still matches. Runs that wrote or deleted files, or
+    asked for recent changes, are never stored, and neither are runs whose files
+    changed after their tools read them (see track()). Entries expire after
+    FILE_AGENT_RESPONSE_CACHE_TTL_SECONDS; beyond FILE_AGENT_RESPONSE_CACHE_BYTES
+    the least recently used are evicted.
+    """
+
+    def __init__(self, enabled: bool = None, ttl_seconds: float = None, max_bytes: int = None):
+        self.enabled = enabled if enabled is not None else os.environ.get("FILE_AGENT_RESPONSE_CACHE", "1") != "0"
+        self.ttl_seconds = ttl_seconds or float(os.environ.get("FILE_AGENT_RESPONSE_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.max_bytes = max_bytes or int(os.environ.get("FILE_AGENT_RESPONSE_CACHE_BYTES", DEFAULT_MAX_BYTES))
+        self._lock = threading.Lock()
+        self._dbs = {}
+        self.requests = 0
+        self.hits = 0
+        self.stores = 0
+        self.uncacheable = 0
+        self.stale = 0
+        self.changed_during_run = 0
+        self.expired = 0
+        self.evictions = 0
+        self.seconds = 0.0
+
+    def _connect(self, base_dir: str) -> sqlite3.Connection:
+        base_dir = os.path.abspath(base_dir)
+        db = self._dbs.get(base_dir)
+        if db is None:
+            path = os.path.join(state_dir(base_dir), CACHE_FILENAME)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            self._dbs[base_dir] = db
+        return db
+
+    @staticmethod
+    def _key(message: str, profile) -> str:
+        return hashlib.sha256(json.dumps([normalize_prompt(message), _agent_key(profile)]).encode("utf-8")).hexdigest()
+
+    def _cacheable_prompt(self, message: str, message_history) -> bool:
+        return self.enabled and not (message_history and _CONTEXTUAL.search(message))
+
+    def track(self, message: str, deps: dict, message_history=None) -> dict:
+        """The deps for an agent run whose answer may be stored: they record what its tools read."""
+        if not self._cacheable_prompt(message, message_history):
+            return deps
+        return {**deps, "observe_read": ReadRecorder(deps["base_directory"])}
+
+    async def lookup(self, message: str, deps: dict, profile, message_history=None):
+        """Return a CachedResult for a question answered before against the same files, or None."""
+        self.requests += 1
+        if not self._cacheable_prompt(message, message_history):
+            return None
+        started = time.perf_counter()
+        with span("response_cache", "lookup") as attrs:
+            try:
+                entry = await asyncio.to_thread(self._lookup, deps["base_directory"], self._key(message, profile))
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Response cache lookup failed: {e}")
+                entry = None
+            attrs["hit"] = entry is not None
+        if entry is None:
+            return None
+        output, messages = entry
+        self.hits += 1
+        self.seconds += time.perf_counter() - started
+        return CachedResult(output=output, messages=self._replay(messages, message, message_history))
+
+    def _lookup(self, base_dir: str, key: str):
+        with self._lock:
+            db = self._connect(base_dir)
+            row = db.execute("SELECT created, fingerprint, output, messages FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        created, recorded, output, messages = row
+        # Checked without the lock: it stats and may hash files or walk the workspace.
+        if time.time() - created > self.ttl_seconds:
+            self.expired += 1
+        elif not is_current(base_dir, json.loads(recorded)):
+            self.stale += 1
+        else:
+            with self._lock, db:
+                db.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+            return output, messages
+        with self._lock, db:
+            # Only this entry: a store may have replaced it in the meantime.
+            db.execute("DELETE FROM responses WHERE key = ? AND created = ?", (key, created))
+        return None
+
+    @staticmethod
+    def _replay(messages: str, message: str, message_history) -> list:
+        """
+        The cached run's messages, asked in this request's words and with a system prompt only if the history starts here.
+        Entries are keyed by the system prompt, so the cached one is the agent's current one.
+        """
+        messages = ModelMessagesTypeAdapter.validate_json(messages)
+        first = messages[0]
+        parts = [UserPromptPart(message) if isinstance(part, UserPromptPart) else part for part in first.parts]
+        if message_history:
+            parts = [part for part in parts if not isinstance(part, SystemPromptPart)]
+        return [ModelRequest(parts=parts, instructions=first.instructions)] + messages[1:]
+
+    async def store(self, message: str, deps: dict, profile, result, message_history=None) -> None:
+        """Keep the answer of an accepted agent run, unless it changed files or depends on the time of asking."""
+        if not self._cacheable_prompt(message, message_history):
+            return
+        messages = result.new_messages()
+        if message_history:
+            # A follow-up's own messages carry no system prompt; keep the conversation's, for replays that start a history.
+            system = [part for part in message_history[0].parts if isinstance(part, SystemPromptPart)]
+            messages = [replace(messages[0], parts=system + list(messages[0].parts))] + messages[1:]
+        touched = touched_files(messages)
+        if touched is None or not isinstance(result.output, str):
+            self.uncacheable += 1
+            return
+        try:
+            await asyncio.to_thread(self._store, deps["base_directory"], self._key(message, profile), touched, result.output,
+                                    messages, deps.get("observe_read"))
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Response cache store failed: {e}")
+
+    def _store(self, base_dir: str, key: str, touched, output: str, messages: list, reads: ReadRecorder = None) -> None:
+        recorded = fingerprint(base_dir, *touched)
+        if reads is None or not reads.agrees_with(recorded):
+            self.changed_during_run += 1
+            return
+        recorded = json.dumps(recorded)
+        dumped = ModelMessagesTypeAdapter.dump_json(messages).decode("utf-8")
+        size = len(recorded) + len(output.encode("utf-8")) + len(dumped)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._connect(base_dir)
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO responses (key, created, used, size, fingerprint, output, messages) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, now, now, size, recorded, output, dumped),
+                )
+                self.expired += db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                for old_key, old_size in db.execute("SELECT key, size FROM responses ORDER BY used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    total -= old_size
+                    self.evictions += 1
+            self.stores += 1
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.requests, 3) if self.requests else 0.0,
+            "mean_hit_latency_ms": round(self.seconds / self.hits * 1000, 3) if self.hits else 0.0,
+            "stores": self.stores,
+            "uncacheable": self.uncacheable,
+            "stale": self.stale,
+            "changed_during_run": self.changed_during_run,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
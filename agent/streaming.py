@@ -0,0 +1,114 @@
+import time
+from dataclasses import dataclass, field
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    FunctionToolCallEvent,
+    FunctionToolResultEvent,
+    PartDeltaEvent,
+    PartStartEvent,
+    TextPart,
+    TextPartDelta,
+)
+
+@dataclass
+class AgentEvent:
+    """
+    Progress of an agent run:
+    - "model_turn": a model request starts (`turn` counts them from 1)
+    - "text": a piece of the model's reply, as it arrives
+    - "tool_call" / "tool_result": a tool call starts or returns
+    """
+    kind: str
+    turn: int = 0
+    text: str = ""
+    tool: str = ""
+    args: dict = field(default_factory=dict)
+
+def describe(event: AgentEvent) -> str:
+    """One line for a progress display, e.g. "Calling read_file(filename='notes.txt')"."""
+    if event.kind == "model_turn":
+        return f"Model turn {event.turn}"
+    if event.kind == "tool_call":
+        args = ", ".join(f"{name}={value!r}" for name, value in event.args.items() if name != "content")
+        return f"Calling {event.tool}({args})"
+    if event.kind == "tool_result":
+        return f"{event.tool} done"
+    return event.text
+
+async def run_with_events(file_agent, message: str, on_event, stream_text: bool = False, **kwargs):
+    """
+    Run the agent node by node, reporting each model turn, tool call and tool
+    result to `await on_event(AgentEvent)`, and return the run result.
+
+    With stream_text, model turns are streamed and their text is reported as it
+    arrives; this needs a model that supports streaming. Otherwise each turn is
+    a single request, which keeps the gateway's request sharing and retries.
+    """
+    turn = 0
+    async with file_agent.iter(message, **kwargs) as run:
+        async for node in run:
+            if Agent.is_model_request_node(node):
+                turn += 1
+                await on_event(AgentEvent("model_turn", turn=turn))
+                if stream_text:
+                    async with node.stream(run.ctx) as stream:
+                        async for event in stream:
+                            if isinstance(event, PartStartEvent) and isinstance(event.part, TextPart) and event.part.content:
+                                await on_event(AgentEvent("text", turn=turn, text=event.part.content))
+                            elif isinstance(event, PartDeltaEvent) and isinstance(event.delta, TextPartDelta):
+                                await on_event(AgentEvent("text", turn=turn, text=event.delta.content_delta))
+            elif Agent.is_call_tools_node(node):
+                async with node.stream(run.ctx) as stream:
+                    async for event in stream:
+                        if isinstance(event, FunctionToolCallEvent):
+                            await on_event(AgentEvent("tool_call", turn=turn, tool=event.part.tool_name, args=event.part.args_as_dict()))
+                        elif isinstance(event, FunctionToolResultEvent):
+                            await on_event(AgentEvent("tool_result", turn=turn, tool=event.result.tool_name))
+    return run.result
+
+class EventGate:
+    """
+    Holds back the events of a speculative agent run until the filter accepts
+    the request, so nothing of a rejected request is shown; then passes them on.
+    """
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.pending = []
+        self.opened = False
+        self.closed = False
+
+    async def emit(self, event: AgentEvent) -> None:
+        if self.closed:
+            return
+        if self.opened:
+            await self.on_event(event)
+        else:
+            self.pending.append(event)
+
+    async def open(self) -> None:
+        # Events emitted while the backlog is passed on join its end, keeping their order.
+        while self.pending:
+            await self.on_event(self.pending.pop(0))
+        self.opened = True
+
+    def close(self) -> None:
+        self.closed = True
+        self.pending = []
+
+class FirstByteTimer:
+    """Time to first byte and total time of one reply, from when the request was made."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_byte = None
+
+    def mark(self) -> None:
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        total = time.perf_counter() - self.started
+        first_byte = self.first_byte if self.first_byte is not None else total
+        return f"[ttfb {first_byte:.3f}s, total {total:.3f}s]"
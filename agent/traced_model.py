@@ -0,0 +1,47 @@
+from contextlib import asynccontextmanager
+
+from pydantic_ai.models import Model
+from pydantic_ai.models.wrapper import WrapperModel
+
+from agent.upstream import resolve_model
+from tools.tracing import span
+
+def _record_usage(attrs: dict, usage) -> None:
+    attrs["request_tokens"] = usage.request_tokens or 0
+    attrs["response_tokens"] = usage.response_tokens or 0
+
+class TracedModel(WrapperModel):
+    """
+    Records every model turn as a 'model' span with its latency and token counts.
+
+    A model given by name (e.g. "openai:gpt-4o") is only resolved on first use,
+    so building an agent neither imports the provider SDK nor needs its API key.
+    Resolved models share one pooled HTTP client per provider.
+    """
+
+    def __init__(self, wrapped: Model | str):
+        self._wrapped = wrapped if isinstance(wrapped, Model) else None
+        self._wrapped_name = wrapped
+
+    @property
+    def wrapped(self) -> Model:
+        if self._wrapped is None:
+            self._wrapped = resolve_model(self._wrapped_name)
+        return self._wrapped
+
+    @wrapped.setter
+    def wrapped(self, model: Model) -> None:
+        self._wrapped = model
+
+    async def request(self, messages, model_settings, model_request_parameters):
+        with span("model", self.model_name) as attrs:
+            response = await self.wrapped.request(messages, model_settings, model_request_parameters)
+            _record_usage(attrs, response.usage)
+        return response
+
+    @asynccontextmanager
+    async def request_stream(self, messages, model_settings, model_request_parameters):
+        with span("model", self.model_name) as attrs:
+            async with self.wrapped.request_stream(messages, model_settings, model_request_parameters) as stream:
+                yield stream
+            _record_usage(attrs, stream.usage())
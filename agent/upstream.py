@@ -0,0 +1,56 @@
+import os
+from functools import lru_cache
+
+import httpx
+from pydantic_ai.models import Model, infer_model
+
+from agent.model_gateway import GatewayModel, gateway_for
+
+DEFAULT_UPSTREAM_CONNECTIONS = 20
+KEEPALIVE_SECONDS = 30
+# Same as the OpenAI SDK defaults that pydantic_ai uses for its own clients.
+REQUEST_TIMEOUT_SECONDS = 600
+CONNECT_TIMEOUT_SECONDS = 5
+
+@lru_cache(maxsize=None)
+def upstream_client(provider: str) -> httpx.AsyncClient:
+    """
+    One pooled HTTP client per model provider, shared by every agent and session.
+
+    Keeping connections alive across requests saves a TCP and TLS handshake per
+    model call; FILE_AGENT_UPSTREAM_CONNECTIONS caps the connections opened to
+    each provider, so a burst of sessions queues for a connection instead of
+    opening hundreds of them.
+    """
+    connections = int(os.environ.get("FILE_AGENT_UPSTREAM_CONNECTIONS", DEFAULT_UPSTREAM_CONNECTIONS))
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=connections,
+            max_keepalive_connections=connections,
+            keepalive_expiry=KEEPALIVE_SECONDS,
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+    )
+
+def resolve_model(name: str) -> Model:
+    """
+    Build the model for "provider:model" behind the provider's ModelGateway.
+    OpenAI and Groq use the pooled client; their SDKs' own retries are turned
+    off because the gateway retries with backoff shared across sessions.
+    """
+    provider, _, model_name = name.partition(":")
+    if provider == "openai":
+        from openai import AsyncOpenAI
+        from pydantic_ai.models.openai import OpenAIModel
+        from pydantic_ai.providers.openai import OpenAIProvider
+        client = AsyncOpenAI(http_client=upstream_client(provider), max_retries=0)
+        model = OpenAIModel(model_name, provider=OpenAIProvider(openai_client=client))
+    elif provider == "groq":
+        from groq import AsyncGroq
+        from pydantic_ai.models.groq import GroqModel
+        from pydantic_ai.providers.groq import GroqProvider
+        client = AsyncGroq(http_client=upstream_client(provider), max_retries=0)
+        model = GroqModel(model_name, provider=GroqProvider(groq_client=client))
+    else:
+        model = infer_model(name)
+    return GatewayModel(model, gateway_for(model.system))
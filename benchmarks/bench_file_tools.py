@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for tools/file_tools across workspace and file sizes.
+
+Each case runs in a fresh child process on a synthetic workspace and records
+wall time, peak RSS, read/write syscall counts and bytes passed through
+read/write calls, plus the workspace's size on disk. Results are written as
+JSON and can be compared against a baseline run with a regression threshold:
+
+    python benchmarks/bench_file_tools.py --profile quick --output before.json
+    python benchmarks/bench_file_tools.py --profile quick --baseline before.json
+
+With --compression, the large files are stored compressed and written files
+are compressed too, so comparing against a plain run shows what compressed
+storage saves in bytes on disk and in wall time:
+
+    python benchmarks/bench_file_tools.py --profile quick --output plain.json
+    python benchmarks/bench_file_tools.py --profile quick --compression gzip --baseline plain.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import file_tools
+from tools.compressed_storage import CODECS, encode_frames, file_header, mark_workspace
+from tools.workspace import iter_workspace_files
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+# (workspace file counts, single-file sizes in bytes)
+PROFILES = {
+    "smoke": ([10], [1 * KB]),
+    "quick": ([10, 1000], [1 * KB, 1 * MB]),
+    "standard": ([10, 1000, 10_000], [1 * KB, 1 * MB, 100 * MB]),
+    "full": ([10, 1000, 10_000, 100_000, 500_000], [1 * KB, 1 * MB, 100 * MB, 2 * GB]),
+}
+DEFAULT_REPEATS = 5
+DEFAULT_THRESHOLD = 0.20
+SMALL_FILE_BYTES = 2 * KB
+
+_WORDS = (
+    "alpha beta gamma delta epsilon report invoice meeting budget summary draft "
+    "release deploy server client error warning request response agent workspace"
+).split()
+
+def _text_block(size: int, seed: int = 0) -> bytes:
+    """Deterministic pseudo-text of exactly `size` bytes, with a newline every ~80 bytes."""
+    line_words = [_WORDS[(seed + i * 7) % len(_WORDS)] for i in range(12)]
+    line = (" ".join(line_words)[:79] + "\n").encode()
+    return (line * (size // len(line) + 1))[:size]
+
+def make_many_files_workspace(root: str, count: int) -> str:
+    workspace = os.path.join(root, f"files_{count}")
+    os.makedirs(workspace, exist_ok=True)
+    for i in range(count):
+        with open(os.path.join(workspace, f"doc_{i:06d}.txt"), "wb") as f:
+            f.write(_text_block(SMALL_FILE_BYTES, seed=i))
+    return workspace
+
+def make_big_file_workspace(root: str, size: int, compression: str = None) -> str:
+    workspace = os.path.join(root, f"size_{size}")
+    os.makedirs(workspace, exist_ok=True)
+    chunk = _text_block(min(size, 16 * MB))
+    with open(os.path.join(workspace, "big.txt"), "wb") as f:
+        if compression:
+            f.write(file_header(compression))
+        remaining = size
+        while remaining > 0:
+            data = chunk[:remaining]
+            f.write(encode_frames(compression, data) if compression else data)
+            remaining -= len(chunk)
+    if compression:
+        mark_workspace(workspace)
+    return workspace
+
+def _stored_bytes(workspace: str) -> int:
+    """Bytes the workspace's files take on disk, the agent's state directory excluded."""
+    return sum(stat.st_size for _, stat in iter_workspace_files(workspace))
+
+def _proc_io() -> dict:
+    """Read/write syscall counters and bytes of this process (Linux only); mmap reads are not counted."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return {name: int(fields[name]) for name in ("syscr", "syscw", "rchar", "wchar")}
+    except (OSError, KeyError, ValueError):
+        return {"syscr": None, "syscw": None, "rchar": None, "wchar": None}
+
+def _measure(case: dict, queue) -> None:
+    """Child process body: run one case `repeats` times and report its measurements."""
+    ctx = SimpleNamespace(deps={"base_directory": case["workspace"]})
+    func = getattr(file_tools, case["tool"])
+    for setup in case.get("setup", []):
+        getattr(file_tools, setup["tool"])(ctx, *setup.get("args", []), **setup.get("kwargs", {}))
+    io_before = _proc_io()
+    timings = []
+    for _ in range(case["repeats"]):
+        start = time.perf_counter()
+        func(ctx, *case.get("args", []), **case.get("kwargs", {}))
+        timings.append(time.perf_counter() - start)
+    io_after = _proc_io()
+
+    def per_repeat(name):
+        return None if io_before[name] is None else (io_after[name] - io_before[name]) // case["repeats"]
+
+    queue.put({
+        "wall_ms": round(statistics.median(timings) * 1000, 3),
+        "wall_ms_min": round(min(timings) * 1000, 3),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "read_syscalls": per_repeat("syscr"),
+        "write_syscalls": per_repeat("syscw"),
+        "read_bytes": per_repeat("rchar"),
+        "write_bytes": per_repeat("wchar"),
+    })
+
+def run_case(case: dict) -> dict:
+    context = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(case, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def _warmed(case: dict) -> dict:
+    """A case whose index is built by an untimed call first, so the timed repeats all find it warm."""
+    case["setup"] = [{"tool": case["tool"], "args": case.get("args", []), "kwargs": case.get("kwargs", {})}]
+    return case
+
+def build_cases(root: str, profile: str, repeats: int, compression: str = None, only: str = None) -> dict:
+    """
+    Describe every case of a profile whose name contains `only`, generating only
+    the synthetic workspaces those cases use.
+    """
+    counts, sizes = PROFILES[profile]
+    cases = {}
+
+    def add(group: dict, make_workspace) -> None:
+        group = {name: case for name, case in group.items() if not only or only in name}
+        if group:
+            workspace = make_workspace()
+            for case in group.values():
+                case["workspace"] = workspace
+            cases.update(group)
+
+    for count in counts:
+        add({
+            f"list_files/{count}_files": {"tool": "list_files", "repeats": repeats},
+            f"list_files_recursive_by_mtime/{count}_files": {
+                "tool": "list_files", "repeats": repeats,
+                "kwargs": {"recursive": True, "sort_by": "modified", "descending": True, "limit": 50},
+            },
+            f"answer_question_cold/{count}_files": {
+                "tool": "answer_question_about_files", "repeats": 1, "args": ["budget report summary"],
+            },
+            f"answer_question_warm/{count}_files": _warmed({
+                "tool": "answer_question_about_files", "repeats": repeats, "args": ["budget report summary"],
+            }),
+            f"find_related_files_warm/{count}_files": _warmed({
+                "tool": "find_related_files", "repeats": repeats, "kwargs": {"text": "budget report summary"},
+            }),
+            f"search_files_literal/{count}_files": {
+                "tool": "search_files", "repeats": repeats,
+                "args": ["invoice meeting"], "kwargs": {"max_results": 1000},
+            },
+        }, lambda: make_many_files_workspace(root, count))
+    for size in sizes:
+        label = f"{size // KB}KB"
+        add({
+            f"read_file_first_page/{label}": {"tool": "read_file", "repeats": repeats, "args": ["big.txt"]},
+            f"read_file_deep_lines/{label}": {
+                "tool": "read_file", "repeats": repeats, "args": ["big.txt"],
+                "kwargs": {"start_line": max(1, size // 80 - 100), "end_line": max(1, size // 80 - 50)},
+            },
+            f"write_file_overwrite/{label}": {
+                "tool": "write_file", "repeats": repeats,
+                "args": ["out.txt", _text_block(min(size, 1 * MB)).decode()],
+            },
+            f"write_file_append/{label}": {
+                "tool": "write_file", "repeats": repeats,
+                "args": ["log.txt", "one more log line"], "kwargs": {"mode": "a"},
+            },
+            f"search_files_regex/{label}": {
+                "tool": "search_files", "repeats": repeats,
+                "args": [r"deploy \w+ client"], "kwargs": {"regex": True, "max_results": 100},
+            },
+            f"delete_file/{label}": {
+                "tool": "delete_file", "repeats": 1, "args": ["victim.txt"],
+                "setup": [{"tool": "write_file", "args": ["victim.txt", "bye"]}],
+            },
+        }, lambda: make_big_file_workspace(root, size, compression))
+    return cases
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return (case, baseline_ms, current_ms, ratio) for cases slower than baseline by more than threshold."""
+    regressions = []
+    for case, current in results.items():
+        before = baseline.get(case)
+        if not before or not before.get("wall_ms"):
+            continue
+        ratio = current["wall_ms"] / before["wall_ms"]
+        if ratio > 1 + threshold:
+            regressions.append((case, before["wall_ms"], current["wall_ms"], round(ratio, 2)))
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the file tools on synthetic workspaces.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick", help="Workspace and file sizes to cover (default: quick).")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Timed repetitions per case; the median is reported.")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/<profile>_<timestamp>.json).")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown vs. baseline before a case counts as a regression (default: 0.20).")
+    parser.add_argument("--only", help="Only run cases whose name contains this substring.")
+    parser.add_argument("--workdir", help="Directory for the synthetic workspaces (default: a temp dir, removed afterwards).")
+    parser.add_argument("--compression", choices=sorted(CODECS), help="Store the large files, and files written by the cases, compressed with this codec.")
+    args = parser.parse_args(argv)
+
+    if args.compression:
+        # Inherited by the child processes, so write_file compresses as well.
+        os.environ["FILE_AGENT_COMPRESSION"] = args.compression
+    root = args.workdir or tempfile.mkdtemp(prefix="file_tools_bench_")
+    try:
+        cases = build_cases(root, args.profile, args.repeats, args.compression, args.only)
+        results = {}
+        for name, case in cases.items():
+            results[name] = run_case(case)
+            r = results[name]
+            r["stored_bytes"] = _stored_bytes(case["workspace"])
+            print(f"{name:<48} {r['wall_ms']:>10.3f} ms  rss {r['peak_rss_kb']:>8} KB  "
+                  f"reads {r['read_syscalls']} ({r['read_bytes']} B)  writes {r['write_syscalls']} ({r['write_bytes']} B)  "
+                  f"on disk {r['stored_bytes']} B")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "profile": args.profile,
+            "repeats": args.repeats,
+            "compression": args.compression,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"{args.profile}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for case, before, after, ratio in regressions:
+            print(f"REGRESSION {case}: {before} ms -> {after} ms ({ratio}x)")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the CLI, the MCP server and agent construction.
+
+Each case runs in a fresh interpreter, so module imports, prompt loading and
+agent construction are paid every time, as on a real launch. Results are
+written as JSON and can be compared against a baseline run:
+
+    python benchmarks/bench_startup.py --output before.json
+    python benchmarks/bench_startup.py --baseline before.json
+
+--importtime lists the slowest imports of each case (python -X importtime).
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_file_tools import DEFAULT_THRESHOLD, compare
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REPEATS = 5
+
+# Python snippets timed from interpreter start until they finish.
+CASES = {
+    "import_cli_chat": "import chat_interface.cli_chat",
+    "import_file_tools": "import tools.file_tools",
+    "build_agents": (
+        "from agent.base_agent import build_agent\n"
+        "from agent.question_filtering_agent import build_filter_agent\n"
+        "build_agent({workspace!r}); build_filter_agent()"
+    ),
+    "construct_mcp_server": (
+        "from server.mcp_server import FileAgentMCPServer\n"
+        "FileAgentMCPServer({workspace!r})"
+    ),
+}
+
+def _env() -> dict:
+    # Dummy keys, so a regression back to eager model client creation shows up as time rather than a crash.
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env.setdefault("GROQ_API_KEY", "benchmark")
+    return env
+
+def run_case(code: str) -> float:
+    """Wall milliseconds for a fresh interpreter to start and run code."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=_env(), check=True, capture_output=True)
+    return (time.perf_counter() - start) * 1000
+
+def slowest_imports(code: str, count: int = 10) -> list:
+    """(cumulative_ms, module) of the slowest imports while running code."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=_env(),
+        check=True, capture_output=True, text=True,
+    ).stderr
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = (part.strip() for part in line[len("import time:"):].split("|"))
+        timings.append((int(cumulative) / 1000, module))
+    return sorted(timings, reverse=True)[:count]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the CLI, server and agents.")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Fresh interpreters per case; the median is reported.")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/startup_<timestamp>.json).")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown vs. baseline before a case counts as a regression (default: 0.20).")
+    parser.add_argument("--only", help="Only run cases whose name contains this substring.")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports of each case.")
+    args = parser.parse_args(argv)
+
+    workspace = tempfile.mkdtemp(prefix="startup_bench_")
+    results = {}
+    try:
+        for name, template in CASES.items():
+            if args.only and args.only not in name:
+                continue
+            code = template.format(workspace=workspace)
+            timings = [run_case(code) for _ in range(args.repeats)]
+            results[name] = {"wall_ms": round(statistics.median(timings), 3), "wall_ms_min": round(min(timings), 3)}
+            print(f"{name:<32} {results[name]['wall_ms']:>10.3f} ms")
+            if args.importtime:
+                for cumulative, module in slowest_imports(code):
+                    print(f"    {cumulative:>10.3f} ms  {module}")
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "repeats": args.repeats,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for case, before, after, ratio in regressions:
+            print(f"REGRESSION {case}: {before} ms -> {after} ms ({ratio}x)")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
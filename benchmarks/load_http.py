@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Load generator for the MCP server's HTTP transport.
+
+Opens --sessions concurrent MCP sessions against a running server (or one it
+starts with --serve on a temporary workspace) and has each issue --requests
+calls back to back, then reports requests/sec and latency percentiles:
+
+    python server/mcp_server.py --transport http --port 8000 --shared-workspace &
+    python benchmarks/load_http.py --url http://127.0.0.1:8000/mcp --sessions 32 --op read
+    python benchmarks/load_http.py --serve --sessions 16 --op stats
+
+--op chat sends --message to chat_with_file_agent and so calls the models;
+stats and read exercise the transport and the workspace without them.
+--session-workspaces gives every session its own named workspace. Without it,
+sessions use the server workspace, which needs a server run with --shared-workspace.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import httpx
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUSY_PREFIX = "Server busy"
+SERVE_TIMEOUT_SECONDS = 30
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def _call(client: ClientSession, op: str, message: str, resource_uri: str) -> str:
+    """Issue one request; return "ok", "busy" or "error"."""
+    if op == "read":
+        await client.read_resource(resource_uri)
+        return "ok"
+    if op == "stats":
+        result = await client.call_tool("get_server_stats", {})
+    else:
+        result = await client.call_tool("chat_with_file_agent", {"message": message})
+    text = result.content[0].text if result.content else ""
+    if text.startswith(BUSY_PREFIX):
+        return "busy"
+    return "error" if result.isError or text.startswith("Error:") else "ok"
+
+async def run_session(index: int, args, latencies: list, outcomes: dict) -> None:
+    headers = {"X-File-Agent-Workspace": f"load-{index}"} if args.session_workspaces else None
+    async with streamablehttp_client(args.url, headers=headers) as (read_stream, write_stream, _):
+        async with ClientSession(read_stream, write_stream) as client:
+            await client.initialize()
+            resource_uri = None
+            if args.op == "read":
+                files = [r for r in (await client.list_resources()).resources if str(r.uri).startswith("file://")]
+                if not files:
+                    raise SystemExit("--op read needs at least one file in the server workspace (run the server with --shared-workspace)")
+                resource_uri = files[0].uri
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                try:
+                    outcome = await _call(client, args.op, args.message, resource_uri)
+                except Exception:
+                    outcome = "error"
+                latencies.append(time.perf_counter() - start)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+async def run_load(args) -> dict:
+    latencies = []
+    outcomes = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(i, args, latencies, outcomes) for i in range(args.sessions)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "outcomes": outcomes,
+    }
+
+@contextmanager
+def local_server(port: int):
+    """Run the HTTP server in a child process on a throwaway workspace with one sample file."""
+    workspace = tempfile.mkdtemp(prefix="load_http_")
+    with open(os.path.join(workspace, "sample.txt"), "w") as f:
+        f.write("budget report summary\n" * 1000)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env.setdefault("GROQ_API_KEY", "benchmark")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "server", "mcp_server.py"),
+         "--transport", "http", "--port", str(port), "--workspace", workspace, "--shared-workspace"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + SERVE_TIMEOUT_SECONDS
+        while True:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/healthz", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("The local server did not start")
+                time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}/mcp"
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure requests/sec of the MCP server's HTTP transport.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/mcp", help="Streamable HTTP endpoint of a running server.")
+    parser.add_argument("--serve", action="store_true", help="Start a server on a temporary workspace instead of using --url.")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --serve (default: 8765).")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent client sessions (default: 8).")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per session (default: 50).")
+    parser.add_argument("--op", choices=["read", "stats", "chat"], default="read", help="Request to issue (default: read).")
+    parser.add_argument("--message", default="List all files", help="Chat message for --op chat.")
+    parser.add_argument("--session-workspaces", action="store_true", help="Give every session its own named workspace.")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/load_http_<timestamp>.json).")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        with local_server(args.port) as url:
+            args.url = url
+            result = asyncio.run(run_load(args))
+    else:
+        result = asyncio.run(run_load(args))
+
+    latency = result["latency_ms"]
+    print(f"{result['requests']} requests from {args.sessions} sessions in {result['seconds']} s: "
+          f"{result['requests_per_second']} req/s")
+    print(f"latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"outcomes    {result['outcomes']}")
+
+    report = {
+        "meta": {
+            "op": args.op,
+            "sessions": args.sessions,
+            "requests_per_session": args.requests,
+            "session_workspaces": args.session_workspaces,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": result,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"load_http_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+    return 0 if not result["outcomes"].get("error") else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
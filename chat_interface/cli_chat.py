@@ -1,21 +1,56 @@
 import os
 import sys
 import asyncio
+import time
+from contextlib import ExitStack
 from datetime import datetime
-from agent.base_agent import build_agent as build_base_agent
-from agent.question_filtering_agent import build_filter_agent
-from pydantic_ai.agent import AgentRunResult
+from functools import lru_cache
 import argparse
 
+STARTED = time.perf_counter()
+
+# Agents, model clients and pydantic_ai are imported and built on first use, so
+# importing this module (e.g. for BASE_DIR) stays cheap and needs no API keys.
 BASE_DIR = os.path.abspath("./workspace")
-os.makedirs(BASE_DIR, exist_ok=True)
 
-agent = build_base_agent(BASE_DIR)
-filter_agent = build_filter_agent()
+@lru_cache(maxsize=None)
+def get_agents():
+    """Create the workspace and build (file agent, filter agent, filter gate, file agent profile) once."""
+    from agent.base_agent import agent_profile, build_agent as build_base_agent
+    from agent.question_filtering_agent import build_filter_agent
+    from agent.fast_filter import FilterGate
+
+    os.makedirs(BASE_DIR, exist_ok=True)
+    filter_agent = build_filter_agent()
+    return build_base_agent(BASE_DIR), filter_agent, FilterGate(filter_agent), agent_profile()
+
+async def interactive_chat(
+    scripted: bool = False,
+    save_transcript: bool = False,
+    script_file: str = None,
+    cache_responses: bool = True,
+    stream: bool = True,
+    stream_text: bool = True,
+    speculative: bool = True,
+):
+    """
+    CLI with filtering logic, conversational memory, and structured output.
 
-async def interactive_chat(scripted: bool = False, save_transcript: bool = False, script_file: str = None):
-    """CLI with filtering logic, conversational memory, and structured output."""
-    current_message_history = []
+    With stream, tool calls are shown as they happen and, with stream_text, the
+    reply is printed as it arrives. The transcript records each reply's time to first byte.
+    """
+    from agent.fast_path import FastPath, FastPathResult
+    from agent.history import HistoryManager
+    from agent.pipeline import run_guarded
+    from agent.response_cache import CachedResult, ResponseCache
+    from agent.streaming import FirstByteTimer, describe
+    from pydantic_ai.agent import AgentRunResult
+
+    agent, _, filter_gate, profile = get_agents()
+    fast_path = FastPath()
+    response_cache = ResponseCache() if cache_responses else None
+    session_started = time.time()
+    history = HistoryManager()
     transcript = []
     prompt_iter = None
     if scripted and script_file:
@@ -35,20 +70,43 @@ async def interactive_chat(scripted: bool = False, save_transcript: bool = False
             if user_input.lower() in {"exit", "quit"}:
                 break
 
-        filter_result = await filter_agent.run(user_input)
-        decision = (filter_result.output or "").strip().lower().replace("`", "")
-        if decision not in {"accept", "reject"}:
-            # If the filter returns an unexpected decision, default to accept
-            pass
-        if decision == "reject":
-            print("🛑 I am designed to assist with file-related tasks only.")
-            continue
+        timer = FirstByteTimer()
+        streamed = {"text": False, "open_line": False}
 
-        result = await agent.run(
+        async def show_progress(event):
+            if event.kind == "text":
+                if not streamed["open_line"]:
+                    print("Agent: ", end="")
+                timer.mark()
+                streamed.update(text=True, open_line=True)
+                print(event.text, end="", flush=True)
+            elif event.kind == "tool_call":
+                # Text streamed before a tool call ends its line first.
+                if streamed["open_line"]:
+                    print()
+                    streamed["open_line"] = False
+                print(f"  ⚙️ {describe(event)}", flush=True)
+
+        # The filter and the agent run concurrently; unexpected filter replies default to accept
+        guarded = await run_guarded(
+            filter_gate,
+            agent,
             user_input,
-            message_history=current_message_history,
-            deps={"base_directory": BASE_DIR},
+            deps={"base_directory": BASE_DIR, "session_started": session_started},
+            message_history=history.messages,
+            fast_path=fast_path,
+            response_cache=response_cache,
+            on_event=show_progress if stream else None,
+            stream_text=stream_text,
+            speculative=speculative,
+            profile=profile,
         )
+        if guarded.decision == "reject":
+            print("🛑 I am designed to assist with file-related tasks only.")
+            continue
+        result = guarded.result
+        for failure in (r for r in guarded.mutation_results if not r["ok"]):
+            print(f"⚠️ {failure['result']}")
 
         output_text = ""
         if hasattr(result, "__aiter__"):
@@ -56,8 +114,13 @@ async def interactive_chat(scripted: bool = False, save_transcript: bool = False
                 if hasattr(event, "output") and event.output:
                     print(f"Agent: {event.output}")
                     output_text += event.output
-        elif isinstance(result, AgentRunResult):
-            if result.output:
+        elif isinstance(result, (AgentRunResult, FastPathResult, CachedResult)):
+            if result.output and streamed["text"]:
+                if streamed["open_line"]:
+                    print()
+                output_text = result.output
+            elif result.output:
+                timer.mark()
                 print(f"Agent: {result.output}")
                 output_text = result.output
             else:
@@ -65,12 +128,25 @@ async def interactive_chat(scripted: bool = False, save_transcript: bool = False
         else:
             print("⚠️ Agent returned unexpected result type.")
 
-        if isinstance(result, AgentRunResult):
-            current_message_history.extend(result.new_messages())
+        if isinstance(result, (AgentRunResult, FastPathResult, CachedResult)):
+            history.extend(result.new_messages())
         else:
             print("⚠️ Could not update history properly due to unexpected result type from agent.run().")
 
-        transcript.append(f"You: {user_input}\nAgent: {output_text}\n")
+        transcript.append(f"You: {user_input}\nAgent: {output_text}\n{timer.summary()}\n")
+
+    stats = filter_gate.stats()
+    if stats["skipped_upstream_calls"]:
+        print(f"\n⚡ Filter model calls skipped: {stats['skipped_upstream_calls']} "
+              f"(local rules: {stats['local_accepts'] + stats['local_rejects']}, cache: {stats['cache_hits']})")
+    stats = fast_path.stats()
+    if stats["served"]:
+        print(f"⚡ Served without the models: {stats['served']} of {stats['requests']} requests "
+              f"({stats['fraction_served']:.0%}, mean {stats['mean_latency_ms']:.1f} ms)")
+    stats = response_cache.stats() if response_cache is not None else {"hits": 0}
+    if stats["hits"]:
+        print(f"⚡ Answered from the response cache: {stats['hits']} of {stats['requests']} requests "
+              f"(mean {stats['mean_hit_latency_ms']:.1f} ms)")
 
     if save_transcript and transcript:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -92,6 +168,45 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="CLI chat interface for the file agent.")
     parser.add_argument("--script", type=str, help="Path to a file containing scripted prompts (one per line). If provided, runs in scripted mode.")
     parser.add_argument("--save-transcript", action="store_true", help="Save the conversation transcript to a file.")
+    parser.add_argument("--no-stream", action="store_true", help="Wait for each complete reply instead of showing tool calls and text as they arrive.")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", metavar="CASSETTE", help="Record every filter and file agent model exchange to this cassette file.")
+    cassette_group.add_argument("--replay", metavar="CASSETTE", help="Serve model responses from a recorded cassette instead of calling OpenAI and Groq.")
     args = parser.parse_args()
 
-    asyncio.run(interactive_chat(scripted=bool(args.script), save_transcript=args.save_transcript, script_file=args.script))
\ No newline at end of file
+    agent, filter_agent, _, _ = get_agents()
+    with ExitStack() as stack:
+        cassette = None
+        if args.record:
+            from agent.cassette import Cassette
+            cassette = Cassette(args.record)
+            stack.enter_context(agent.override(model=cassette.recording_model("file", agent.model)))
+            stack.enter_context(filter_agent.override(model=cassette.recording_model("filter", filter_agent.model)))
+        elif args.replay:
+            from agent.cassette import Cassette
+            from agent.traced_model import TracedModel
+            cassette = Cassette.load(args.replay)
+            stack.enter_context(agent.override(model=TracedModel(cassette.replay_model("file"))))
+            stack.enter_context(filter_agent.override(model=TracedModel(cassette.replay_model("filter"))))
+
+        startup = time.perf_counter() - STARTED
+        started = time.perf_counter()
+        try:
+            # Cached answers would leave gaps in a recording, or skip exchanges on replay.
+            asyncio.run(interactive_chat(
+                scripted=bool(args.script),
+                save_transcript=args.save_transcript,
+                script_file=args.script,
+                cache_responses=cassette is None,
+                stream=not args.no_stream,
+                # Replayed responses are served whole, not as a stream.
+                stream_text=not args.replay,
+                # A speculative run cancelled on reject leaves no recorded exchange to replay.
+                speculative=cassette is None,
+            ))
+        finally:
+            if args.record:
+                cassette.save()
+                print(f"📼 Recorded model exchanges to {args.record}")
+        if cassette is not None:
+            print(f"⏱️ Startup: {startup:.3f}s, session wall time: {time.perf_counter() - started:.3f}s")
\ No newline at end of file
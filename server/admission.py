@@ -0,0 +1,60 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+DEFAULT_MAX_ACTIVE = 8
+DEFAULT_MAX_WAITING = 32
+
+class ServerBusy(Exception):
+    """Raised when a request arrives while both the active slots and the wait queue are full."""
+
+class AdmissionControl:
+    """
+    Bound how many chat requests run at once and how many may wait for a slot.
+
+    Requests beyond max_active queue in arrival order; once max_waiting are
+    queued, further requests are rejected immediately with ServerBusy instead
+    of piling up behind slow model calls, so clients can back off and retry.
+    """
+
+    def __init__(self, max_active: int = None, max_waiting: int = None):
+        self.max_active = max_active or int(os.environ.get("FILE_AGENT_MAX_CONCURRENT_CHATS", DEFAULT_MAX_ACTIVE))
+        self.max_waiting = max_waiting if max_waiting is not None else int(
+            os.environ.get("FILE_AGENT_MAX_QUEUED_CHATS", DEFAULT_MAX_WAITING)
+        )
+        self._slots = asyncio.Semaphore(self.max_active)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.peak_waiting = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._slots.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise ServerBusy(f"Server busy: {self.active} requests running and {self.waiting} queued; retry shortly.")
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_active": self.max_active,
+            "max_waiting": self.max_waiting,
+            "active": self.active,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
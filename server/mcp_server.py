@@ -1,25 +1,56 @@
 #!/usr/bin/env python3
 """
 Minimal MCP Server for File Management Agent
-Exposes conversational interface and recommended MCP methods
+Exposes conversational interface and recommended MCP methods over stdio or HTTP
 """
 
+import time
+
+STARTED = time.perf_counter()
+
 import asyncio
+import json
 import logging
+import mimetypes
 import os
+import re
+import shutil
 import sys
+import uuid
+import weakref
+from contextlib import AsyncExitStack, asynccontextmanager
 from pathlib import Path
 from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
 
 # Add the project root to the system path to allow for module imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from mcp.server import Server
+from mcp.server import NotificationOptions, Server
 from mcp.server.stdio import stdio_server
-from mcp.types import Tool, TextContent
+from mcp.server.lowlevel.helper_types import ReadResourceContents
+from mcp.types import Resource, Tool, TextContent
+from pydantic_ai.exceptions import ModelHTTPError
 
-from agent.base_agent import build_agent
+from agent.base_agent import agent_profile, build_agent
 from agent.question_filtering_agent import build_filter_agent
+from agent.fast_filter import FilterGate
+from agent.fast_path import FastPath
+from agent.pipeline import run_guarded
+from agent.response_cache import ResponseCache
+from agent.streaming import describe
+from agent.history import HistoryManager
+from agent.model_gateway import gateway_stats
+from server.admission import AdmissionControl, ServerBusy
+from tools.async_file_tools import path_locks, run_blocking
+from tools.compressed_storage import compression_stats, logical_size, open_logical, workspace_has_compressed_files
+from tools.content_cache import content_cache
+from tools.durable_io import durability_stats
+from tools.text_extraction import extraction_cache
+from tools.ranged_read import READ_PAGE_BYTES, read_range
+from tools.tracing import metrics, trace
+from tools.workspace import iter_workspace_files, note_change, state_dir, workspace_rel_path
+from tools.workspace_watcher import WorkspaceWatcher
 
 # Configure logging to output to stderr to keep stdout clean for MCP protocol
 logging.basicConfig(
@@ -29,17 +60,62 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+METRICS_RESOURCES = {
+    "metrics://latency": ("Latency histograms and token/byte counters (Prometheus text format)", "text/plain"),
+    "metrics://latency.json": ("Latency summary per span with approximate percentiles", "application/json"),
+}
+# A file resource read returns at most this many bytes, starting at ?offset=
+# (override with ?limit=), as a sequence of content chunks of READ_PAGE_BYTES.
+RESOURCE_READ_BYTES = 4 * 1024 * 1024
+BINARY_SNIFF_BYTES = 8192
+# HTTP clients pick a named workspace (kept under the server's state directory)
+# with this header; sessions without it get a private workspace of their own,
+# or share the server workspace when the server runs with --shared-workspace.
+WORKSPACE_HEADER = "x-file-agent-workspace"
+WORKSPACE_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+
+class FileAgentServer(Server):
+    """Server whose initialization options always advertise resource subscriptions,
+    including for the sessions the HTTP session manager starts on its own"""
+
+    def create_initialization_options(self, notification_options=None, experimental_capabilities=None):
+        options = super().create_initialization_options(
+            notification_options or NotificationOptions(resources_changed=True), experimental_capabilities
+        )
+        options.capabilities.resources.subscribe = True
+        return options
+
 class FileAgentMCPServer:
     """MCP Server exposing conversational access and recommended methods"""
     
-    def __init__(self, base_directory: str = "./workspace"):
+    def __init__(self, base_directory: str = "./workspace", shared_workspace: bool = None):
         self.base_directory = Path(base_directory).resolve()
         self.base_directory.mkdir(exist_ok=True)
+        self.shared_workspace = (
+            shared_workspace if shared_workspace is not None else os.environ.get("FILE_AGENT_SHARED_WORKSPACE", "0") == "1"
+        )
         
         self.file_agent = build_agent(str(self.base_directory))
+        self.agent_profile = agent_profile()
         self.filter_agent = build_filter_agent()
+        self.filter_gate = FilterGate(self.filter_agent)
+        self.fast_path = FastPath()
+        self.response_cache = ResponseCache()
+        # One conversation history per client session, dropped with the session
+        self.histories = weakref.WeakKeyDictionary()
+        self.session_workspaces = weakref.WeakKeyDictionary()
+        self.session_started = weakref.WeakKeyDictionary()
+        self.admission = AdmissionControl()
+        # Resource URI -> client sessions subscribed to its changes
+        self.subscriptions = {}
+        # Workspace -> its watcher, while watch_workspace() runs
+        self.watchers = None
+        self._watch_stack = None
+        self.metrics_file = os.environ.get("FILE_AGENT_METRICS_FILE") or os.path.join(
+            state_dir(str(self.base_directory)), "metrics.prom"
+        )
         
-        self.server = Server("file-agent")
+        self.server = FileAgentServer("file-agent")
         self._setup_handlers()
     
     def _setup_handlers(self):
@@ -61,6 +137,11 @@ class FileAgentMCPServer:
                         },
                         "required": ["message"]
                     }
+                ),
+                Tool(
+                    name="get_server_stats",
+                    description="Return server counters such as file content cache hits, misses and evictions, skipped filter model calls, requests served without the models, and appends/fsyncs per second.",
+                    inputSchema={"type": "object", "properties": {}}
                 )
             ]
 
@@ -68,6 +149,9 @@ class FileAgentMCPServer:
         async def call_tool(name: str, arguments: Optional[Dict[str, Any]]) -> List[TextContent]:
             logger.info(f"Tool called: {name}, arguments: {arguments}")
             
+            if name == "get_server_stats":
+                return [TextContent(type="text", text=json.dumps(self.get_stats(), indent=2))]
+
             if name != "chat_with_file_agent":
                 return [TextContent(type="text", text=f"Unknown tool: {name}")]
             
@@ -75,44 +159,377 @@ class FileAgentMCPServer:
             if not message:
                 return [TextContent(type="text", text="Please provide a message")]
             
+            request_trace = None
             try:
-                filter_result = await self.filter_agent.run(message)
-                if (filter_result.output or "").strip().lower() == "reject":
-                    return [TextContent(type="text", text="I only assist with file-related tasks.")]
-                
-                result = await self.file_agent.run(message, deps={"base_directory": str(self.base_directory)})
-                output = getattr(result, "output", str(result))
+                async with self.admission.slot():
+                    with trace("chat_with_file_agent") as request_trace:
+                        output = await self._chat(message)
                 return [TextContent(type="text", text=output)]
-            
+
+            except ServerBusy as e:
+                logger.warning(str(e))
+                return [TextContent(type="text", text=str(e))]
+            except ModelHTTPError as e:
+                logger.error(f"Model call failed: {e}")
+                if e.status_code == 429:
+                    return [TextContent(type="text", text="Server busy: the model provider is rate limiting requests; retry shortly.")]
+                return [TextContent(type="text", text=f"Error: {str(e)}")]
             except Exception as e:
                 logger.error(f"Error processing request: {e}", exc_info=True)
                 return [TextContent(type="text", text=f"Error: {str(e)}")]
+            finally:
+                if request_trace is not None:
+                    self._export_trace(request_trace)
 
         @self.server.list_resources()
-        async def list_resources() -> List[Any]:
-            """Expose workspace files as resources"""
+        async def list_resources() -> List[Resource]:
+            """Expose workspace files and server metrics as resources"""
+            resources = [
+                Resource(uri=uri, name=uri.split("://", 1)[1], description=description, mimeType=mime_type)
+                for uri, (description, mime_type) in METRICS_RESOURCES.items()
+            ]
             try:
-                files = os.listdir(self.base_directory)
-                return [
-                    {"name": f, "description": f"File in workspace: {f}"}
-                    for f in files
+                workspace = self._session_workspace()
+                files = await run_blocking(lambda: self._workspace_files(str(workspace)))
+                return resources + [
+                    Resource(
+                        uri=self._file_uri(rel_path, workspace),
+                        name=rel_path,
+                        description=f"File in workspace: {rel_path}",
+                        mimeType=mimetypes.guess_type(rel_path)[0] or "text/plain",
+                        size=size,
+                    )
+                    for rel_path, size in sorted(files)
                 ]
             except Exception as e:
                 logger.error(f"Error listing resources: {e}", exc_info=True)
-                return []
+                return resources
+
+        @self.server.read_resource()
+        async def read_resource(uri) -> List[ReadResourceContents]:
+            """Serve the metrics resources and workspace files, without involving the agent"""
+            uri = str(uri)
+            if uri == "metrics://latency":
+                return [ReadResourceContents(content=metrics.render_prometheus(), mime_type="text/plain")]
+            if uri == "metrics://latency.json":
+                return [ReadResourceContents(content=json.dumps(metrics.snapshot(), indent=2), mime_type="application/json")]
+            if uri.startswith("file://"):
+                path, offset, limit = self._parse_file_uri(uri)
+                async with path_locks.reading(path):
+                    return await run_blocking(self._read_file_chunks, path, offset, limit)
+            raise ValueError(f"Unknown resource: {uri}")
+
+        @self.server.subscribe_resource()
+        async def subscribe_resource(uri) -> None:
+            """Notify the calling session whenever the resource changes"""
+            key = self._subscription_key(str(uri))
+            self.subscriptions.setdefault(key, weakref.WeakSet()).add(self.server.request_context.session)
+            await self._watch(self._session_workspace())
+
+        @self.server.unsubscribe_resource()
+        async def unsubscribe_resource(uri) -> None:
+            key = self._subscription_key(str(uri))
+            sessions = self.subscriptions.get(key)
+            if sessions is not None:
+                sessions.discard(self.server.request_context.session)
+                if not sessions:
+                    del self.subscriptions[key]
+
+    async def _chat(self, message: str) -> str:
+        """Filter and answer one chat message within the caller's session history and workspace"""
+        history = self._session_history()
+        guarded = await run_guarded(
+            self.filter_gate,
+            self.file_agent,
+            message,
+            deps={
+                "base_directory": str(self._session_workspace()),
+                "session_started": self.session_started.setdefault(self.server.request_context.session, time.time()),
+            },
+            message_history=history.messages,
+            fast_path=self.fast_path,
+            response_cache=self.response_cache,
+            on_event=self._progress_reporter(),
+            profile=self.agent_profile,
+        )
+        if guarded.decision == "reject":
+            return "I only assist with file-related tasks."
+
+        result = guarded.result
+        history.extend(result.new_messages())
+        output = getattr(result, "output", str(result))
+        failures = [r["result"] for r in guarded.mutation_results if not r["ok"]]
+        if failures:
+            output += "\n\n" + "\n".join(failures)
+        return output
+
+    def _progress_reporter(self):
+        """An event handler sending the caller a progress notification per model turn and tool call, if it asked for progress"""
+        context = self.server.request_context
+        token = context.meta.progressToken if context.meta is not None else None
+        if token is None:
+            return None
+        steps = 0
+
+        async def report(event) -> None:
+            nonlocal steps
+            if event.kind not in {"model_turn", "tool_call"}:
+                return
+            steps += 1
+            try:
+                await context.session.send_progress_notification(
+                    token, steps, message=describe(event), related_request_id=str(context.request_id),
+                )
+            except Exception as e:
+                logger.debug(f"Could not send progress notification: {e}")
+
+        return report
+
+    def _export_trace(self, request_trace) -> None:
+        """Log a finished request's spans and refresh the Prometheus text file"""
+        logger.info(f"Trace: {json.dumps(request_trace.to_dict(), default=str)}")
+        try:
+            metrics.write_prometheus(self.metrics_file)
+        except OSError as e:
+            logger.warning(f"Could not write metrics file {self.metrics_file}: {e}")
+
+    def _file_uri(self, rel_path: str, workspace: Path = None) -> str:
+        return ((workspace or self.base_directory) / rel_path).as_uri()
+
+    def _workspace_path(self, uri: str) -> str:
+        """The path a file:// URI names, if it is a file of the calling session's workspace that a workspace walk would see"""
+        path = os.path.realpath(unquote(urlsplit(uri).path))
+        # Rejects other sessions' workspaces and the agent state directory, which live in hidden directories.
+        if workspace_rel_path(str(self._session_workspace()), path) is None:
+            raise ValueError(f"Resource is outside the workspace: {uri}")
+        return path
+
+    def _parse_file_uri(self, uri: str):
+        """Return (path, offset, limit) for a file:// resource URI inside the workspace"""
+        parts = urlsplit(uri)
+        path = self._workspace_path(uri)
+        if not os.path.isfile(path):
+            raise ValueError(f"File not found: {uri}")
+        query = parse_qs(parts.query)
+        try:
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", [str(RESOURCE_READ_BYTES)])[0])
+        except ValueError:
+            raise ValueError(f"Invalid offset or limit in {uri}")
+        if offset < 0 or limit <= 0:
+            raise ValueError(f"Invalid offset or limit in {uri}")
+        return path, offset, min(limit, RESOURCE_READ_BYTES)
+
+    @staticmethod
+    def _workspace_files(base_directory: str) -> List[tuple]:
+        """(relative path, content size) of every workspace file"""
+        if not workspace_has_compressed_files(base_directory):
+            return [(rel_path, stat.st_size) for rel_path, stat in iter_workspace_files(base_directory)]
+        return [
+            (rel_path, logical_size(os.path.join(base_directory, rel_path), stat))
+            for rel_path, stat in iter_workspace_files(base_directory)
+        ]
+
+    @staticmethod
+    def _read_file_chunks(path: str, offset: int, limit: int) -> List[ReadResourceContents]:
+        """Read bytes [offset, offset + limit) of a file as chunks: text on UTF-8 boundaries, raw bytes for binary files"""
+        mime_type = mimetypes.guess_type(path)[0]
+        with open_logical(path) as f:
+            binary = b"\0" in f.read(BINARY_SNIFF_BYTES)
+            chunks = []
+            end = offset + limit
+            if binary:
+                f.seek(offset)
+                while offset < end:
+                    data = f.read(min(READ_PAGE_BYTES, end - offset))
+                    if not data:
+                        break
+                    chunks.append(ReadResourceContents(content=data, mime_type=mime_type or "application/octet-stream"))
+                    offset += len(data)
+                return chunks
+        while offset < end:
+            page = read_range(path, offset=offset, limit=min(READ_PAGE_BYTES, end - offset))
+            if page["end"] <= offset:
+                break
+            chunks.append(ReadResourceContents(content=page["text"], mime_type=mime_type or "text/plain"))
+            offset = page["end"]
+        return chunks or [ReadResourceContents(content="", mime_type=mime_type or "text/plain")]
+
+    def _subscription_key(self, uri: str) -> str:
+        """Subscriptions ignore the range query of a file URI, and only name files of the caller's workspace"""
+        uri = uri.split("?", 1)[0]
+        if uri.startswith("file://"):
+            return Path(self._workspace_path(uri)).as_uri()
+        return uri
+
+    async def _on_workspace_change(self, workspace: Path, changes: Dict[str, str]) -> None:
+        """Push resource-updated (and list-changed) notifications to subscribed sessions"""
+        notified = set()
+        for rel_path in changes:
+            # The search indexes re-check these files now instead of at their next rescan.
+            note_change(str(workspace), str(workspace / rel_path))
+            uri = self._file_uri(rel_path, workspace)
+            for session in list(self.subscriptions.get(uri, ())):
+                await self._notify(session.send_resource_updated, uri)
+        if any(change != "modified" for change in changes.values()):
+            for sessions in list(self.subscriptions.values()):
+                for session in list(sessions):
+                    if id(session) not in notified and self.session_workspaces.get(session) == workspace:
+                        notified.add(id(session))
+                        await self._notify(session.send_resource_list_changed)
+
+    async def _notify(self, send, *args) -> None:
+        try:
+            await send(*args)
+        except Exception as e:
+            logger.warning(f"Could not send resource notification: {e}")
+
+    @asynccontextmanager
+    async def watch_workspace(self):
+        """Run the workspace watchers that drive resource subscriptions: the server workspace's, and one per session workspace with subscribers"""
+        async with AsyncExitStack() as stack:
+            self.watchers, self._watch_stack = {}, stack
+            try:
+                yield await self._watch(self.base_directory)
+            finally:
+                self.watchers, self._watch_stack = None, None
+
+    async def _watch(self, workspace: Path):
+        """Start watching a workspace, unless it is watched already or no watchers run"""
+        if self.watchers is None:
+            return None
+        watcher = self.watchers.get(workspace)
+        if watcher is None:
+            watcher = WorkspaceWatcher(str(workspace), lambda changes: self._on_workspace_change(workspace, changes))
+            self.watchers[workspace] = await self._watch_stack.enter_async_context(watcher)
+        return watcher
+
+    def _session_history(self) -> HistoryManager:
+        """Return the conversation history of the client session making the current request"""
+        session = self.server.request_context.session
+        history = self.histories.get(session)
+        if history is None:
+            history = self.histories[session] = HistoryManager()
+        return history
+
+    def _session_workspace(self) -> Path:
+        """
+        Return the workspace of the current session, chosen by its first HTTP request: the named
+        workspace of its header, else a private one (or, with --shared-workspace, the server
+        workspace). The stdio client works in the server workspace.
+        """
+        context = self.server.request_context
+        workspace = self.session_workspaces.get(context.session)
+        if workspace is None:
+            name = context.request.headers.get(WORKSPACE_HEADER) if context.request is not None else None
+            if name:
+                workspace = self._named_workspace(name)
+            elif context.request is None or self.shared_workspace:
+                workspace = self.base_directory
+            else:
+                workspace = self._private_workspace(context.session)
+            self.session_workspaces[context.session] = workspace
+        return workspace
+
+    def _private_workspace(self, session) -> Path:
+        """A workspace no other session can name, removed with the session"""
+        workspace = Path(state_dir(str(self.base_directory))) / "sessions" / uuid.uuid4().hex
+        workspace.mkdir(parents=True)
+        weakref.finalize(session, shutil.rmtree, str(workspace), True)
+        return workspace
+
+    def _named_workspace(self, name: str) -> Path:
+        if not WORKSPACE_NAME.fullmatch(name):
+            raise ValueError(f"Invalid workspace name: {name!r}")
+        # Kept under the hidden state directory, so the shared workspace's listings,
+        # indexes, resources and journal never see another session's files.
+        workspace = Path(state_dir(str(self.base_directory))) / "workspaces" / name
+        workspace.mkdir(parents=True, exist_ok=True)
+        return workspace
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Collect the server's runtime counters"""
+        return {
+            "content_cache": content_cache.stats(),
+            "filter": self.filter_gate.stats(),
+            "fast_path": self.fast_path.stats(),
+            "response_cache": self.response_cache.stats(),
+            "durability": durability_stats.snapshot(),
+            "compression": compression_stats.snapshot(),
+            "extraction": extraction_cache.stats(),
+            "histories": [history.stats() for history in self.histories.values()],
+            "admission": self.admission.stats(),
+            "model_gateway": gateway_stats(),
+        }
+
+    def _log_ready(self) -> None:
+        startup = time.perf_counter() - STARTED
+        metrics.observe("startup", "mcp_server", startup)
+        logger.info(f"Server ready after {startup * 1000:.0f} ms")
 
-        
     async def run(self):
-        """Start the MCP server"""
+        """Start the MCP server on stdio"""
         logger.info(f"Starting File Agent MCP Server (workspace: {self.base_directory})")
         
-        async with stdio_server() as (read_stream, write_stream):
+        async with self.watch_workspace(), stdio_server() as (read_stream, write_stream):
+            self._log_ready()
             await self.server.run(
                 read_stream,
                 write_stream,
-                self.server.create_initialization_options()
+                self.initialization_options()
             )
 
+    def http_app(self):
+        """
+        ASGI app serving many concurrent sessions from this one server:
+        streamable HTTP on /mcp, the older SSE transport on /sse + /messages/,
+        and a /healthz endpoint with the server counters.
+        """
+        from mcp.server.sse import SseServerTransport
+        from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+        from starlette.applications import Starlette
+        from starlette.responses import JSONResponse, Response
+        from starlette.routing import Mount, Route
+
+        session_manager = StreamableHTTPSessionManager(app=self.server)
+        sse = SseServerTransport("/messages/")
+
+        async def handle_sse(request):
+            async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+                await self.server.run(read_stream, write_stream, self.initialization_options())
+            return Response()
+
+        async def healthz(request):
+            return JSONResponse(self.get_stats())
+
+        @asynccontextmanager
+        async def lifespan(app):
+            async with self.watch_workspace(), session_manager.run():
+                self._log_ready()
+                yield
+
+        return Starlette(
+            routes=[
+                Mount("/mcp", app=session_manager.handle_request),
+                Route("/sse", endpoint=handle_sse),
+                Mount("/messages/", app=sse.handle_post_message),
+                Route("/healthz", endpoint=healthz),
+            ],
+            lifespan=lifespan,
+        )
+
+    async def run_http(self, host: str = "127.0.0.1", port: int = 8000):
+        """Start the MCP server on HTTP"""
+        import uvicorn
+
+        logger.info(f"Starting File Agent MCP Server on http://{host}:{port}/mcp (workspace: {self.base_directory})")
+        config = uvicorn.Config(self.http_app(), host=host, port=port, log_level="warning")
+        await uvicorn.Server(config).serve()
+
+    def initialization_options(self):
+        """Advertise resource subscriptions and list-changed notifications"""
+        return self.server.create_initialization_options()
+
 async def main():
     """Main entry point"""
     import argparse
@@ -123,10 +540,38 @@ async def main():
         default="./workspace",
         help="Workspace directory for file operations (default: ./workspace)"
     )
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "http"],
+        default="stdio",
+        help="Serve one client over stdio, or many concurrent sessions over HTTP (default: stdio)"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="HTTP bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="HTTP port (default: 8000)")
+    parser.add_argument(
+        "--shared-workspace",
+        action="store_true",
+        default=None,
+        help="Let HTTP sessions without a workspace header share the server workspace instead of each getting a private one"
+    )
+    parser.add_argument(
+        "--max-concurrent-chats",
+        type=int,
+        help="Chat requests processed at once; more are queued (default: FILE_AGENT_MAX_CONCURRENT_CHATS or 8)"
+    )
+    parser.add_argument(
+        "--max-queued-chats",
+        type=int,
+        help="Chat requests allowed to wait before new ones are refused as busy (default: FILE_AGENT_MAX_QUEUED_CHATS or 32)"
+    )
     
     args = parser.parse_args()
-    server = FileAgentMCPServer(args.workspace)
-    await server.run()
+    server = FileAgentMCPServer(args.workspace, shared_workspace=args.shared_workspace)
+    server.admission = AdmissionControl(args.max_concurrent_chats, args.max_queued_chats)
+    if args.transport == "http":
+        await server.run_http(args.host, args.port)
+    else:
+        await server.run()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -15,9 +15,25 @@ fi
 # Activate virtual environment
 source venv/bin/activate
 
-# Install/update dependencies
-echo "Installing dependencies..." >&2
-pip install -r requirements.txt >&2 
+# Install/update dependencies only when requirements.txt changed since the last install
+# (sha256sum on Linux, shasum on macOS; without either, install every time)
+if command -v sha256sum >/dev/null 2>&1; then
+    REQUIREMENTS_HASH="$(sha256sum requirements.txt | cut -d' ' -f1)"
+elif command -v shasum >/dev/null 2>&1; then
+    REQUIREMENTS_HASH="$(shasum -a 256 requirements.txt | cut -d' ' -f1)"
+else
+    REQUIREMENTS_HASH=""
+fi
+REQUIREMENTS_STAMP="venv/.requirements.sha256"
+if [ -z "$REQUIREMENTS_HASH" ]; then
+    echo "Installing dependencies..." >&2
+    pip install -r requirements.txt >&2
+elif [ "$(cat "$REQUIREMENTS_STAMP" 2>/dev/null)" != "$REQUIREMENTS_HASH" ]; then
+    echo "Installing dependencies..." >&2
+    pip install -r requirements.txt >&2 && echo "$REQUIREMENTS_HASH" > "$REQUIREMENTS_STAMP"
+else
+    echo "Dependencies up to date." >&2
+fi
 
 # Set environment variables
 export WORKSPACE_DIR="$SCRIPT_DIR/workspace"
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import pytest
+from types import SimpleNamespace
+
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+
+from agent.base_agent import build_agent
+from tools.async_file_tools import AsyncRWLock, batch_file_operations, path_locks, read_file, write_file
+from tools.workspace import STATE_DIR_NAME
+
+@pytest.fixture
+def ctx(temp_workspace):
+    return SimpleNamespace(deps={"base_directory": temp_workspace})
+
+@pytest.mark.asyncio
+async def test_rw_lock_allows_parallel_readers_and_exclusive_writer():
+    lock = AsyncRWLock()
+    events = []
+
+    async def reader(name):
+        async with lock.read():
+            events.append(f"{name}+")
+            await asyncio.sleep(0.02)
+            events.append(f"{name}-")
+
+    async def writer():
+        await asyncio.sleep(0.005)
+        async with lock.write():
+            events.append("w+")
+            await asyncio.sleep(0.01)
+            events.append("w-")
+
+    await asyncio.gather(reader("r1"), reader("r2"), writer())
+    assert events[:2] == ["r1+", "r2+"]
+    assert events[-2:] == ["w+", "w-"]
+
+@pytest.mark.asyncio
+async def test_concurrent_appends_to_one_file_all_land(ctx):
+    await write_file(ctx, "log.txt", "start")
+    await asyncio.gather(*(write_file(ctx, "log.txt", f"line {i}", mode="a") for i in range(20)))
+    content = await read_file(ctx, "log.txt")
+    assert content.startswith("start")
+    assert all(f"line {i}" in content for i in range(20))
+    assert not path_locks._locks
+
+@pytest.mark.asyncio
+async def test_file_agent_runs_async_tools(temp_workspace):
+    def model(messages, info):
+        if len(messages) == 1:
+            return ModelResponse(parts=[ToolCallPart("write_file", {"filename": "a.txt", "content": "hi"})])
+        return ModelResponse(parts=[TextPart("written")])
+
+    agent = build_agent(temp_workspace)
+    with agent.override(model=FunctionModel(model)):
+        result = await agent.run("Create a.txt", deps={"base_directory": temp_workspace})
+    assert result.output == "written"
+    with open(os.path.join(temp_workspace, "a.txt")) as f:
+        assert f.read() == "hi"
+
+@pytest.mark.asyncio
+async def test_batch_file_operations_keeps_per_file_order(ctx):
+    results = await batch_file_operations(ctx, [
+        {"op": "write", "filename": "a.txt", "content": "A"},
+        {"op": "write", "filename": "b.txt", "content": "B"},
+        {"op": "append", "filename": "a.txt", "content": "more"},
+        {"op": "read", "filename": "a.txt"},
+        {"op": "read", "filename": "b.txt"},
+        {"op": "delete", "filename": "b.txt"},
+        {"op": "rename", "filename": "a.txt"},
+        {"op": "read", "filename": ""},
+    ])
+    assert [r["index"] for r in results] == list(range(8))
+    assert results[3]["result"] == "A \nmore"
+    assert results[4]["result"] == "B"
+    assert "deleted successfully" in results[5]["result"]
+    assert "Invalid op" in results[6]["result"]
+    assert "cannot be empty" in results[7]["result"]
+    assert sorted(set(os.listdir(ctx.deps["base_directory"])) - {STATE_DIR_NAME}) == ["a.txt"]
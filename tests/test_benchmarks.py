@@ -0,0 +1,32 @@
+import json
+import os
+
+from benchmarks.bench_file_tools import build_cases, compare, main
+
+def test_compare_flags_only_slowdowns_beyond_threshold():
+    baseline = {"a": {"wall_ms": 10.0}, "b": {"wall_ms": 10.0}, "c": {"wall_ms": 10.0}}
+    results = {"a": {"wall_ms": 11.0}, "b": {"wall_ms": 13.0}, "c": {"wall_ms": 5.0}, "new": {"wall_ms": 1.0}}
+    assert compare(results, baseline, threshold=0.2) == [("b", 10.0, 13.0, 1.3)]
+
+def test_smoke_profile_writes_json(tmp_path):
+    output = tmp_path / "bench.json"
+    assert main(["--profile", "smoke", "--repeats", "1", "--only", "list_files", "--output", str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert report["meta"]["profile"] == "smoke"
+    assert set(report["results"]) == {"list_files/10_files", "list_files_recursive_by_mtime/10_files"}
+    assert all(r["wall_ms"] >= 0 and r["peak_rss_kb"] > 0 for r in report["results"].values())
+
+def test_only_builds_the_workspaces_its_cases_use(tmp_path):
+    cases = build_cases(str(tmp_path), "quick", 1, only="_warm/")
+    assert sorted(os.listdir(tmp_path)) == ["files_10", "files_1000"]
+    assert set(cases) == {f"{tool}_warm/{count}_files" for tool in ("answer_question", "find_related_files") for count in (10, 1000)}
+    # Warm cases build their index in an untimed call first.
+    assert all(case["setup"][0]["tool"] == case["tool"] for case in cases.values())
+
+def test_compressed_run_reports_bytes_on_disk(tmp_path, monkeypatch):
+    monkeypatch.delenv("FILE_AGENT_COMPRESSION", raising=False)
+    output = tmp_path / "bench.json"
+    assert main(["--profile", "smoke", "--repeats", "1", "--only", "read_file", "--compression", "gzip", "--output", str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert report["meta"]["compression"] == "gzip"
+    assert all(0 < r["stored_bytes"] < 1024 and "read_bytes" in r for r in report["results"].values())
@@ -0,0 +1,86 @@
+import pytest
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import FunctionModel
+
+from agent.cassette import Cassette, CassetteMismatchError
+from agent.fast_filter import FilterGate
+from agent.pipeline import run_guarded
+
+def lookup(word: str) -> str:
+    return word.upper()
+
+def live_model(messages, info):
+    """Plays the remote provider during recording."""
+    last = messages[-1].parts[-1]
+    if isinstance(last, ToolReturnPart):
+        return ModelResponse(parts=[TextPart(f"Looked up: {last.content}")])
+    return ModelResponse(parts=[ToolCallPart("lookup", {"word": last.content.split()[-1]})])
+
+def make_agent(model):
+    return Agent(model, tools=[lookup])
+
+@pytest.mark.asyncio
+async def test_recorded_run_replays_offline(tmp_path):
+    path = str(tmp_path / "run.json")
+    cassette = Cassette(path)
+    recorded = await make_agent(cassette.recording_model("file", FunctionModel(live_model))).run("find apple")
+    cassette.save()
+
+    replay = Cassette.load(path)
+    assert len(replay.channels["file"]) == 2
+
+    def unreachable(messages, info):
+        raise AssertionError("the live model must not be called during replay")
+
+    agent = make_agent(FunctionModel(unreachable))
+    with agent.override(model=replay.replay_model("file")):
+        replayed = await agent.run("find apple")
+    assert replayed.output == recorded.output == "Looked up: APPLE"
+
+@pytest.mark.asyncio
+async def test_replay_detects_divergence(tmp_path):
+    path = str(tmp_path / "run.json")
+    cassette = Cassette(path)
+    await make_agent(cassette.recording_model("file", FunctionModel(live_model))).run("find apple")
+    cassette.save()
+
+    agent = make_agent(Cassette.load(path).replay_model("file"))
+    with pytest.raises(CassetteMismatchError):
+        await agent.run("find pear")
+
+def live_filter(messages, info):
+    prompt = messages[-1].parts[-1].content
+    return ModelResponse(parts=[TextPart("reject" if "passwd" in prompt else "accept")])
+
+def live_file_model(messages, info):
+    return ModelResponse(parts=[TextPart(f"Done: {messages[-1].parts[-1].content}")])
+
+SCRIPT = ["Please access /etc/passwd", "Summarize the quarterly numbers", "Please print /etc/passwd now"]
+
+async def _run_script(filter_model, file_model, workspace, speculative):
+    filter_gate = FilterGate(Agent(filter_model))
+    agent = Agent(file_model)
+    outputs = []
+    for message in SCRIPT:
+        run = await run_guarded(filter_gate, agent, message, deps={"base_directory": workspace}, speculative=speculative)
+        outputs.append(run.result.output if run.result is not None else run.decision)
+    return outputs
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("speculative_replay", [False, True])
+async def test_rejected_prompts_replay_in_step(tmp_path, temp_workspace, speculative_replay):
+    path = str(tmp_path / "run.json")
+    cassette = Cassette(path)
+    recorded = await _run_script(cassette.recording_model("filter", FunctionModel(live_filter)),
+                                 cassette.recording_model("file", FunctionModel(live_file_model)),
+                                 temp_workspace, speculative=False)
+    cassette.save()
+    assert recorded == ["reject", "Done: Summarize the quarterly numbers", "reject"]
+
+    replay = Cassette.load(path)
+    assert len(replay.channels["file"]) == 1
+    replayed = await _run_script(replay.replay_model("filter"), replay.replay_model("file"),
+                                 temp_workspace, speculative=speculative_replay)
+    assert replayed == recorded
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import time
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+
+from tools.change_journal import get_change_journal, parse_time_point
+from tools.file_tools import delete_file, list_changes, write_file
+
+@pytest.fixture
+def ctx(temp_workspace, monkeypatch):
+    monkeypatch.setenv("FILE_AGENT_RESCAN_SECONDS", "0")
+    return SimpleNamespace(deps={"base_directory": temp_workspace, "session_started": time.time() - 1})
+
+def _by_name(items):
+    return {item["filename"]: item for item in items if "filename" in item}
+
+def test_tool_writes_and_deletes_are_journaled(ctx):
+    write_file(ctx, "notes.txt", "first")
+    write_file(ctx, "notes.txt", "more", mode="a")
+    write_file(ctx, "scratch.txt", "temporary")
+    delete_file(ctx, "scratch.txt")
+
+    changes = _by_name(list_changes(ctx, "session"))
+    # scratch.txt was created and deleted again, so there is no net change.
+    assert list(changes) == ["notes.txt"]
+    assert changes["notes.txt"]["change"] == "created" and changes["notes.txt"]["changed_by"] == "agent"
+    assert _by_name(list_changes(ctx, "session", changed_by="external")) == {}
+
+def test_external_edits_are_found_by_rescan(ctx, temp_workspace):
+    for name in ("kept.txt", "edited.txt", "removed.txt"):
+        with open(os.path.join(temp_workspace, name), "w") as f:
+            f.write(name)
+    journal = get_change_journal(temp_workspace)
+    tracking_since = journal.tracking_since()
+
+    with open(os.path.join(temp_workspace, "edited.txt"), "a") as f:
+        f.write(" changed")
+    os.remove(os.path.join(temp_workspace, "removed.txt"))
+    with open(os.path.join(temp_workspace, "added.txt"), "w") as f:
+        f.write("new")
+
+    items = list_changes(ctx, "1d")
+    changes = _by_name(items)
+    assert {name: item["change"] for name, item in changes.items()} == {
+        "edited.txt": "modified", "removed.txt": "deleted", "added.txt": "created",
+    }
+    assert {item["changed_by"] for item in changes.values()} == {"external"}
+    # Asked about a time before tracking started, the answer says so.
+    assert "tracking started" in items[-1]["note"]
+    assert datetime.fromisoformat(items[-1]["note"].split("from ")[1].split(",")[0]).timestamp() <= tracking_since + 1
+
+def test_touched_but_unchanged_files_are_not_journaled(ctx, temp_workspace):
+    write_file(ctx, "same.txt", "content")
+    journal = get_change_journal(temp_workspace)
+    path = os.path.join(temp_workspace, "same.txt")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    assert journal.rescan(force=True) == 0
+    assert len(journal.changes_between(0)) == 1
+
+def test_changes_between_two_points_in_time(ctx, temp_workspace):
+    journal = get_change_journal(temp_workspace)
+    write_file(ctx, "a.txt", "a")
+    middle = time.time()
+    time.sleep(0.01)
+    write_file(ctx, "b.txt", "b")
+    assert [c["filename"] for c in journal.changes_between(0, middle)] == ["a.txt"]
+    assert [c["filename"] for c in journal.changes_between(middle)] == ["b.txt"]
+    until = datetime.fromtimestamp(middle + 1).isoformat()
+    assert list(_by_name(list_changes(ctx, "session", until=until))) == ["b.txt", "a.txt"]
+
+def test_journal_is_append_only(ctx, temp_workspace):
+    write_file(ctx, "a.txt", "a")
+    db = sqlite3.connect(get_change_journal(temp_workspace).path)
+    with pytest.raises(sqlite3.DatabaseError, match="append-only"):
+        db.execute("DELETE FROM changes")
+    db.close()
+
+def test_time_points():
+    now = datetime(2024, 5, 2, 15, 30).timestamp()
+    assert parse_time_point("2h", now=now) == now - 7200
+    assert parse_time_point("3d ago", now=now) == now - 3 * 86400
+    assert parse_time_point("yesterday", now=now) == datetime(2024, 5, 1).timestamp()
+    assert parse_time_point("2024-05-01T12:00") == datetime(2024, 5, 1, 12).timestamp()
+    assert parse_time_point("session", session_started=123.0) == 123.0
+    with pytest.raises(ValueError):
+        parse_time_point("last tuesday")
+
+def test_invalid_arguments_are_reported(ctx):
+    assert "error" in list_changes(ctx, "whenever")[0]
+    assert "error" in list_changes(ctx, "1h", changed_by="someone")[0]
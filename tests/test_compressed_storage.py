@@ -0,0 +1,84 @@
+import os
+import pytest
+from types import SimpleNamespace
+
+from server.mcp_server import FileAgentMCPServer
+from tools.compressed_storage import MAGIC, open_compressed
+from tools.file_tools import answer_question_about_files, list_files, read_file, search_files, write_file
+
+LOG = "".join(f"2024-05-01 12:{i % 60:02d}:00 INFO request {i} served in {i % 97} ms\n" for i in range(5000))
+
+@pytest.fixture
+def ctx(temp_workspace, monkeypatch):
+    monkeypatch.setenv("FILE_AGENT_COMPRESSION", "gzip")
+    monkeypatch.setenv("FILE_AGENT_COMPRESSION_FRAME_BYTES", "4096")
+    return SimpleNamespace(deps={"base_directory": temp_workspace})
+
+def _stored(ctx, filename):
+    with open(os.path.join(ctx.deps["base_directory"], filename), "rb") as f:
+        return f.read()
+
+def test_large_files_are_stored_compressed_and_read_back(ctx):
+    assert write_file(ctx, "app.log", LOG) == "Wrote to file 'app.log' successfully."
+    stored = _stored(ctx, "app.log")
+    assert stored.startswith(MAGIC) and len(stored) < len(LOG) // 4
+
+    assert read_file(ctx, "app.log", offset=100_000, limit=50).startswith(LOG.encode()[100_000:100_050].decode())
+    assert read_file(ctx, "app.log", start_line=4000, end_line=4001).startswith(
+        "".join(LOG.splitlines(keepends=True)[3999:4001])
+    )
+    first_page = read_file(ctx, "app.log")
+    assert first_page.startswith(LOG[:1000]) and "next cursor" in first_page
+
+def test_appends_add_frames_to_compressed_files(ctx):
+    write_file(ctx, "app.log", LOG)
+    write_file(ctx, "app.log", "the last line", mode="a")
+    assert _stored(ctx, "app.log").startswith(MAGIC)
+    size = len(LOG) + len(" \nthe last line")
+    assert read_file(ctx, "app.log", offset=size - 20, limit=100).startswith((LOG + " \nthe last line")[-20:])
+
+def test_list_files_reports_logical_and_stored_sizes(ctx):
+    write_file(ctx, "app.log", LOG)
+    write_file(ctx, "note.txt", "short")
+    files = {item["filename"]: item for item in list_files(ctx, sort_by="size")}
+    assert files["app.log"]["size_bytes"] == len(LOG)
+    assert files["app.log"]["stored_bytes"] == len(_stored(ctx, "app.log"))
+    assert files["note.txt"]["size_bytes"] == 5 and "stored_bytes" not in files["note.txt"]
+    assert [item["filename"] for item in list_files(ctx, min_size=len(LOG))] == ["app.log"]
+
+def test_search_and_questions_see_decompressed_content(ctx):
+    write_file(ctx, "app.log", LOG + "ERROR disk quota exceeded\n")
+    matches = search_files(ctx, "quota exceeded")
+    assert [(m["filename"], m["line"]) for m in matches] == [("app.log", 5001)]
+    assert "quota exceeded" in answer_question_about_files(ctx, "disk quota")
+
+def test_compressed_files_have_their_own_search_limit(ctx, monkeypatch):
+    write_file(ctx, "app.log", LOG)
+    monkeypatch.setenv("FILE_AGENT_SEARCH_MAX_COMPRESSED_BYTES", str(len(LOG) - 1))
+    assert search_files(ctx, "request 42 ")[-1]["skipped_files"] == {"app.log": "too large"}
+
+def test_resources_serve_decompressed_ranges(ctx):
+    write_file(ctx, "app.log", LOG)
+    chunks = FileAgentMCPServer._read_file_chunks(os.path.join(ctx.deps["base_directory"], "app.log"), 200_000, 1000)
+    assert "".join(chunk.content for chunk in chunks) == LOG[200_000:201_000]
+
+def test_small_content_is_stored_plain(ctx):
+    write_file(ctx, "note.txt", "short")
+    assert _stored(ctx, "note.txt") == b"short"
+
+def test_find_spans_frame_boundaries(ctx):
+    write_file(ctx, "app.log", LOG)
+    with open(os.path.join(ctx.deps["base_directory"], "app.log"), "rb") as f:
+        compressed = open_compressed(f, f.name)
+        assert len(compressed.index.logical_starts) > 1
+        boundary = compressed.index.logical_starts[1]
+        needle = LOG.encode()[boundary - 3:boundary + 3]
+        assert compressed.find(needle, boundary - 10) == LOG.encode().find(needle, boundary - 10)
+        assert compressed[boundary] == LOG.encode()[boundary]
+
+def test_codecs_and_configuration_errors(ctx, monkeypatch):
+    monkeypatch.setenv("FILE_AGENT_COMPRESSION", "lzma")
+    write_file(ctx, "app.log", LOG)
+    assert read_file(ctx, "app.log", start_line=5000, end_line=5000).startswith(LOG.splitlines()[-1])
+    monkeypatch.setenv("FILE_AGENT_COMPRESSION", "brotli")
+    assert "Unknown compression 'brotli'" in write_file(ctx, "other.log", LOG)
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+import pytest
+
+from tools.durable_io import AppendBatcher, atomic_write, durability_stats
+
+def test_atomic_write_keeps_old_content_when_rename_fails(temp_workspace, monkeypatch):
+    path = os.path.join(temp_workspace, "doc.txt")
+    atomic_write(path, "original")
+
+    def failing_replace(src, dst):
+        raise OSError("simulated crash")
+
+    monkeypatch.setattr(os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        atomic_write(path, "new content")
+    with open(path) as f:
+        assert f.read() == "original"
+    assert os.listdir(temp_workspace) == ["doc.txt"]
+
+def test_atomic_write_preserves_permissions(temp_workspace):
+    path = os.path.join(temp_workspace, "script.sh")
+    atomic_write(path, "echo hi")
+    os.chmod(path, 0o750)
+    atomic_write(path, "echo bye")
+    assert os.stat(path).st_mode & 0o777 == 0o750
+
+def test_concurrent_appends_share_one_fsync(temp_workspace):
+    path = os.path.join(temp_workspace, "events.log")
+    batcher = AppendBatcher(max_delay=0.05)
+    before = durability_stats.snapshot()
+    barrier = threading.Barrier(8)
+
+    def append(i):
+        barrier.wait()
+        batcher.append(path, f"event {i}\n")
+
+    threads = [threading.Thread(target=append, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    after = durability_stats.snapshot()
+    assert after["appends"] - before["appends"] == 8
+    assert after["fsyncs"] - before["fsyncs"] < 8
+    with open(path) as f:
+        assert sorted(f.read().splitlines()) == sorted(f"event {i}" for i in range(8))
+
+def test_lone_append_is_written_without_waiting(temp_workspace):
+    path = os.path.join(temp_workspace, "events.log")
+    batcher = AppendBatcher(max_delay=1.0)
+    started = time.perf_counter()
+    batcher.append(path, "only event\n")
+    assert time.perf_counter() - started < 0.5
+    assert not batcher._paths  # nothing is kept for files no longer appended to
+
+def test_atomic_write_keeps_symlinks_and_hard_links(temp_workspace):
+    target = os.path.join(temp_workspace, "target.txt")
+    link = os.path.join(temp_workspace, "link.txt")
+    atomic_write(target, "old")
+    os.symlink(target, link)
+    atomic_write(link, "through the symlink")
+    assert os.path.islink(link)
+    with open(target) as f:
+        assert f.read() == "through the symlink"
+
+    other = os.path.join(temp_workspace, "other.txt")
+    os.link(target, other)
+    atomic_write(target, "shared")
+    with open(other) as f:
+        assert f.read() == "shared"
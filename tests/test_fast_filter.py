@@ -0,0 +1,55 @@
+import pytest
+from types import SimpleNamespace
+
+from agent.fast_filter import FilterGate, classify_locally, normalize_message
+
+class FakeFilterAgent:
+    """Stands in for the filter model and counts how often it is asked."""
+
+    def __init__(self, output="accept"):
+        self.output = output
+        self.calls = 0
+
+    async def run(self, message):
+        self.calls += 1
+        return SimpleNamespace(output=self.output)
+
+@pytest.mark.parametrize("message", [
+    "List all files in the workspace",
+    "Read the content of notes.txt",
+    "Delete the file project.txt",
+    "Append Reviewed by Alice to project.txt",
+])
+def test_obvious_file_requests_are_accepted_locally(message):
+    assert classify_locally(normalize_message(message)) == "accept"
+
+@pytest.mark.parametrize("message", ["What is the meaning of life?", "Tell me a joke"])
+def test_obvious_off_topic_requests_are_rejected_locally(message):
+    assert classify_locally(normalize_message(message)) == "reject"
+
+def test_ambiguous_requests_are_left_to_the_model():
+    assert classify_locally(normalize_message("Based on what I wrote, what is the answer?")) is None
+
+@pytest.mark.asyncio
+async def test_gate_skips_model_for_local_and_cached_decisions():
+    agent = FakeFilterAgent(output="`Reject`")
+    gate = FilterGate(agent)
+    assert await gate.decide("List files") == "accept"
+    assert await gate.decide("Hmm, what now?") == "reject"
+    assert await gate.decide("  hmm, WHAT now ") == "reject"
+    assert agent.calls == 1
+    assert gate.stats() == {
+        "local_accepts": 1,
+        "local_rejects": 0,
+        "cache_hits": 1,
+        "upstream_calls": 1,
+        "skipped_upstream_calls": 2,
+    }
+
+@pytest.mark.asyncio
+async def test_gate_cache_is_bounded():
+    agent = FakeFilterAgent()
+    gate = FilterGate(agent, cache_size=2)
+    for message in ("one?", "two?", "three?", "one?"):
+        await gate.decide(message)
+    assert agent.calls == 4
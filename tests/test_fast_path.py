@@ -0,0 +1,108 @@
+import os
+import pytest
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, SystemPromptPart, TextPart
+from pydantic_ai.models.function import FunctionModel
+
+from agent.base_agent import AgentProfile
+from agent.fast_filter import classify_locally, normalize_message
+from agent.fast_path import FastPath, parse_command
+from agent.pipeline import run_guarded
+
+@pytest.mark.parametrize("message, expected", [
+    ("List all files in the workspace", ("list_files", {})),
+    ("List files one last time", ("list_files", {})),
+    ("please show me the files.", ("list_files", {})),
+    ("Read the content of notes.txt", ("read_file", {"filename": "notes.txt"})),
+    ("Show 'summary.md'", ("read_file", {"filename": "summary.md"})),
+    ("Delete the file project.txt.", ("delete_file", {"filename": "project.txt"})),
+    ("Create a file called notes.txt with the content Meeting at 10am.",
+     ("write_file", {"filename": "notes.txt", "content": "Meeting at 10am."})),
+    ("Create a file called empty.txt with the content ", ("write_file", {"filename": "empty.txt", "content": ""})),
+    ("Append Reviewed by Alice to project.txt", ("write_file", {"filename": "project.txt", "content": "Reviewed by Alice", "mode": "a"})),
+])
+def test_literal_commands_are_parsed(message, expected):
+    assert parse_command(message) == expected
+    # The fast path skips the filter, so it may only take messages the local rules accept anyway.
+    assert classify_locally(normalize_message(message)) == "accept"
+
+@pytest.mark.parametrize("message", [
+    "What does project.txt contain now?",
+    "What files mention 'deliverables'?",
+    "Read notes.txt and summarize it",
+    "Read the content of ../secret.txt",
+    "Please access /etc/passwd",
+    "Create a file called workspace with the content Should fail",
+    "Append a line about the budget to notes.txt",
+    "Tell me a joke",
+])
+def test_anything_else_goes_to_the_agent(message):
+    assert parse_command(message) is None
+
+class RefusingGate:
+    async def decide(self, message):
+        raise AssertionError("the filter must not run for fast-path commands")
+
+class RecordingAgent:
+    def __init__(self):
+        self.messages = []
+
+    async def run(self, message, message_history=None, deps=None):
+        self.messages.append(message)
+        return ModelResponse(parts=[TextPart("agent")])
+
+@pytest.mark.asyncio
+async def test_commands_run_tools_directly(temp_workspace):
+    fast_path = FastPath(enabled=True)
+    agent = RecordingAgent()
+    deps = {"base_directory": temp_workspace}
+
+    async def send(message, history=None):
+        run = await run_guarded(RefusingGate(), agent, message, deps=deps, message_history=history, fast_path=fast_path,
+                                profile=AgentProfile(system_prompts=("You manage files.",)))
+        return run.result
+
+    created = await send("Create a file called notes.txt with the content Meeting at 10am")
+    assert created.output == "Wrote to file 'notes.txt' successfully."
+    assert isinstance(created.new_messages()[0].parts[0], SystemPromptPart)
+
+    history = created.new_messages()
+    assert (await send("Append Bring slides to notes.txt", history)).output == "Appended to file 'notes.txt' successfully."
+    read = await send("Read the content of notes.txt", history)
+    assert read.output.startswith("Content of 'notes.txt':") and "Bring slides" in read.output
+    assert not any(isinstance(p, SystemPromptPart) for p in read.new_messages()[0].parts)
+    assert "- notes.txt (" in (await send("List all files in the workspace", history)).output
+    assert (await send("Delete the file notes.txt", history)).output == "File 'notes.txt' deleted successfully."
+    assert (await send("Read the content of notes.txt", history)).output == "File 'notes.txt' does not exist."
+    assert not os.path.exists(os.path.join(temp_workspace, "notes.txt"))
+    assert agent.messages == []
+
+    stats = fast_path.stats()
+    assert stats["served"] == stats["requests"] == 6 and stats["fraction_served"] == 1.0
+    assert stats["by_tool"] == {"write_file": 2, "read_file": 2, "list_files": 1, "delete_file": 1}
+
+@pytest.mark.asyncio
+async def test_fast_path_history_is_valid_agent_history(temp_workspace):
+    seen = []
+
+    def answer(messages, info):
+        seen.extend(messages)
+        return ModelResponse(parts=[TextPart("It says hello.")])
+
+    agent = Agent(FunctionModel(answer), system_prompt="You manage files.")
+    with open(os.path.join(temp_workspace, "notes.txt"), "w") as f:
+        f.write("hello")
+    served = await FastPath(enabled=True).serve(
+        "Read notes.txt", {"base_directory": temp_workspace}, system_prompts=("You manage files.",)
+    )
+    result = await agent.run("What does it say?", message_history=served.new_messages())
+    assert result.output == "It says hello."
+    assert seen[0].parts[0].content == "You manage files."
+    assert any(getattr(p, "content", None) == "hello" for m in seen for p in m.parts)
+
+@pytest.mark.asyncio
+async def test_disabled_fast_path_counts_requests_only(temp_workspace):
+    fast_path = FastPath(enabled=False)
+    assert await fast_path.serve("List all files", {"base_directory": temp_workspace}) is None
+    assert fast_path.stats()["requests"] == 1 and fast_path.stats()["served"] == 0
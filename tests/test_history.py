@@ -0,0 +1,60 @@
+import pytest
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, SystemPromptPart, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import FunctionModel
+
+from agent.history import HistoryManager, estimate_tokens
+
+def big_file_tool() -> str:
+    return "x" * 4000
+
+def model(messages, info):
+    last = messages[-1].parts[-1]
+    if isinstance(last, ToolReturnPart):
+        return ModelResponse(parts=[TextPart("The file is full of x.")])
+    return ModelResponse(parts=[ToolCallPart("big_file_tool", {})])
+
+@pytest.fixture
+def agent():
+    return Agent(FunctionModel(model), system_prompt="You manage files.", tools=[big_file_tool])
+
+@pytest.mark.asyncio
+async def test_history_stays_within_budget_and_keeps_recent_turns(agent):
+    history = HistoryManager(token_budget=1150, keep_recent_turns=1, max_tool_output_chars=100)
+    for i in range(6):
+        result = await agent.run(f"Read big file number {i}", message_history=history.messages)
+        last_turn = result.new_messages()
+        history.extend(last_turn)
+
+    assert history.compactions > 0
+    assert estimate_tokens(history.messages) <= 1150
+    # The recent turn is verbatim; its first request also carries the system prompt and summary
+    assert history.messages[-len(last_turn) + 1:] == last_turn[1:]
+    assert history.messages[-len(last_turn)].parts[-1] == last_turn[0].parts[-1]
+    head = history.messages[0].parts
+    assert head[0].content == "You manage files."
+    assert any(isinstance(p, SystemPromptPart) and "Read big file number 0" in p.content for p in head)
+
+@pytest.mark.asyncio
+async def test_compacted_history_keeps_tool_calls_paired(agent):
+    history = HistoryManager(token_budget=1200, keep_recent_turns=1, max_tool_output_chars=100)
+    for i in range(4):
+        result = await agent.run(f"Read big file number {i}", message_history=history.messages)
+        history.extend(result.new_messages())
+
+    calls = [p.tool_call_id for m in history.messages for p in m.parts if isinstance(p, ToolCallPart)]
+    returns = [p.tool_call_id for m in history.messages for p in m.parts if isinstance(p, ToolReturnPart)]
+    assert calls == returns
+    result = await agent.run("One more", message_history=history.messages)
+    assert result.output == "The file is full of x."
+
+def test_small_history_is_left_alone():
+    history = HistoryManager(token_budget=1000)
+    history.extend([])
+    assert history.messages == [] and history.compactions == 0
+
+def test_budget_is_read_from_the_environment_when_created(monkeypatch):
+    monkeypatch.setenv("FILE_AGENT_HISTORY_TOKENS", "1234")
+    assert HistoryManager().token_budget == 1234
+    assert HistoryManager(token_budget=99).token_budget == 99
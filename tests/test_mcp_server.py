@@ -0,0 +1,252 @@
+import asyncio
+import json
+import os
+import pytest
+
+from mcp.shared.memory import create_connected_server_and_client_session
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import FunctionModel
+
+from agent.traced_model import TracedModel
+from server.mcp_server import FileAgentMCPServer
+
+def list_then_answer(messages, info):
+    last = messages[-1].parts[-1]
+    if isinstance(last, ToolReturnPart):
+        return ModelResponse(parts=[TextPart(f"Found {len(last.content)} files.")])
+    return ModelResponse(parts=[ToolCallPart("list_files", {})])
+
+@pytest.fixture
+def server(temp_workspace, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    with open(os.path.join(temp_workspace, "notes.txt"), "w") as f:
+        f.write("hello")
+    mcp_server = FileAgentMCPServer(temp_workspace)
+    with mcp_server.file_agent.override(model=TracedModel(FunctionModel(list_then_answer))):
+        yield mcp_server
+
+@pytest.mark.asyncio
+async def test_chat_request_is_traced_and_exported(server):
+    async with create_connected_server_and_client_session(server.server) as client:
+        result = await client.call_tool("chat_with_file_agent", {"message": "List all files with their sizes"})
+        assert result.content[0].text == "Found 1 files."
+
+        prometheus = (await client.read_resource("metrics://latency")).contents[0].text
+        assert 'span="tool",name="list_files"' in prometheus
+        assert 'span="request",name="chat_with_file_agent"' in prometheus
+        assert "file_agent_model_tokens_total" in prometheus
+
+        summary = json.loads((await client.read_resource("metrics://latency.json")).contents[0].text)
+        assert summary["latency"]["agent:file_agent"]["count"] >= 1
+
+    with open(server.metrics_file) as f:
+        assert "file_agent_span_duration_seconds_bucket" in f.read()
+
+@pytest.mark.asyncio
+async def test_literal_commands_skip_the_models(server):
+    async with create_connected_server_and_client_session(server.server) as client:
+        result = await client.call_tool("chat_with_file_agent", {"message": "Read the content of notes.txt"})
+        assert result.content[0].text == "Content of 'notes.txt':\n\nhello"
+        await client.call_tool("chat_with_file_agent", {"message": "List all files with their sizes"})
+
+        stats = json.loads((await client.call_tool("get_server_stats", {})).content[0].text)
+        assert stats["fast_path"]["served"] == 1 and stats["fast_path"]["fraction_served"] == 0.5
+        summary = json.loads((await client.read_resource("metrics://latency.json")).contents[0].text)
+        assert summary["latency"]["fast_path:read_file"]["count"] >= 1
+
+@pytest.mark.asyncio
+async def test_file_resources_are_listed_and_read_in_ranges(server):
+    async with create_connected_server_and_client_session(server.server) as client:
+        resources = {r.name: r for r in (await client.list_resources()).resources}
+        notes = resources["notes.txt"]
+        assert notes.size == 5 and str(notes.uri).startswith("file://")
+
+        contents = (await client.read_resource(notes.uri)).contents
+        assert [c.text for c in contents] == ["hello"]
+        partial = (await client.read_resource(f"{notes.uri}?offset=1&limit=3")).contents
+        assert partial[0].text == "ell"
+
+        with pytest.raises(Exception, match="outside the workspace"):
+            await client.read_resource("file:///etc/passwd")
+        # The agent's own stores are not workspace files.
+        metrics_uri = (server.base_directory / ".file_agent" / "metrics.prom").as_uri()
+        with pytest.raises(Exception, match="outside the workspace"):
+            await client.read_resource(metrics_uri)
+        with pytest.raises(Exception, match="outside the workspace"):
+            await client.subscribe_resource(metrics_uri)
+
+@pytest.mark.asyncio
+async def test_subscribed_clients_are_notified_of_changes(server):
+    updates = asyncio.Queue()
+
+    async def on_message(message):
+        root = getattr(message, "root", None)
+        if root is not None:
+            await updates.put((root.method, str(getattr(root.params, "uri", ""))))
+
+    async with server.watch_workspace(), create_connected_server_and_client_session(server.server, message_handler=on_message) as client:
+        uri = server._file_uri("notes.txt")
+        await client.subscribe_resource(uri)
+        with open(os.path.join(server.base_directory, "notes.txt"), "a") as f:
+            f.write(" world")
+        assert await asyncio.wait_for(updates.get(), 5) == ("notifications/resources/updated", uri)
+
+        await client.unsubscribe_resource(uri)
+        with open(os.path.join(server.base_directory, "notes.txt"), "a") as f:
+            f.write("!")
+        await asyncio.sleep(0.3)
+        assert updates.empty()
+
+@pytest.mark.asyncio
+async def test_watcher_polling_fallback(temp_workspace):
+    from tools.workspace_watcher import WorkspaceWatcher
+    seen = asyncio.Queue()
+
+    async def on_change(changes):
+        await seen.put(changes)
+
+    async with WorkspaceWatcher(temp_workspace, on_change, poll_interval=0.05, use_inotify=False) as watcher:
+        assert watcher.backend == "polling"
+        with open(os.path.join(temp_workspace, "new.txt"), "w") as f:
+            f.write("x")
+        assert await asyncio.wait_for(seen.get(), 5) == {"new.txt": "created"}
+        os.remove(os.path.join(temp_workspace, "new.txt"))
+        assert await asyncio.wait_for(seen.get(), 5) == {"new.txt": "deleted"}
+
+@pytest.mark.asyncio
+async def test_watcher_reports_rewrites_as_modified(temp_workspace):
+    from types import SimpleNamespace
+    from tools.file_tools import delete_file, write_file
+    from tools.workspace_watcher import WorkspaceWatcher
+    ctx = SimpleNamespace(deps={"base_directory": temp_workspace})
+    write_file(ctx, "notes.txt", "hello")
+    seen = asyncio.Queue()
+
+    async def on_change(changes):
+        await seen.put(changes)
+
+    async with WorkspaceWatcher(temp_workspace, on_change) as watcher:
+        assert watcher.backend == "inotify"
+        write_file(ctx, "notes.txt", "hello again")
+        assert await asyncio.wait_for(seen.get(), 5) == {"notes.txt": "modified"}
+        write_file(ctx, "new.txt", "fresh")
+        assert await asyncio.wait_for(seen.get(), 5) == {"new.txt": "created"}
+        delete_file(ctx, "new.txt")
+        assert await asyncio.wait_for(seen.get(), 5) == {"new.txt": "deleted"}
+
+@pytest.mark.asyncio
+async def test_watcher_expands_directory_removals(temp_workspace, tmp_path):
+    from types import SimpleNamespace
+    from tools.file_tools import write_file
+    from tools.workspace_watcher import WorkspaceWatcher
+    ctx = SimpleNamespace(deps={"base_directory": temp_workspace})
+    os.makedirs(os.path.join(temp_workspace, "docs", "inner"))
+    write_file(ctx, "docs/a.txt", "a")
+    write_file(ctx, "docs/inner/b.txt", "b")
+    seen = asyncio.Queue()
+
+    async def on_change(changes):
+        await seen.put(changes)
+
+    async with WorkspaceWatcher(temp_workspace, on_change) as watcher:
+        assert watcher.backend == "inotify"
+        os.rename(os.path.join(temp_workspace, "docs"), tmp_path / "moved")
+        expected = {os.path.join("docs", "a.txt"): "deleted", os.path.join("docs", "inner", "b.txt"): "deleted"}
+        assert await asyncio.wait_for(seen.get(), 5) == expected
+        # The kernel no longer watches the directories that left the workspace.
+        with open(f"/proc/self/fdinfo/{watcher._fd}") as fdinfo:
+            assert sum(line.startswith("inotify wd:") for line in fdinfo) == len(watcher._watches) == 1
+        os.rename(tmp_path / "moved", os.path.join(temp_workspace, "docs"))
+        assert await asyncio.wait_for(seen.get(), 5) == {path: "created" for path in expected}
+
+@pytest.mark.asyncio
+async def test_http_sessions_get_their_own_workspace_and_history(server):
+    import uvicorn
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+
+    http_server = uvicorn.Server(uvicorn.Config(server.http_app(), host="127.0.0.1", port=0, log_level="warning"))
+    serving = asyncio.create_task(http_server.serve())
+    try:
+        while not http_server.started:
+            await asyncio.sleep(0.05)
+        port = http_server.servers[0].sockets[0].getsockname()[1]
+
+        async def session(headers, action):
+            async with streamablehttp_client(f"http://127.0.0.1:{port}/mcp", headers=headers) as (read, write, _):
+                async with ClientSession(read, write) as client:
+                    await client.initialize()
+                    return await action(client)
+
+        async def list_files(client):
+            result = await client.call_tool("chat_with_file_agent", {"message": "List all files with their sizes"})
+            return result.content[0].text
+
+        def chat(headers=None):
+            return session(headers, list_files)
+
+        # Sessions without the header get a private workspace, unless the server shares its own.
+        private, alice = await asyncio.gather(chat(), chat({"X-File-Agent-Workspace": "alice"}))
+        assert private == alice == "Found 0 files."
+        server.shared_workspace = True
+        assert await chat() == "Found 1 files."
+        server.shared_workspace = False
+
+        alice_dir = server.base_directory / ".file_agent" / "workspaces" / "alice"
+        (alice_dir / "private.txt").write_text("secret")
+        assert await chat({"X-File-Agent-Workspace": "alice"}) == "Found 1 files."
+        alice_uri = (alice_dir / "private.txt").as_uri()
+
+        async def read(client):
+            try:
+                return (await client.read_resource(alice_uri)).contents[0].text
+            except Exception as e:
+                return str(e)
+
+        async def list_uris(client):
+            return [str(r.uri) for r in (await client.list_resources()).resources]
+
+        assert await session({"X-File-Agent-Workspace": "alice"}, read) == "secret"
+        assert alice_uri in await session({"X-File-Agent-Workspace": "alice"}, list_uris)
+        for headers in (None, {"X-File-Agent-Workspace": "bob"}):
+            assert "outside the workspace" in await session(headers, read)
+            assert alice_uri not in await session(headers, list_uris)
+        assert (await chat({"X-File-Agent-Workspace": "../etc"})).startswith("Error: Invalid workspace name")
+    finally:
+        http_server.should_exit = True
+        await serving
+    assert server.admission.stats()["admitted"] == 5
+
+@pytest.mark.asyncio
+async def test_admission_queues_then_refuses_when_full():
+    from server.admission import AdmissionControl, ServerBusy
+    admission = AdmissionControl(max_active=1, max_waiting=1)
+    release = asyncio.Event()
+
+    async def hold():
+        async with admission.slot():
+            await release.wait()
+
+    running = asyncio.create_task(hold())
+    queued = asyncio.create_task(hold())
+    await asyncio.sleep(0.01)
+    assert (admission.active, admission.waiting) == (1, 1)
+    with pytest.raises(ServerBusy):
+        async with admission.slot():
+            pass
+    release.set()
+    await asyncio.gather(running, queued)
+    assert admission.stats()["admitted"] == 2 and admission.stats()["rejected"] == 1
+
+@pytest.mark.asyncio
+async def test_chat_sends_progress_per_model_turn_and_tool_call(server):
+    progress = []
+
+    async def on_progress(value, total, message):
+        progress.append((value, message))
+
+    async with create_connected_server_and_client_session(server.server) as client:
+        result = await client.call_tool("chat_with_file_agent", {"message": "List all files with their sizes"}, progress_callback=on_progress)
+        assert result.content[0].text == "Found 1 files."
+    assert progress == [(1, "Model turn 1"), (2, "Calling list_files()"), (3, "Model turn 2")]
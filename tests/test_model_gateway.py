@@ -0,0 +1,159 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+
+from pydantic_ai import Agent
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import FunctionModel
+
+from agent import model_gateway
+from agent.model_gateway import GatewayModel, ModelGateway
+from tools.tracing import metrics
+
+class FakeProvider:
+    """Local stand-in for a model provider: slow, failing on cue, and counting calls."""
+
+    def __init__(self, delay=0.0, failures=(), reply="ok"):
+        self.delay = delay
+        self.failures = list(failures)
+        self.reply = reply
+        self.calls = 0
+        self.active = 0
+        self.peak_active = 0
+
+    async def respond_stream(self, messages, info):
+        """Streamed variant: fails on cue when the stream is opened, before any text."""
+        self.calls += 1
+        if self.failures:
+            raise ModelHTTPError(self.failures.pop(0), "fake")
+        yield f"{self.reply}: "
+        yield messages[-1].parts[-1].content
+
+    async def respond(self, messages, info):
+        self.calls += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures:
+                raise ModelHTTPError(self.failures.pop(0), "fake")
+            return ModelResponse(parts=[TextPart(f"{self.reply}: {messages[-1].parts[-1].content}")])
+        finally:
+            self.active -= 1
+
+def gateway_agent(provider, **limits):
+    limits.setdefault("rate", 1000)
+    gateway = ModelGateway("fake", backoff_seconds=0.001, **limits)
+    return Agent(GatewayModel(FunctionModel(provider.respond, stream_function=provider.respond_stream), gateway)), gateway
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_requests_share_one_call():
+    provider = FakeProvider(delay=0.05)
+    agent, gateway = gateway_agent(provider)
+    first, second, other = await asyncio.gather(agent.run("same"), agent.run("same"), agent.run("different"))
+    assert first.output == second.output == "ok: same" and other.output == "ok: different"
+    assert provider.calls == 2
+    assert gateway.stats()["coalesced"] == 1
+
+@pytest.mark.asyncio
+async def test_rate_limits_are_retried_with_backoff_and_slow_the_rate():
+    provider = FakeProvider(failures=[429, 503])
+    agent, gateway = gateway_agent(provider)
+    assert (await agent.run("hi")).output == "ok: hi"
+    stats = gateway.stats()
+    assert provider.calls == 3 and stats["retries"] == 2 and stats["throttled"] == 1
+    assert stats["rate_per_second"] < stats["max_rate_per_second"]
+
+@pytest.mark.asyncio
+async def test_streams_that_fail_to_open_are_retried():
+    provider = FakeProvider(failures=[429])
+    agent, gateway = gateway_agent(provider)
+    async with agent.run_stream("hi") as run:
+        assert await run.get_output() == "ok: hi"
+    stats = gateway.stats()
+    assert provider.calls == 2 and stats["retries"] == 1 and stats["throttled"] == 1
+    assert stats["upstream_calls"] == 2 and stats["rate_per_second"] < stats["max_rate_per_second"]
+
+    provider = FakeProvider(failures=[400])
+    agent, gateway = gateway_agent(provider)
+    with pytest.raises(ModelHTTPError):
+        async with agent.run_stream("bad"):
+            pass
+    assert provider.calls == 1 and gateway.stats()["failures"] == 1
+
+@pytest.mark.asyncio
+async def test_client_errors_and_exhausted_retries_are_raised():
+    provider = FakeProvider(failures=[400])
+    agent, gateway = gateway_agent(provider)
+    with pytest.raises(ModelHTTPError):
+        await agent.run("bad")
+    assert provider.calls == 1
+
+    provider = FakeProvider(failures=[429] * 5)
+    agent, gateway = gateway_agent(provider, max_attempts=3)
+    with pytest.raises(ModelHTTPError):
+        await agent.run("busy")
+    assert provider.calls == 3 and gateway.stats()["failures"] == 1
+
+@pytest.mark.asyncio
+async def test_calls_queue_for_concurrency_and_rate_limits():
+    provider = FakeProvider(delay=0.02)
+    agent, gateway = gateway_agent(provider, concurrency=2, rate=1000, burst=100)
+    await asyncio.gather(*(agent.run(f"request {i}") for i in range(6)))
+    assert provider.peak_active == 2 and gateway.stats()["peak_queued"] >= 3
+    assert metrics.snapshot()["latency"]["model_queue:fake"]["count"] >= 6
+    assert 'file_agent_model_queue_depth{provider="fake"} 0' in metrics.render_prometheus()
+
+    agent, gateway = gateway_agent(FakeProvider(), rate=20, burst=1)
+    started = time.perf_counter()
+    await asyncio.gather(*(agent.run(f"request {i}") for i in range(3)))
+    assert time.perf_counter() - started >= 0.09
+
+@pytest_asyncio.fixture
+async def fake_openai(monkeypatch):
+    """An OpenAI-compatible HTTP server that rate limits its first request."""
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+    from agent.upstream import upstream_client
+
+    requests = []
+
+    async def completions(request):
+        requests.append(await request.json())
+        if len(requests) == 1:
+            return JSONResponse({"error": {"message": "slow down"}}, status_code=429)
+        return JSONResponse({
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "hello from fake"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 3, "total_tokens": 6},
+        })
+
+    app = Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{port}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("FILE_AGENT_MODEL_BACKOFF_SECONDS", "0.001")
+    monkeypatch.setenv("FILE_AGENT_OPENAI_RPS", "1000")
+    monkeypatch.setattr(model_gateway, "_gateways", {})
+    upstream_client.cache_clear()
+    yield requests
+    upstream_client.cache_clear()
+    server.should_exit = True
+    await serving
+
+@pytest.mark.asyncio
+async def test_named_models_go_through_the_gateway(fake_openai):
+    from agent.traced_model import TracedModel
+    agent = Agent(TracedModel("openai:gpt-4o"))
+    assert (await agent.run("hi")).output == "hello from fake"
+    assert len(fake_openai) == 2
+    stats = model_gateway.gateway_stats()["openai"]
+    assert stats["throttled"] == 1 and stats["upstream_calls"] == 2
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import pytest
+from types import SimpleNamespace
+
+from agent.pipeline import run_guarded
+from tools.async_file_tools import path_locks
+from tools.file_tools import delete_file, list_files, read_file, write_file
+from tools.workspace import STATE_DIR_NAME
+
+class SlowGate:
+    """Filter gate that answers after a delay, like a remote filter model."""
+
+    def __init__(self, decision, delay=0.05):
+        self.decision = decision
+        self.delay = delay
+
+    async def decide(self, message):
+        await asyncio.sleep(self.delay)
+        return self.decision
+
+class ScriptedAgent:
+    """File agent stand-in that performs its tool calls straight away."""
+
+    def __init__(self):
+        self.observed = []
+
+    async def run(self, message, message_history=None, deps=None):
+        ctx = SimpleNamespace(deps=deps)
+        self.observed.append(write_file(ctx, "new.txt", "draft"))
+        self.observed.append(read_file(ctx, "new.txt"))
+        self.observed.append(delete_file(ctx, "old.txt"))
+        self.observed.append(read_file(ctx, "old.txt"))
+        await asyncio.sleep(0.1)
+        self.observed.append(write_file(ctx, "late.txt", "after accept"))
+        return SimpleNamespace(output="done")
+
+@pytest.fixture
+def workspace(temp_workspace):
+    with open(os.path.join(temp_workspace, "old.txt"), "w") as f:
+        f.write("old")
+    return temp_workspace
+
+@pytest.mark.asyncio
+async def test_accepted_run_commits_staged_mutations(workspace):
+    agent = ScriptedAgent()
+    run = await run_guarded(SlowGate("accept"), agent, "tidy up", deps={"base_directory": workspace})
+    assert run.decision == "accept"
+    assert run.result.output == "done"
+    assert agent.observed[1] == "draft"
+    assert "does not exist" in agent.observed[3]
+    assert len(run.mutation_results) == 2
+    assert sorted(set(os.listdir(workspace)) - {STATE_DIR_NAME}) == ["late.txt", "new.txt"]
+
+@pytest.mark.asyncio
+async def test_rejected_run_leaves_workspace_untouched(workspace):
+    agent = ScriptedAgent()
+    run = await run_guarded(SlowGate("reject"), agent, "tell me a joke", deps={"base_directory": workspace})
+    assert run.decision == "reject"
+    assert run.result is None
+    assert agent.observed[0].endswith("successfully.")
+    assert os.listdir(workspace) == ["old.txt"]
+
+@pytest.mark.asyncio
+async def test_filter_and_agent_overlap(workspace):
+    agent = ScriptedAgent()
+    start = asyncio.get_running_loop().time()
+    await run_guarded(SlowGate("accept", delay=0.1), agent, "tidy up", deps={"base_directory": workspace})
+    assert asyncio.get_running_loop().time() - start < 0.19
+
+class ListingAgent:
+    """Writes a file, then lists the workspace from a worker thread, as the offloaded tools do."""
+
+    async def run(self, message, message_history=None, deps=None):
+        ctx = SimpleNamespace(deps=deps)
+        write_file(ctx, "new.txt", "draft")
+        listing = await asyncio.to_thread(list_files, ctx)
+        return SimpleNamespace(output=sorted(item["filename"] for item in listing))
+
+@pytest.mark.asyncio
+async def test_listing_tools_see_staged_writes_once_committed(workspace):
+    run = await run_guarded(SlowGate("accept"), ListingAgent(), "add a file", deps={"base_directory": workspace})
+    assert run.result.output == ["new.txt", "old.txt"]
+
+@pytest.mark.asyncio
+async def test_listing_waits_for_the_decision_without_an_io_thread(workspace, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from tools import async_file_tools
+
+    class AsyncListingAgent:
+        async def run(self, message, message_history=None, deps=None):
+            ctx = SimpleNamespace(deps=deps)
+            await async_file_tools.write_file(ctx, "new.txt", "draft")
+            listing = await async_file_tools.list_files(ctx)
+            return SimpleNamespace(output=sorted(item["filename"] for item in listing))
+
+    class PoolUsingGate(SlowGate):
+        async def decide(self, message):
+            await asyncio.sleep(self.delay)
+            # The only I/O thread must still be free while the listing waits for this decision.
+            await asyncio.wait_for(async_file_tools.run_blocking(lambda: None), 1)
+            return self.decision
+
+    monkeypatch.setattr(async_file_tools, "_executor", ThreadPoolExecutor(max_workers=1))
+    run = await run_guarded(PoolUsingGate("accept"), AsyncListingAgent(), "add a file", deps={"base_directory": workspace})
+    assert run.result.output == ["new.txt", "old.txt"]
+
+@pytest.mark.asyncio
+async def test_mutation_results_report_failures(workspace):
+    class DeletingAgent:
+        async def run(self, message, message_history=None, deps=None):
+            delete_file(SimpleNamespace(deps=deps), "old.txt")
+            return SimpleNamespace(output="done")
+
+    class RacingGate(SlowGate):
+        async def decide(self, message):
+            await asyncio.sleep(self.delay)
+            os.remove(os.path.join(workspace, "old.txt"))  # removed by someone else before the commit
+            return self.decision
+
+    run = await run_guarded(RacingGate("accept"), DeletingAgent(), "delete old.txt", deps={"base_directory": workspace})
+    assert run.mutation_results == [
+        {"op": "delete", "filename": "old.txt", "ok": False, "result": "File 'old.txt' does not exist."}
+    ]
+
+@pytest.mark.asyncio
+async def test_commit_waits_for_the_path_lock(workspace):
+    path = os.path.join(workspace, "new.txt")
+    async with path_locks.reading(path):
+        task = asyncio.create_task(run_guarded(SlowGate("accept", delay=0.01), ScriptedAgent(), "tidy up",
+                                               deps={"base_directory": workspace}))
+        await asyncio.sleep(0.05)
+        assert not os.path.exists(path)  # a reader of new.txt holds the lock
+    run = await task
+    assert [r["ok"] for r in run.mutation_results] == [True, True]
+    assert os.path.exists(path)
@@ -0,0 +1,188 @@
+import os
+import time
+import pytest
+
+from pydantic_ai.messages import ModelResponse, SystemPromptPart, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import FunctionModel
+
+from agent.base_agent import agent_profile, build_agent
+from agent.pipeline import run_guarded
+from agent.response_cache import ResponseCache, normalize_prompt
+
+class AcceptingGate:
+    def __init__(self):
+        self.calls = 0
+
+    async def decide(self, message):
+        self.calls += 1
+        return "accept"
+
+class ScriptedModel:
+    """Calls one tool, then answers with what the tool returned; counts model calls."""
+
+    def __init__(self, tool, args):
+        self.tool = tool
+        self.args = args
+        self.calls = 0
+
+    def respond(self, messages, info):
+        self.calls += 1
+        returns = [part for part in messages[-1].parts if isinstance(part, ToolReturnPart)]
+        if returns:
+            return ModelResponse(parts=[TextPart(f"answer: {returns[0].content}")])
+        return ModelResponse(parts=[ToolCallPart(self.tool, self.args)])
+
+@pytest.fixture(autouse=True)
+def no_provider_keys(monkeypatch):
+    """Cache keys come from model names, so nothing here may need a provider client."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+
+@pytest.fixture
+def workspace(temp_workspace):
+    with open(os.path.join(temp_workspace, "summary.txt"), "w") as f:
+        f.write("Q3 revenue grew 12%.")
+    return temp_workspace
+
+async def _ask(agent, model, cache, workspace, message, history=None, gate=None, model_name="test"):
+    with agent.override(model=FunctionModel(model.respond)):
+        return await run_guarded(gate or AcceptingGate(), agent, message, deps={"base_directory": workspace},
+                                 message_history=history, response_cache=cache, profile=agent_profile(model_name))
+
+@pytest.mark.asyncio
+async def test_repeated_question_is_served_without_model_calls(workspace):
+    agent, cache, gate = build_agent(workspace), ResponseCache(enabled=True), AcceptingGate()
+    model = ScriptedModel("read_file", {"filename": "summary.txt"})
+    first = await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+    second = await _ask(agent, model, cache, workspace, "  what does SUMMARY.txt contain ", gate=gate)
+    assert first.result.output == second.result.output == "answer: Q3 revenue grew 12%."
+    assert model.calls == 2 and gate.calls == 0
+    assert cache.stats()["hits"] == 1
+
+    # The cached history carries the tool call, the system prompt and the new wording.
+    messages = second.result.new_messages()
+    assert isinstance(messages[0].parts[0], SystemPromptPart)
+    assert messages[0].parts[-1].content == "  what does SUMMARY.txt contain "
+    assert any(isinstance(part, ToolCallPart) for message in messages for part in message.parts)
+
+    # The cache is on disk, so a new cache object (e.g. after a restart) serves it too.
+    await _ask(agent, model, ResponseCache(enabled=True), workspace, "What does summary.txt contain?")
+    assert model.calls == 2
+
+@pytest.mark.asyncio
+async def test_edits_to_touched_files_invalidate_the_answer(workspace):
+    agent, cache = build_agent(workspace), ResponseCache(enabled=True)
+    model = ScriptedModel("read_file", {"filename": "summary.txt"})
+    await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+
+    # Touched but unchanged: still a hit.
+    path = os.path.join(workspace, "summary.txt")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+    assert model.calls == 2
+
+    # Files the answer did not read do not matter.
+    with open(os.path.join(workspace, "other.txt"), "w") as f:
+        f.write("unrelated")
+    await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+    assert model.calls == 2
+
+    with open(path, "w") as f:
+        f.write("Q3 revenue grew 15%.")
+    run = await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+    assert run.result.output == "answer: Q3 revenue grew 15%."
+    assert model.calls == 4 and cache.stats()["stale"] == 1
+
+@pytest.mark.asyncio
+async def test_files_edited_during_the_run_keep_the_answer_out(workspace):
+    agent, cache = build_agent(workspace), ResponseCache(enabled=True)
+    model = ScriptedModel("read_file", {"filename": "summary.txt"})
+    respond = model.respond
+
+    def edit_after_the_read(messages, info):
+        if any(isinstance(part, ToolReturnPart) for part in messages[-1].parts):
+            # Another session edits the file between the tool call and the store.
+            with open(os.path.join(workspace, "summary.txt"), "w") as f:
+                f.write("Q3 revenue grew 15%.")
+        return respond(messages, info)
+
+    model.respond = edit_after_the_read
+    run = await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+    assert run.result.output == "answer: Q3 revenue grew 12%."
+    assert cache.stats()["stores"] == 0 and cache.stats()["changed_during_run"] == 1
+
+    model.respond = respond
+    run = await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+    assert run.result.output == "answer: Q3 revenue grew 15%." and cache.stats()["stores"] == 1
+
+@pytest.mark.asyncio
+async def test_workspace_wide_answers_depend_on_every_file(workspace):
+    agent, cache = build_agent(workspace), ResponseCache(enabled=True)
+    model = ScriptedModel("list_files", {})
+    await _ask(agent, model, cache, workspace, "How many files are there?")
+    await _ask(agent, model, cache, workspace, "How many files are there?")
+    assert model.calls == 2
+    with open(os.path.join(workspace, "other.txt"), "w") as f:
+        f.write("new")
+    await _ask(agent, model, cache, workspace, "How many files are there?")
+    assert model.calls == 4
+
+@pytest.mark.asyncio
+async def test_mutating_and_time_dependent_runs_are_not_cached(workspace):
+    agent, cache = build_agent(workspace), ResponseCache(enabled=True)
+    for tool, args in [("write_file", {"filename": "a.txt", "content": "x"}), ("list_changes", {"since": "1h"})]:
+        model = ScriptedModel(tool, args)
+        await _ask(agent, model, cache, workspace, "Do the thing")
+        await _ask(agent, model, cache, workspace, "Do the thing")
+        assert model.calls == 4
+    assert cache.stats()["hits"] == 0 and cache.stats()["stores"] == 0
+
+@pytest.mark.asyncio
+async def test_follow_ups_in_a_conversation_bypass_the_cache(workspace):
+    agent, cache = build_agent(workspace), ResponseCache(enabled=True)
+    model = ScriptedModel("read_file", {"filename": "summary.txt"})
+    first = await _ask(agent, model, cache, workspace, "Summarize it again")
+    await _ask(agent, model, cache, workspace, "Summarize it again", history=first.result.new_messages())
+    assert model.calls == 4
+
+@pytest.mark.asyncio
+async def test_entries_expire_and_are_evicted_by_size(workspace):
+    agent = build_agent(workspace)
+    model = ScriptedModel("read_file", {"filename": "summary.txt"})
+    cache = ResponseCache(enabled=True, ttl_seconds=0.05)
+    await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+    time.sleep(0.1)
+    await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+    assert model.calls == 4 and cache.stats()["expired"] == 1
+
+    cache = ResponseCache(enabled=True, max_bytes=5000)
+    for i in range(4):
+        await _ask(agent, model, cache, workspace, f"What does summary.txt contain, question {i}?")
+    assert cache.stats()["evictions"] >= 1
+    calls = model.calls
+    await _ask(agent, model, cache, workspace, "What does summary.txt contain, question 3?")
+    assert model.calls == calls
+
+@pytest.mark.asyncio
+async def test_answers_are_kept_per_model(workspace):
+    agent, cache = build_agent(workspace), ResponseCache(enabled=True)
+    first, second = ScriptedModel("read_file", {"filename": "summary.txt"}), ScriptedModel("list_files", {})
+    await _ask(agent, first, cache, workspace, "What is in the workspace?")
+    await _ask(agent, second, cache, workspace, "What is in the workspace?", model_name="other")
+    assert second.calls == 2 and cache.stats()["hits"] == 0
+    await _ask(agent, second, cache, workspace, "What is in the workspace?")
+    assert second.calls == 2 and cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_follow_up_answers_replay_with_the_system_prompt(workspace):
+    agent, cache = build_agent(workspace), ResponseCache(enabled=True)
+    model = ScriptedModel("read_file", {"filename": "summary.txt"})
+    first = await _ask(agent, model, cache, workspace, "Hello")
+    await _ask(agent, model, cache, workspace, "What does summary.txt contain?", history=first.result.new_messages())
+
+    replayed = await _ask(agent, model, cache, workspace, "What does summary.txt contain?")
+    assert model.calls == 4
+    assert isinstance(replayed.result.new_messages()[0].parts[0], SystemPromptPart)
+
+def test_prompt_normalization():
+    assert normalize_prompt("  What does  summary.txt CONTAIN?! ") == "what does summary.txt contain"
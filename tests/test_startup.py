@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.bench_startup import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run_without_api_keys(code: str) -> str:
+    env = {k: v for k, v in os.environ.items() if k not in {"OPENAI_API_KEY", "GROQ_API_KEY"}}
+    env["PYTHONPATH"] = ROOT
+    return subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+
+def test_importing_cli_chat_builds_nothing():
+    output = _run_without_api_keys(
+        "import sys, chat_interface.cli_chat as cli\n"
+        "print('pydantic_ai' in sys.modules, cli.get_agents.cache_info().currsize)"
+    )
+    assert output.split() == ["False", "0"]
+
+def test_agents_build_without_api_keys_or_provider_sdks(tmp_path):
+    output = _run_without_api_keys(
+        "import sys\n"
+        "from agent.base_agent import build_agent\n"
+        "from agent.question_filtering_agent import build_filter_agent\n"
+        f"build_agent({str(tmp_path)!r}); build_filter_agent()\n"
+        "print('openai' in sys.modules, 'groq' in sys.modules)"
+    )
+    assert output.split() == ["False", "False"]
+
+def test_startup_benchmark_writes_json(tmp_path):
+    output = tmp_path / "startup.json"
+    assert main(["--repeats", "1", "--only", "import_cli_chat", "--output", str(output)]) == 0
+    results = json.loads(output.read_text())["results"]
+    assert list(results) == ["import_cli_chat"] and results["import_cli_chat"]["wall_ms"] > 0
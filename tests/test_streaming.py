@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import DeltaToolCall, FunctionModel
+
+from agent.base_agent import build_agent
+from agent.pipeline import run_guarded
+
+class Gate:
+    def __init__(self, decision, delay=0.0):
+        self.decision = decision
+        self.delay = delay
+
+    async def decide(self, message):
+        await asyncio.sleep(self.delay)
+        return self.decision
+
+def _called_tool(messages):
+    return any(isinstance(part, ToolReturnPart) for part in messages[-1].parts)
+
+async def stream_reply(messages, info):
+    """Asks for the file list, then streams its answer in pieces."""
+    if not _called_tool(messages):
+        yield {0: DeltaToolCall(name="list_files", json_args="{}")}
+        return
+    for piece in ["The workspace ", "has ", "one file."]:
+        yield piece
+
+def whole_reply(messages, info):
+    if not _called_tool(messages):
+        return ModelResponse(parts=[ToolCallPart("list_files", {})])
+    return ModelResponse(parts=[TextPart("The workspace has one file.")])
+
+@pytest.fixture
+def agent(temp_workspace):
+    with open(f"{temp_workspace}/notes.txt", "w") as f:
+        f.write("hello")
+    return build_agent(temp_workspace)
+
+@pytest.mark.asyncio
+async def test_reply_text_and_tool_calls_are_reported_as_they_happen(agent, temp_workspace):
+    events = []
+
+    async def on_event(event):
+        events.append(event)
+
+    with agent.override(model=FunctionModel(stream_function=stream_reply)):
+        run = await run_guarded(Gate("accept", delay=0.05), agent, "How many files are there?",
+                                deps={"base_directory": temp_workspace}, on_event=on_event, stream_text=True)
+    assert [event.kind for event in events[:4]] == ["model_turn", "tool_call", "tool_result", "model_turn"]
+    assert events[1].tool == "list_files"
+    texts = [event.text for event in events if event.kind == "text"]
+    assert len(texts) == 3 and "".join(texts) == run.result.output == "The workspace has one file."
+
+@pytest.mark.asyncio
+async def test_progress_without_streaming_text(agent, temp_workspace):
+    events = []
+
+    async def on_event(event):
+        events.append(event)
+
+    with agent.override(model=FunctionModel(whole_reply)):
+        run = await run_guarded(Gate("accept"), agent, "How many files are there?",
+                                deps={"base_directory": temp_workspace}, on_event=on_event)
+    assert [event.kind for event in events] == ["model_turn", "tool_call", "tool_result", "model_turn"]
+    assert run.result.output == "The workspace has one file."
+
+@pytest.mark.asyncio
+async def test_rejected_requests_show_nothing(agent, temp_workspace):
+    events = []
+
+    async def on_event(event):
+        events.append(event)
+
+    with agent.override(model=FunctionModel(whole_reply)):
+        run = await run_guarded(Gate("reject", delay=0.05), agent, "How many files are there?",
+                                deps={"base_directory": temp_workspace}, on_event=on_event)
+    assert run.decision == "reject" and events == []
@@ -11,7 +11,11 @@ from tools.file_tools import (
     write_file,
     delete_file,
     answer_question_about_files,
+    search_files,
+    find_related_files,
 )
+from tools import grep_search
+from tools.content_cache import ContentCache, content_cache
 
 from agent.base_agent import build_agent
 from agent.question_filtering_agent import build_filter_agent
@@ -67,9 +71,52 @@ def test_answer_question_about_files(ctx):
     write_file(ctx, "first.txt", "Alpha")
     write_file(ctx, "second.txt", "Beta")
     response = answer_question_about_files(ctx, "Where is Alpha?")
-    assert "FILE SUMMARY" in response
+    assert "FILE: first.txt" in response
     assert "Alpha" in response
-    assert "Beta" in response
+    assert "Beta" not in response
+
+def test_answer_question_reports_passage_offsets(ctx):
+    filler = "".join(f"line {i} filler text\n" for i in range(200))
+    write_file(ctx, "big.txt", filler + "the secret codeword is zebra\n" + filler)
+    response = answer_question_about_files(ctx, "codeword zebra", top_k=1)
+    assert "TOP 1 PASSAGES" in response
+    assert "codeword is zebra" in response
+    assert "FILE: big.txt [bytes " in response
+    assert "[bytes 0-" not in response
+
+def test_answer_question_index_updates_incrementally(ctx):
+    write_file(ctx, "notes.txt", "Alpha")
+    assert "Alpha" in answer_question_about_files(ctx, "alpha")
+    time.sleep(0.01)
+    write_file(ctx, "notes.txt", "Gamma ray")
+    assert "Gamma" in answer_question_about_files(ctx, "gamma")
+    assert "No passages matched" in answer_question_about_files(ctx, "alpha")
+    delete_file(ctx, "notes.txt")
+    assert "no files" in answer_question_about_files(ctx, "gamma")
+
+def test_answer_question_index_rechecks_only_changed_files(ctx, temp_workspace, monkeypatch):
+    from tools import workspace
+    from tools.search_index import BM25Index
+    write_file(ctx, "a.txt", "Alpha")
+    assert "Alpha" in answer_question_about_files(ctx, "alpha")
+
+    walks = []
+    monkeypatch.setattr(workspace, "iter_workspace_files", lambda *args, **kwargs: walks.append(args) or iter(()))
+    with open(_safe_path(ctx, "outside.txt"), "w") as f:
+        f.write("zebra from outside the tools")
+    write_file(ctx, "b.txt", "zebra from the tools")
+    response = answer_question_about_files(ctx, "zebra")
+    assert "FILE: b.txt" in response and "outside.txt" not in response
+    assert walks == []  # only the file written through the tools was re-checked
+    monkeypatch.undo()
+
+    monkeypatch.setenv("FILE_AGENT_RESCAN_SECONDS", "0")
+    assert "FILE: outside.txt" in answer_question_about_files(ctx, "zebra")
+
+    reloaded = BM25Index(temp_workspace)
+    reloaded.load()
+    assert reloaded.files.keys() == {"a.txt", "b.txt", "outside.txt"}
+    assert reloaded.search("zebra", top_k=2)[0][1]["file"] in {"b.txt", "outside.txt"}
 
 def test_safe_path_invalid_filename(ctx):
     with pytest.raises(ValueError):
@@ -234,3 +281,249 @@ async def test_agent_rejects_delete_directory(temp_workspace):
 
     assert os.path.exists(dir_path)
     
+
+def test_read_file_line_range_and_cursor(ctx):
+    write_file(ctx, "log.txt", "".join(f"entry {i}\n" for i in range(1, 1001)))
+    page = read_file(ctx, "log.txt", start_line=500, end_line=502)
+    assert page.startswith("entry 500\nentry 501\nentry 502\n")
+    assert "[lines 500-502 of 1000; next cursor: 'l:503']" in page
+    page = read_file(ctx, "log.txt", cursor="l:999")
+    assert page.startswith("entry 999\nentry 1000\n")
+    assert "end of file" in page
+
+def test_read_file_byte_range_pagination(ctx):
+    write_file(ctx, "data.txt", "abcdefghij")
+    page = read_file(ctx, "data.txt", offset=2, limit=3)
+    assert page.startswith("cde\n")
+    assert "[bytes 2-5 of 10; next cursor: 'b:5']" in page
+    page = read_file(ctx, "data.txt", cursor="b:5", limit=100)
+    assert page.startswith("fghij\n")
+    assert "end of file" in page
+    assert "Invalid range" in read_file(ctx, "data.txt", cursor="bogus")
+
+def test_content_cache_hits_and_invalidation(ctx):
+    content_cache.clear()
+    write_file(ctx, "cached.txt", "first")
+    before = content_cache.stats()
+    assert read_file(ctx, "cached.txt") == "first"
+    assert read_file(ctx, "cached.txt") == "first"
+    after = content_cache.stats()
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"] + 1
+    write_file(ctx, "cached.txt", "second")
+    assert read_file(ctx, "cached.txt") == "second"
+    assert content_cache.stats()["invalidations"] > before["invalidations"]
+
+def test_content_cache_evicts_least_recently_used(temp_workspace):
+    cache = ContentCache(max_bytes=80)
+    paths = []
+    for name in "abcde":
+        path = os.path.join(temp_workspace, name)
+        with open(path, "w") as f:
+            f.write(name * 20)
+        paths.append(path)
+    for path in paths[:4]:
+        cache.read_bytes(path)
+    cache.read_bytes(paths[0])  # "a" becomes most recently used
+    cache.read_bytes(paths[4])  # evicts "b"
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 80
+    cache.read_bytes(paths[0])
+    assert cache.stats()["hits"] == stats["hits"] + 1
+    cache.read_bytes(paths[1])
+    assert cache.stats()["misses"] == stats["misses"] + 1
+
+def test_list_files_recursive_filters_and_sort(ctx):
+    write_file(ctx, "a.txt", "1")
+    write_file(ctx, "b.md", "12345")
+    os.mkdir(os.path.join(ctx.deps["base_directory"], "sub"))
+    write_file(ctx, "sub/c.txt", "123")
+    assert [f["filename"] for f in list_files(ctx)] == ["a.txt", "b.md"]
+    files = list_files(ctx, recursive=True, extensions=["txt"], sort_by="size", descending=True)
+    assert [f["filename"] for f in files] == [os.path.join("sub", "c.txt"), "a.txt"]
+    files = list_files(ctx, recursive=True, pattern="*.md", min_size=2)
+    assert [f["filename"] for f in files] == ["b.md"]
+    assert "error" in list_files(ctx, sort_by="colour")[0]
+
+def test_list_files_pagination(ctx):
+    for i in range(5):
+        write_file(ctx, f"f{i}.txt", "x")
+    page = list_files(ctx, limit=2)
+    assert [f["filename"] for f in page[:2]] == ["f0.txt", "f1.txt"]
+    assert page[2] == {"next_cursor": "2", "total_matches": 5}
+    page = list_files(ctx, limit=2, cursor="4")
+    assert [f["filename"] for f in page] == ["f4.txt"]
+
+def test_search_files_literal_with_context(ctx):
+    write_file(ctx, "notes.txt", "alpha\nBudget review\nomega\nno match here")
+    write_file(ctx, "other.md", "the budget is fine")
+    results = search_files(ctx, "budget", context_lines=1)
+    assert [(r["filename"], r["line"], r["column"]) for r in results] == [("notes.txt", 2, 1), ("other.md", 1, 5)]
+    assert results[0]["before"] == ["alpha"] and results[0]["after"] == ["omega"]
+
+def test_search_files_regex_whole_word_and_max_results(ctx):
+    write_file(ctx, "log.txt", "\n".join(f"error {i}" for i in range(10)) + "\nerrors\n")
+    results = search_files(ctx, r"error \d", regex=True, max_results=3)
+    assert [r["line"] for r in results[:-1]] == [1, 2, 3]
+    assert results[-1]["truncated"] is True
+    assert len(search_files(ctx, "error", whole_word=True, case_sensitive=True)) == 10
+    assert "error" in search_files(ctx, "(unclosed", regex=True)[0]
+
+def test_search_files_skips_binary_and_oversized(ctx, monkeypatch):
+    with open(_safe_path(ctx, "blob.bin"), "wb") as f:
+        f.write(b"needle\0\1\2")
+    write_file(ctx, "big.txt", "needle " * 100)
+    write_file(ctx, "small.txt", "needle")
+    monkeypatch.setenv("FILE_AGENT_SEARCH_MAX_BYTES", "100")
+    results = search_files(ctx, "needle")
+    assert [r["filename"] for r in results[:-1]] == ["small.txt"]
+    assert results[-1]["skipped_files"] == {"blob.bin": "binary", "big.txt": "too large"}
+
+def test_search_files_positions_in_sparse_and_long_lines(ctx, monkeypatch):
+    monkeypatch.setattr(grep_search, "COUNT_WINDOW_BYTES", 16)
+    monkeypatch.setattr(grep_search, "SEARCH_CHUNK_BYTES", 64)
+    filler = "".join(f"filler line {i}\n" for i in range(500))
+    write_file(ctx, "sparse.txt", filler + "héllo wörld needle\n" + filler + "x" * 5000 + " needle\n")
+    results = search_files(ctx, "needle")
+    assert [(r["line"], r["column"]) for r in results] == [(501, 13), (1002, 5002)]
+    assert results[1]["text"] == "x" * grep_search.MAX_LINE_CHARS + "..."
+
+def test_search_files_parallel_pool(ctx, monkeypatch):
+    monkeypatch.setattr(grep_search, "PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(grep_search, "BATCH_MAX_FILES", 2)
+    for i in range(6):
+        write_file(ctx, f"doc{i}.txt", f"line one\nfind me {i}\n")
+    results = search_files(ctx, "find me")
+    assert [(r["filename"], r["line"]) for r in results] == [(f"doc{i}.txt", 2) for i in range(6)]
+
+
+def _write_docx(path, paragraphs):
+    import zipfile
+    body = "".join(f"<w:p><w:r><w:t>{p}</w:t></w:r></w:p>" for p in paragraphs)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        archive.writestr(
+            "word/document.xml",
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f"<w:body>{body}</w:body></w:document>",
+        )
+
+def test_read_and_ask_about_docx(ctx):
+    _write_docx(_safe_path(ctx, "report.docx"), ["Quarterly report", "Revenue grew by twelve percent"])
+    assert read_file(ctx, "report.docx") == "Quarterly report\nRevenue grew by twelve percent"
+    answer = answer_question_about_files(ctx, "revenue growth")
+    assert "--- FILE: report.docx [bytes 0-47]" in answer
+    assert "Revenue grew by twelve percent" in answer
+
+@pytest.fixture
+def shout_extractor():
+    """Registers a toy format: files starting with "SHOUT:" hold their text upper-cased."""
+    from tools.text_extraction import register_extractor, unregister_extractor
+    calls = []
+
+    @register_extractor("shout", lambda head, path: head.startswith(b"SHOUT:"))
+    def extract_shout(path):
+        calls.append(path)
+        with open(path) as f:
+            return f.read()[len("SHOUT:"):].lower()
+
+    yield calls
+    unregister_extractor("shout")
+
+def test_extracted_text_is_cached_by_content_hash(ctx, temp_workspace, shout_extractor):
+    from tools.text_extraction import ExtractionCache
+    cache = ExtractionCache()
+    for name in ("a.shout", "b.shout"):
+        with open(_safe_path(ctx, name), "w") as f:
+            f.write("SHOUT:HELLO")
+    first = cache.text_path(temp_workspace, _safe_path(ctx, "a.shout"))
+    second = cache.text_path(temp_workspace, _safe_path(ctx, "b.shout"))
+    assert first == second and first.startswith(os.path.join(temp_workspace, ".file_agent", "extracted"))
+    with open(first) as f:
+        assert f.read() == "hello"
+    assert len(shout_extractor) == 1
+    assert cache.stats()["hits"] == 1
+    write_file(ctx, "plain.txt", "SHOUT in the middle is plain text")
+    assert cache.text_path(temp_workspace, _safe_path(ctx, "plain.txt")) is None
+
+def test_failed_extractions_are_not_retried_until_the_file_changes(ctx):
+    from tools.text_extraction import extraction_cache
+    path = _safe_path(ctx, "broken.pdf")
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4 not really a pdf")
+    before = extraction_cache.stats()
+    for _ in range(3):
+        assert read_file(ctx, "broken.pdf").startswith("Cannot extract text from 'broken.pdf'")
+    after = extraction_cache.stats()
+    assert after["extractions"] - before["extractions"] == 1
+    assert after["failure_hits"] - before["failure_hits"] == 2
+
+    with open(path, "ab") as f:
+        f.write(b" still broken")
+    assert read_file(ctx, "broken.pdf").startswith("Cannot extract text from 'broken.pdf'")
+    assert extraction_cache.stats()["extractions"] - before["extractions"] == 2
+
+def test_extracted_text_is_removed_with_its_source(ctx, temp_workspace, monkeypatch):
+    extracted = os.path.join(temp_workspace, ".file_agent", "extracted")
+    _write_docx(_safe_path(ctx, "report.docx"), ["Quarterly report"])
+    assert read_file(ctx, "report.docx") == "Quarterly report"
+    assert len(os.listdir(extracted)) == 1
+    delete_file(ctx, "report.docx")
+    assert os.listdir(extracted) == []
+
+    # Deleted outside the tools: found by the next walk of the workspace.
+    _write_docx(_safe_path(ctx, "minutes.docx"), ["Meeting minutes"])
+    assert "Meeting minutes" in answer_question_about_files(ctx, "meeting minutes")
+    os.remove(_safe_path(ctx, "minutes.docx"))
+    monkeypatch.setenv("FILE_AGENT_RESCAN_SECONDS", "0")
+    answer_question_about_files(ctx, "meeting minutes")
+    assert os.listdir(extracted) == []
+
+def test_read_invalid_pdf_reports_extraction_error(ctx):
+    with open(_safe_path(ctx, "broken.pdf"), "wb") as f:
+        f.write(b"%PDF-1.4 not really a pdf")
+    assert read_file(ctx, "broken.pdf").startswith("Cannot extract text from 'broken.pdf'")
+
+def test_find_related_files_ranks_by_content(ctx, temp_workspace):
+    write_file(ctx, "cats.txt", "Cats purr and chase mice. A kitten sleeps all day.")
+    write_file(ctx, "kittens.txt", "The kitten chased mice, then the cats purr together.")
+    write_file(ctx, "budget.txt", "Quarterly budget revenue and invoice totals.")
+    related = find_related_files(ctx, filename="cats.txt")
+    assert related[0]["filename"] == "kittens.txt"
+    assert related[0]["chunks"][0]["start"] == 0
+    assert "cats.txt" not in [r["filename"] for r in related]
+    assert find_related_files(ctx, text="invoice revenue")[0]["filename"] == "budget.txt"
+    assert "error" in find_related_files(ctx, filename="missing.txt")[0]
+
+def test_find_related_files_updates_incrementally(ctx, temp_workspace):
+    from tools.similarity_index import SimilarityIndex, get_similarity_index
+    write_file(ctx, "a.txt", "rocket launch orbit")
+    write_file(ctx, "b.txt", "garden flowers soil")
+    assert find_related_files(ctx, text="orbit")[0]["filename"] == "a.txt"
+    write_file(ctx, "b.txt", "orbit orbit rocket launch")
+    delete_file(ctx, "a.txt")
+    assert [r["filename"] for r in find_related_files(ctx, text="orbit")] == ["b.txt"]
+    index = get_similarity_index(temp_workspace)
+    assert index.count == 1  # the dead rows of a.txt and the old b.txt were compacted away
+    reloaded = SimilarityIndex(temp_workspace)
+    reloaded.load()
+    assert reloaded.files.keys() == {"b.txt"} and reloaded.vectors.shape[0] == 1
+
+def test_find_related_files_saves_only_changed_rows(ctx, temp_workspace):
+    from tools.similarity_index import ROW_BYTES, SimilarityIndex
+    for i in range(4):
+        write_file(ctx, f"doc{i}.txt", f"topic{i} words here")
+    find_related_files(ctx, text="topic0")
+    vectors_path = os.path.join(temp_workspace, ".file_agent", "similarity_vectors.f32")
+    inode = os.stat(vectors_path).st_ino
+    assert os.path.getsize(vectors_path) == 4 * ROW_BYTES
+
+    write_file(ctx, "doc1.txt", "rocket orbit launch")
+    assert find_related_files(ctx, text="rocket orbit")[0]["filename"] == "doc1.txt"
+    # The old row of doc1.txt was zeroed in place and its new row appended.
+    assert os.stat(vectors_path).st_ino == inode and os.path.getsize(vectors_path) == 5 * ROW_BYTES
+    reloaded = SimilarityIndex(temp_workspace)
+    reloaded.load()
+    assert reloaded.files["doc1.txt"]["rows"] == [4] and sum(chunk is None for chunk in reloaded.chunks) == 1
+    assert reloaded.related(text="rocket orbit")[0][0] == "doc1.txt"
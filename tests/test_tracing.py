@@ -0,0 +1,32 @@
+import pytest
+
+from tools.tracing import Histogram, MetricsRegistry, current_trace, span, trace
+
+def test_histogram_quantiles_use_bucket_bounds():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+
+def test_prometheus_rendering_is_cumulative():
+    registry = MetricsRegistry()
+    registry.observe("tool", "read_file", 0.002)
+    registry.observe("tool", "read_file", 0.2)
+    registry.add("file_agent_tool_bytes_read_total", (("name", "read_file"),), 42)
+    text = registry.render_prometheus()
+    assert 'file_agent_span_duration_seconds_bucket{span="tool",name="read_file",le="0.005"} 1' in text
+    assert 'file_agent_span_duration_seconds_bucket{span="tool",name="read_file",le="+Inf"} 2' in text
+    assert 'file_agent_tool_bytes_read_total{name="read_file"} 42' in text
+
+@pytest.mark.asyncio
+async def test_spans_are_collected_on_the_current_trace():
+    with trace("request") as request_trace:
+        assert current_trace() is request_trace
+        with span("tool", "write_file") as attrs:
+            attrs["bytes_written"] = 5
+    assert current_trace() is None
+    kinds = [(s["kind"], s["name"]) for s in request_trace.spans]
+    assert kinds == [("tool", "write_file"), ("request", "request")]
+    assert request_trace.spans[0]["bytes_written"] == 5
@@ -0,0 +1,212 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from pydantic_ai import RunContext
+from typing_extensions import Required, TypedDict
+
+from tools import file_tools
+from tools.file_tools import _safe_path
+from tools.tracing import span
+
+DEFAULT_IO_THREADS = 8
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("FILE_AGENT_IO_THREADS", DEFAULT_IO_THREADS)),
+    thread_name_prefix="file-io",
+)
+
+class AsyncRWLock:
+    """
+    Reader/writer lock for asyncio tasks. Many readers may hold it at once;
+    a writer holds it alone. Waiting writers block new readers so writes are not starved.
+    """
+
+    def __init__(self):
+        self._cond = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @asynccontextmanager
+    async def read(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @asynccontextmanager
+    async def write(self):
+        async with self._cond:
+            self._waiting_writers += 1
+            try:
+                await self._cond.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+class PathLocks:
+    """Registry of per-path reader/writer locks, dropped again once no task uses them."""
+
+    def __init__(self):
+        self._locks = {}
+        self._users = defaultdict(int)
+
+    @asynccontextmanager
+    async def _hold(self, path: str, mode: str):
+        lock = self._locks.get(path)
+        if lock is None:
+            lock = self._locks[path] = AsyncRWLock()
+        self._users[path] += 1
+        try:
+            async with getattr(lock, mode)():
+                yield
+        finally:
+            self._users[path] -= 1
+            if not self._users[path]:
+                del self._users[path]
+                del self._locks[path]
+
+    def reading(self, path: str):
+        return self._hold(path, "read")
+
+    def writing(self, path: str):
+        return self._hold(path, "write")
+
+path_locks = PathLocks()
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the bounded file I/O pool, keeping the caller's context variables."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(_executor, call)
+
+def _run_tool(func, arguments: dict, ctx, *args, **kwargs):
+    """
+    Run a file tool. A caller that wants to know what its tools read (the response
+    cache) puts a callable in deps["observe_read"]; it is called with the tool's
+    name and arguments just before the tool runs.
+    """
+    observe = ctx.deps.get("observe_read")
+    if observe is not None:
+        observe(func.__name__, arguments)
+    return func(ctx, *args, **kwargs)
+
+def _offload(func, lock_mode=None, settle: bool = False):
+    """
+    Wrap a synchronous file tool as a coroutine with the same signature and docstring.
+    With lock_mode "read" or "write", the call holds that lock on the target file;
+    lock_mode may also be a function choosing the mode from the call's arguments.
+    With settle, a tool that reads many files first waits (on the event loop, not
+    on an I/O thread) for the writes a speculative run has staged to be settled.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        arguments = signature.bind(ctx, *args, **kwargs).arguments
+        journal = ctx.deps.get("mutation_journal")
+        if settle and journal is not None:
+            await journal.settled()
+        with span("tool", func.__name__) as attrs:
+            if lock_mode is None:
+                result = await run_blocking(_run_tool, func, arguments, ctx, *args, **kwargs)
+            else:
+                path = _safe_path(ctx, arguments.get("filename"))
+                mode = lock_mode(arguments) if callable(lock_mode) else lock_mode
+                lock = path_locks.reading(path) if mode == "read" else path_locks.writing(path)
+                async with lock:
+                    result = await run_blocking(_run_tool, func, arguments, ctx, *args, **kwargs)
+            if isinstance(arguments.get("content"), str):
+                attrs["bytes_written"] = len(arguments["content"].encode("utf-8"))
+            else:
+                attrs["bytes_read"] = len(str(result).encode("utf-8"))
+        return result
+
+    return wrapper
+
+# Tools that see many files wait for staged writes on the event loop; the filter's
+# decision can take a model round-trip, which must not hold one of the few I/O threads.
+list_files = _offload(file_tools.list_files, settle=True)
+read_file = _offload(file_tools.read_file, lock_mode="read")
+# Appends share the lock so the append batcher can group-commit them; overwrites are exclusive.
+write_file = _offload(
+    file_tools.write_file,
+    lock_mode=lambda arguments: "read" if arguments.get("mode") == "a" else "write",
+)
+delete_file = _offload(file_tools.delete_file, lock_mode="write")
+answer_question_about_files = _offload(file_tools.answer_question_about_files, settle=True)
+search_files = _offload(file_tools.search_files, settle=True)
+find_related_files = _offload(file_tools.find_related_files, settle=True)
+list_changes = _offload(file_tools.list_changes, settle=True)
+
+MAX_BATCH_OPERATIONS = 100
+
+class FileOperation(TypedDict, total=False):
+    op: Required[Literal["read", "write", "append", "delete"]]
+    filename: Required[str]
+    content: str
+
+async def _run_operation(ctx: RunContext, operation: dict) -> str:
+    op = operation.get("op")
+    filename = operation.get("filename", "")
+    if op == "read":
+        return await read_file(ctx, filename)
+    if op in {"write", "append"}:
+        return await write_file(ctx, filename, operation.get("content", ""), mode="a" if op == "append" else "w")
+    if op == "delete":
+        return await delete_file(ctx, filename)
+    return f"Invalid op '{op}'. Use 'read', 'write', 'append' or 'delete'."
+
+async def batch_file_operations(ctx: RunContext, operations: list[FileOperation]) -> list:
+    """
+    Run several file operations in one call and return one result per operation, in order.
+
+    Each operation is {"op": "read" | "write" | "append" | "delete", "filename": ..., "content": ...}
+    ("content" only for write and append). Operations on the same file run in the
+    order given; operations on different files run in parallel.
+    """
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return [{"error": f"Too many operations ({len(operations)}); the limit is {MAX_BATCH_OPERATIONS} per batch."}]
+
+    results = [None] * len(operations)
+    groups = {}
+    for i, operation in enumerate(operations):
+        try:
+            key = _safe_path(ctx, operation.get("filename", ""))
+        except ValueError as e:
+            results[i] = {"index": i, "op": operation.get("op"), "filename": operation.get("filename"), "result": str(e)}
+            continue
+        groups.setdefault(key, []).append(i)
+
+    async def run_group(indexes):
+        for i in indexes:
+            operation = operations[i]
+            try:
+                result = await _run_operation(ctx, operation)
+            except Exception as e:
+                result = f"Error: {e}"
+            results[i] = {"index": i, "op": operation.get("op"), "filename": operation.get("filename"), "result": result}
+
+    with span("tool", "batch_file_operations") as attrs:
+        attrs["operations"] = len(operations)
+        await asyncio.gather(*(run_group(indexes) for indexes in groups.values()))
+    return results
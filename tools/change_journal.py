@@ -0,0 +1,264 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from tools.compressed_storage import open_logical
+from tools.workspace import DEFAULT_RESCAN_SECONDS, iter_workspace_files, state_dir, workspace_rel_path
+
+MANIFEST_FILENAME = "manifest.sqlite3"
+SOURCE_AGENT = "agent"
+SOURCE_EXTERNAL = "external"
+# Files above this size are tracked by size and mtime only, not hashed.
+DEFAULT_HASH_MAX_BYTES = 64 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    time REAL NOT NULL,
+    path TEXT NOT NULL,
+    change TEXT NOT NULL,
+    size INTEGER,
+    sha256 TEXT,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_by_time ON changes (time);
+CREATE TRIGGER IF NOT EXISTS changes_no_update BEFORE UPDATE ON changes
+BEGIN SELECT RAISE(ABORT, 'the change journal is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS changes_no_delete BEFORE DELETE ON changes
+BEGIN SELECT RAISE(ABORT, 'the change journal is append-only'); END;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+_RELATIVE = re.compile(r"(\d+(?:\.\d+)?)\s*(s|m|h|d|w)", re.IGNORECASE)
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def parse_time_point(value: str, now: float = None, session_started: float = None) -> float:
+    """
+    Turn a point in time into seconds since the epoch. Accepts ISO dates and
+    times, relative ages ("30m", "2h", "3d" ago), "now", "today", "yesterday"
+    and "session" (the start of the current conversation).
+    """
+    now = time.time() if now is None else now
+    text = value.strip().lower()
+    if text == "now":
+        return now
+    if text in {"today", "yesterday"}:
+        midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (midnight - timedelta(days=1 if text == "yesterday" else 0)).timestamp()
+    if text == "session":
+        if session_started is None:
+            raise ValueError("The start of this session is not known.")
+        return session_started
+    relative = _RELATIVE.fullmatch(text.removesuffix(" ago"))
+    if relative:
+        return now - float(relative.group(1)) * _UNIT_SECONDS[relative.group(2).lower()]
+    try:
+        return datetime.fromisoformat(value.strip()).timestamp()
+    except ValueError:
+        raise ValueError(
+            f"Unrecognized time '{value}'. Use an ISO date or time, an age such as '2h' or '3d', "
+            "'today', 'yesterday' or 'session'."
+        )
+
+def hash_file(path: str, size: int):
+    """SHA-256 of a file's content, or None above FILE_AGENT_HASH_MAX_BYTES (such files are compared by size and mtime)."""
+    if size > int(os.environ.get("FILE_AGENT_HASH_MAX_BYTES", DEFAULT_HASH_MAX_BYTES)):
+        return None
+    # Hashes the content, so a file's hash does not depend on whether it is stored compressed.
+    with open_logical(path) as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+def _net_change(first: str, last: str):
+    """The change between the state before the first event and after the last one, or None if none."""
+    existed_before = first != "created"
+    exists_after = last != "deleted"
+    if existed_before and exists_after:
+        return "modified"
+    if exists_after:
+        return "created"
+    return "deleted" if existed_before else None
+
+class ChangeJournal:
+    """
+    Persistent manifest of workspace files (size, mtime, SHA-256) in SQLite,
+    feeding an append-only journal of created, modified and deleted files.
+
+    write_file and delete_file record their changes as they happen; edits made
+    outside the tools are found by a rescan that only hashes files whose size
+    or mtime changed. Questions about what changed between two points in time
+    read only the journal entries in that range.
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = os.path.abspath(base_dir)
+        self.path = os.path.join(state_dir(self.base_dir), MANIFEST_FILENAME)
+        self.lock = threading.Lock()
+        self._db = None
+        self._last_rescan = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                db.executescript(_SCHEMA)
+                if db.execute("SELECT 1 FROM meta WHERE key = 'tracking_since'").fetchone() is None:
+                    self._baseline(db)
+            self._db = db
+        return self._db
+
+    def _baseline(self, db: sqlite3.Connection) -> None:
+        """Record the files present when tracking starts, by metadata only and without journal entries."""
+        db.executemany(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, NULL)",
+            ((rel_path, stat.st_size, stat.st_mtime_ns) for rel_path, stat in iter_workspace_files(self.base_dir)),
+        )
+        db.execute("INSERT INTO meta (key, value) VALUES ('tracking_since', ?)", (repr(time.time()),))
+        self._last_rescan = time.monotonic()
+
+    def tracking_since(self) -> float:
+        with self.lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE key = 'tracking_since'").fetchone()
+        return float(row[0])
+
+    def _observe(self, db, rel_path: str, stat, sha256, source: str, row=None, created: bool = False) -> bool:
+        """Update one file's manifest entry and journal the change; False if its content is unchanged."""
+        if row is None:
+            row = db.execute("SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (rel_path,)).fetchone()
+        db.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (rel_path, stat.st_size, stat.st_mtime_ns, sha256),
+        )
+        if row is not None and sha256 is not None and row[2] == sha256:
+            return False  # touched, not changed
+        db.execute(
+            "INSERT INTO changes (time, path, change, size, sha256, source) VALUES (?, ?, ?, ?, ?, ?)",
+            (time.time(), rel_path, "created" if created or row is None else "modified", stat.st_size, sha256, source),
+        )
+        return True
+
+    def _forget(self, db, rel_path: str, source: str) -> bool:
+        if db.execute("DELETE FROM files WHERE path = ?", (rel_path,)).rowcount == 0:
+            return False
+        db.execute(
+            "INSERT INTO changes (time, path, change, size, sha256, source) VALUES (?, ?, 'deleted', NULL, NULL, ?)",
+            (time.time(), rel_path, source),
+        )
+        return True
+
+    def record_write(self, path: str, sha256: str = None, created: bool = False, source: str = SOURCE_AGENT) -> None:
+        """
+        Record that a file was written; sha256 is its new content hash, if the
+        writer knows it. Writers also say whether they created the file, since the
+        journal's first use may have just taken the baseline after the write.
+        """
+        rel_path = workspace_rel_path(self.base_dir, path)
+        if rel_path is None:
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self.lock:
+            db = self._connect()
+            with db:
+                self._observe(db, rel_path, stat, sha256, source, created=created)
+
+    def record_delete(self, path: str, source: str = SOURCE_AGENT) -> None:
+        rel_path = workspace_rel_path(self.base_dir, path)
+        if rel_path is None:
+            return
+        with self.lock:
+            db = self._connect()
+            with db:
+                self._forget(db, rel_path, source)
+
+    def rescan(self, force: bool = False) -> int:
+        """
+        Journal edits made outside the file tools, comparing each file's size and
+        mtime with the manifest and hashing only those that differ. Runs at most
+        once per FILE_AGENT_RESCAN_SECONDS unless forced. Returns the number of changes found.
+        """
+        interval = float(os.environ.get("FILE_AGENT_RESCAN_SECONDS", DEFAULT_RESCAN_SECONDS))
+        with self.lock:
+            db = self._connect()
+            if not force and time.monotonic() - self._last_rescan < interval:
+                return 0
+            manifest = {path: (size, mtime_ns, sha256) for path, size, mtime_ns, sha256 in db.execute("SELECT * FROM files")}
+            changes = 0
+            with db:
+                for rel_path, stat in iter_workspace_files(self.base_dir):
+                    row = manifest.pop(rel_path, None)
+                    if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                        continue
+                    try:
+                        sha256 = hash_file(os.path.join(self.base_dir, rel_path), stat.st_size)
+                    except OSError:
+                        continue
+                    changes += self._observe(db, rel_path, stat, sha256, SOURCE_EXTERNAL, row=row)
+                for rel_path in manifest:
+                    changes += self._forget(db, rel_path, SOURCE_EXTERNAL)
+            self._last_rescan = time.monotonic()
+            return changes
+
+    def changes_between(self, since: float, until: float = None, source: str = None) -> list:
+        """
+        Net change per file between two points in time, newest first. A file created
+        and deleted again in between is left out; one deleted and re-created counts as modified.
+        """
+        query = "SELECT time, path, change, size, source FROM changes WHERE time > ?"
+        params = [since]
+        if until is not None:
+            query += " AND time <= ?"
+            params.append(until)
+        if source is not None:
+            query += " AND source = ?"
+            params.append(source)
+        with self.lock:
+            rows = self._connect().execute(query + " ORDER BY seq", params).fetchall()
+
+        files = {}
+        for changed_at, rel_path, change, size, by in rows:
+            entry = files.setdefault(rel_path, {"first": change, "sources": set(), "events": 0})
+            entry.update(last=change, time=changed_at, size=size)
+            entry["sources"].add(by)
+            entry["events"] += 1
+        result = []
+        for rel_path, entry in files.items():
+            change = _net_change(entry["first"], entry["last"])
+            if change is None:
+                continue
+            result.append({
+                "filename": rel_path,
+                "change": change,
+                "changed_at": entry["time"],
+                "size_bytes": entry["size"],
+                "changed_by": "/".join(sorted(entry["sources"])),
+                "events": entry["events"],
+            })
+        result.sort(key=lambda item: item["changed_at"], reverse=True)
+        return result
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+def get_change_journal(base_dir: str) -> ChangeJournal:
+    """Return the process-wide change journal of a workspace."""
+    base_dir = os.path.abspath(base_dir)
+    with _journals_lock:
+        journal = _journals.get(base_dir)
+        if journal is None:
+            journal = _journals[base_dir] = ChangeJournal(base_dir)
+    return journal
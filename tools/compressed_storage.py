@@ -0,0 +1,369 @@
+import gzip
+import io
+import lzma
+import os
+import struct
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+from tools.workspace import state_dir
+
+# A compressed file is a header followed by independently compressed frames, so
+# a byte range is served by decompressing only the frames it covers, and an
+# append adds frames at the end without touching the rest of the file.
+MAGIC = b"\x89FAZ\r\n\x1a\n"
+_HEADER = struct.Struct("<8sBBH")  # magic, codec id, format version, reserved
+_FRAME = struct.Struct("<II")  # stored bytes, logical bytes
+HEADER_SIZE = _HEADER.size
+FORMAT_VERSION = 1
+DEFAULT_FRAME_BYTES = 256 * 1024
+# Files smaller than this are always stored plain.
+DEFAULT_MIN_BYTES = 64 * 1024
+# Compressed data is only kept when it saves at least this fraction of the bytes.
+MIN_SAVING = 0.1
+# Marks a workspace that has compressed files, so stat-only tools know when to look inside them.
+MARKER_FILENAME = "compressed_files"
+FRAME_INDEX_CACHE_SIZE = 64
+LOGICAL_SIZE_CACHE_SIZE = 65536
+
+class CompressionError(Exception):
+    """Raised when a codec is unknown or its module is not installed."""
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise CompressionError("zstd compression requires the 'zstandard' package (pip install zstandard).")
+    return zstandard
+
+# name -> (id stored in the header, compress, decompress)
+CODECS = {
+    "gzip": (1, lambda data: gzip.compress(data, compresslevel=6, mtime=0), gzip.decompress),
+    "lzma": (2, lambda data: lzma.compress(data, preset=6), lzma.decompress),
+    "zstd": (3, lambda data: _zstd().ZstdCompressor(level=3).compress(data),
+             lambda data: _zstd().ZstdDecompressor().decompress(data)),
+}
+_CODEC_NAMES = {codec_id: name for name, (codec_id, _, _) in CODECS.items()}
+
+class CompressionStats:
+    """Bytes read from disk and handed to readers for compressed files, and files written compressed."""
+
+    def __init__(self):
+        self.totals = {"files_written": 0, "frames_written": 0, "frames_read": 0, "stored_bytes_read": 0, "logical_bytes_read": 0}
+        self._lock = threading.Lock()
+
+    def record(self, **counts) -> None:
+        with self._lock:
+            for name, count in counts.items():
+                self.totals[name] += count
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.totals)
+
+compression_stats = CompressionStats()
+
+def configured_codec():
+    """
+    The codec new files are written with: FILE_AGENT_COMPRESSION is "gzip",
+    "lzma", "zstd" or "auto" (zstd when installed, gzip otherwise); unset or
+    "off" stores files plain.
+    """
+    name = os.environ.get("FILE_AGENT_COMPRESSION", "off").strip().lower()
+    if name in {"", "off", "none", "0"}:
+        return None
+    if name == "auto":
+        try:
+            _zstd()
+            return "zstd"
+        except CompressionError:
+            return "gzip"
+    if name not in CODECS:
+        raise CompressionError(f"Unknown compression '{name}'. Use one of: off, auto, {', '.join(CODECS)}.")
+    if name == "zstd":
+        _zstd()
+    return name
+
+def _frame_bytes() -> int:
+    return max(1, int(os.environ.get("FILE_AGENT_COMPRESSION_FRAME_BYTES", DEFAULT_FRAME_BYTES)))
+
+def encode_frames(codec: str, data: bytes) -> bytes:
+    """Compress data as a sequence of frames (without the file header)."""
+    compress = CODECS[codec][1]
+    frame_bytes = _frame_bytes()
+    parts = []
+    for start in range(0, len(data), frame_bytes):
+        raw = data[start:start + frame_bytes]
+        stored = compress(raw)
+        parts.append(_FRAME.pack(len(stored), len(raw)))
+        parts.append(stored)
+    compression_stats.record(frames_written=len(parts) // 2)
+    return b"".join(parts)
+
+def file_header(codec: str) -> bytes:
+    return _HEADER.pack(MAGIC, CODECS[codec][0], FORMAT_VERSION, 0)
+
+def encode(content: str) -> bytes:
+    """
+    The bytes to store for a file's content: framed and compressed when a codec
+    is configured, the content is at least FILE_AGENT_COMPRESS_MIN_BYTES long and
+    compressing saves space; its plain UTF-8 encoding otherwise.
+    """
+    data = content.encode("utf-8")
+    codec = configured_codec()
+    if codec is None or len(data) < int(os.environ.get("FILE_AGENT_COMPRESS_MIN_BYTES", DEFAULT_MIN_BYTES)):
+        return data
+    stored = file_header(codec) + encode_frames(codec, data)
+    if len(stored) > len(data) * (1 - MIN_SAVING):
+        return data
+    compression_stats.record(files_written=1)
+    return stored
+
+def is_compressed(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+def _read_codec(f):
+    """Return the codec of an open file positioned anywhere, or None if the file is stored plain."""
+    f.seek(0)
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not is_compressed(header):
+        return None
+    _, codec_id, version, _ = _HEADER.unpack(header)
+    if version != FORMAT_VERSION or codec_id not in _CODEC_NAMES:
+        raise CompressionError(f"Unsupported compressed file (codec {codec_id}, version {version}).")
+    return _CODEC_NAMES[codec_id]
+
+def append_data(f, data: bytes) -> bytes:
+    """The bytes to append to a file opened with mode 'a+b': frames if the file is compressed, data itself otherwise."""
+    codec = _read_codec(f)
+    return data if codec is None else encode_frames(codec, data)
+
+class FrameIndex:
+    """Where each frame of a compressed file starts, both in the file and in its logical content."""
+
+    def __init__(self, logical_starts: list, stored_offsets: list, stored_sizes: list, size: int):
+        self.logical_starts = logical_starts
+        self.stored_offsets = stored_offsets
+        self.stored_sizes = stored_sizes
+        self.size = size
+
+    @classmethod
+    def build(cls, f, stored_size: int) -> "FrameIndex":
+        """Walk the frame headers, skipping over their payloads; a torn frame at the end is ignored."""
+        logical_starts, stored_offsets, stored_sizes = [], [], []
+        position, logical = HEADER_SIZE, 0
+        while position + _FRAME.size <= stored_size:
+            f.seek(position)
+            stored, raw = _FRAME.unpack(f.read(_FRAME.size))
+            if position + _FRAME.size + stored > stored_size:
+                break
+            logical_starts.append(logical)
+            stored_offsets.append(position + _FRAME.size)
+            stored_sizes.append(stored)
+            position += _FRAME.size + stored
+            logical += raw
+        return cls(logical_starts, stored_offsets, stored_sizes, logical)
+
+_frame_indexes = OrderedDict()
+_frame_indexes_lock = threading.Lock()
+
+def _get_frame_index(path: str, stat: os.stat_result, f) -> FrameIndex:
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _frame_indexes_lock:
+        cached = _frame_indexes.get(path)
+        if cached and cached[0] == key:
+            _frame_indexes.move_to_end(path)
+            return cached[1]
+    index = FrameIndex.build(f, stat.st_size)
+    with _frame_indexes_lock:
+        _frame_indexes[path] = (key, index)
+        _frame_indexes.move_to_end(path)
+        while len(_frame_indexes) > FRAME_INDEX_CACHE_SIZE:
+            _frame_indexes.popitem(last=False)
+    return index
+
+class CompressedFile:
+    """
+    Read-only view of a compressed file's logical content with the parts of the
+    mmap interface the readers use: len(), indexing, slicing and find(). Only
+    the frames a read covers are decompressed; the last one is kept for the
+    next read, so sequential access decompresses each frame once.
+    """
+
+    def __init__(self, f, codec: str, index: FrameIndex):
+        self._f = f
+        self._decompress = CODECS[codec][2]
+        self.codec = codec
+        self.index = index
+        self.size = index.size
+        self._frame = (-1, b"")
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _load(self, number: int) -> bytes:
+        if self._frame[0] != number:
+            self._f.seek(self.index.stored_offsets[number])
+            stored = self._f.read(self.index.stored_sizes[number])
+            data = self._decompress(stored)
+            compression_stats.record(frames_read=1, stored_bytes_read=len(stored), logical_bytes_read=len(data))
+            self._frame = (number, data)
+        return self._frame[1]
+
+    def read(self, start: int, end: int) -> bytes:
+        """Return logical bytes [start, end)."""
+        start, end = max(0, start), min(self.size, end)
+        if start >= end:
+            return b""
+        starts = self.index.logical_starts
+        number = bisect_right(starts, start) - 1
+        parts = []
+        while number < len(starts) and starts[number] < end:
+            data = self._load(number)
+            parts.append(data[max(0, start - starts[number]):end - starts[number]])
+            number += 1
+        return parts[0] if len(parts) == 1 else b"".join(parts)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, _ = item.indices(self.size)
+            return self.read(start, stop)
+        if item < 0:
+            item += self.size
+        if not 0 <= item < self.size:
+            raise IndexError("index out of range")
+        return self.read(item, item + 1)[0]
+
+    def find(self, sub: bytes, start: int = 0, end: int = None) -> int:
+        end = self.size if end is None else min(end, self.size)
+        position = max(0, start)
+        carry = b""  # the end of the previous frame, for matches that span two frames
+        while position < end:
+            number = bisect_right(self.index.logical_starts, position) - 1
+            frame_start = self.index.logical_starts[number]
+            data = self._load(number)
+            first, last = position - frame_start, min(end, frame_start + len(data)) - frame_start
+            if carry:
+                found = (carry + data[first:first + len(sub) - 1]).find(sub)
+                if found != -1:
+                    return position - len(carry) + found
+            found = data.find(sub, first, last)
+            if found != -1:
+                return frame_start + found
+            carry = data[max(first, last - len(sub) + 1):last] if len(sub) > 1 else b""
+            position = frame_start + last
+        return -1
+
+    def iter_chunks(self):
+        """Yield the logical content frame by frame."""
+        for number in range(len(self.index.logical_starts)):
+            yield self._load(number)
+
+    def close(self) -> None:
+        self._frame = (-1, b"")
+
+def open_compressed(f, path: str, stat: os.stat_result = None):
+    """Return a CompressedFile over an open binary file, or None (with the file rewound) if it is stored plain."""
+    codec = _read_codec(f)
+    if codec is None:
+        f.seek(0)
+        return None
+    return CompressedFile(f, codec, _get_frame_index(path, stat or os.fstat(f.fileno()), f))
+
+class _CompressedStream(io.RawIOBase):
+    """Seekable stream of a compressed file's logical content."""
+
+    def __init__(self, f, compressed: CompressedFile):
+        self._f = f
+        self._compressed = compressed
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._compressed.read(self._position, self._position + len(buffer))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def readall(self) -> bytes:
+        data = b"".join(self._compressed.iter_chunks())[self._position:]
+        self._position = self._compressed.size
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._compressed.size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+def open_logical(path: str):
+    """
+    Open a file for reading its logical content: the file itself if it is
+    stored plain, a decompressing, seekable stream if it is compressed.
+    """
+    f = open(path, "rb")
+    try:
+        compressed = open_compressed(f, path)
+    except BaseException:
+        f.close()
+        raise
+    if compressed is None:
+        return f
+    return io.BufferedReader(_CompressedStream(f, compressed), buffer_size=_frame_bytes())
+
+_logical_sizes = OrderedDict()
+_logical_sizes_lock = threading.Lock()
+
+def logical_size(path: str, stat: os.stat_result = None) -> int:
+    """
+    The size of a file's content, which for a compressed file differs from its
+    size on disk. Remembered per (inode, size, mtime_ns), so an unchanged file
+    is only opened the first time.
+    """
+    stat = stat or os.stat(path)
+    if stat.st_size < HEADER_SIZE:
+        return stat.st_size
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _logical_sizes_lock:
+        cached = _logical_sizes.get(path)
+        if cached and cached[0] == key:
+            _logical_sizes.move_to_end(path)
+            return cached[1]
+    with open(path, "rb") as f:
+        compressed = open_compressed(f, path, stat)
+        size = stat.st_size if compressed is None else compressed.size
+    with _logical_sizes_lock:
+        _logical_sizes[path] = (key, size)
+        _logical_sizes.move_to_end(path)
+        while len(_logical_sizes) > LOGICAL_SIZE_CACHE_SIZE:
+            _logical_sizes.popitem(last=False)
+    return size
+
+def mark_workspace(base_dir: str) -> None:
+    """Note that a workspace has compressed files."""
+    directory = state_dir(base_dir)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, MARKER_FILENAME), "a"):
+        pass
+
+def workspace_has_compressed_files(base_dir: str) -> bool:
+    return os.path.exists(os.path.join(state_dir(base_dir), MARKER_FILENAME))
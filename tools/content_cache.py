@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import OrderedDict
+
+from tools.compressed_storage import logical_size, open_logical
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+class ContentCache:
+    """
+    Process-wide LRU cache of file contents shared by all file tools.
+
+    Entries are keyed by path and validated against (inode, size, mtime_ns), so a
+    file changed behind the agent's back is re-read instead of served stale.
+    Compressed files are cached decompressed.
+    The total size of cached bytes and decoded text is kept under `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(stat: os.stat_result) -> tuple:
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _lookup(self, path: str, key: tuple):
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        if entry["key"] != key:
+            self._drop(path)
+            return None
+        self._entries.move_to_end(path)
+        return entry
+
+    def _drop(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._current_bytes -= entry["cost"]
+
+    def _store(self, path: str, entry: dict) -> None:
+        if entry["cost"] > self.max_bytes // 4:
+            return  # never let one file flush the whole cache
+        self._drop(path)
+        self._entries[path] = entry
+        self._current_bytes += entry["cost"]
+        while self._current_bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._current_bytes -= evicted["cost"]
+            self.evictions += 1
+
+    def _get(self, path: str, decode: bool):
+        key = self._key(os.stat(path))
+        with self._lock:
+            entry = self._lookup(path, key)
+            if entry is not None:
+                self.hits += 1
+                if not decode or entry["text"] is not None:
+                    return entry
+            else:
+                self.misses += 1
+        if entry is None:
+            with open_logical(path) as f:
+                data = f.read()
+            entry = {"key": key, "data": data, "text": None, "cost": len(data)}
+        if decode:
+            entry["text"] = entry["data"].decode("utf-8", errors="replace")
+        with self._lock:
+            self._drop(path)
+            entry["cost"] = len(entry["data"]) + len(entry["text"] or "")
+            self._store(path, entry)
+        return entry
+
+    def read_bytes(self, path: str) -> bytes:
+        """Return the raw bytes of a file, from cache when it has not changed."""
+        return self._get(path, decode=False)["data"]
+
+    def read_text(self, path: str) -> str:
+        """Return the file decoded as UTF-8, caching the decoded text alongside the bytes."""
+        return self._get(path, decode=True)["text"]
+
+    def read_slice(self, path: str, start: int, end: int) -> bytes:
+        """Return bytes [start, end) of a file; files too large to cache are read with a seek."""
+        if logical_size(path) <= self.max_bytes // 4:
+            return self.read_bytes(path)[start:end]
+        with open_logical(path) as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def invalidate(self, path: str) -> None:
+        """Forget a file, e.g. after it was written or deleted."""
+        with self._lock:
+            if path in self._entries:
+                self._drop(path)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+content_cache = ContentCache(int(os.environ.get("FILE_AGENT_CACHE_BYTES", DEFAULT_CACHE_BYTES)))
@@ -0,0 +1,183 @@
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+from tools.compressed_storage import append_data
+
+DEFAULT_APPEND_DELAY_MS = 2.0
+RATE_WINDOW_SECONDS = 60.0
+
+class DurabilityStats:
+    """Counts appends and fsyncs, with per-second rates over a sliding window."""
+
+    def __init__(self, window: float = RATE_WINDOW_SECONDS):
+        self.window = window
+        self.totals = {"appends": 0, "append_batches": 0, "atomic_writes": 0, "fsyncs": 0}
+        self._events = {name: deque() for name in self.totals}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, count: int = 1) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.totals[name] += count
+            events = self._events[name]
+            events.append((now, count))
+            while events and events[0][0] < now - self.window:
+                events.popleft()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self.totals)
+            for name, events in self._events.items():
+                recent = sum(count for ts, count in events if ts >= now - self.window)
+                stats[f"{name}_per_sec"] = round(recent / self.window, 3)
+        return stats
+
+durability_stats = DurabilityStats()
+
+def _fsync_directory(directory: str) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # not supported on this platform
+    try:
+        os.fsync(fd)
+        durability_stats.record("fsyncs")
+    finally:
+        os.close(fd)
+
+def _write_in_place(path: str, data: bytes) -> None:
+    with open(path, "r+b") as f:
+        f.write(data)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+        durability_stats.record("fsyncs")
+
+def atomic_write(path: str, content: str | bytes) -> None:
+    """
+    Replace a file's content (text, or bytes stored as they are) so readers see either the old or the new version:
+    write to a temp file in the same directory, fsync it, rename it over the
+    target and fsync the directory. An existing file's permissions are kept, and
+    a file that is not writable is refused, as an in-place write would be.
+
+    A symlink is followed and its target replaced, so the link stays a link. A
+    file with other hard links is written in place instead, since a rename
+    would split it from them.
+    """
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path) or "."
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    try:
+        stat = os.stat(path)
+        if not os.access(path, os.W_OK):
+            raise PermissionError(f"Permission denied: '{path}'")
+        mode = stat.st_mode & 0o7777
+        if stat.st_nlink > 1:
+            _write_in_place(path, data)
+            durability_stats.record("atomic_writes")
+            return
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            durability_stats.record("fsyncs")
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+    durability_stats.record("atomic_writes")
+
+class _AppendBatch:
+    def __init__(self):
+        self.chunks = []
+        self.done = threading.Event()
+        self.error = None
+
+class _AppendPath:
+    """Appends in flight to one file: the batch still open to joiners and the lock serialising writes."""
+
+    def __init__(self):
+        self.batch = None
+        self.write_lock = threading.Lock()
+        self.writers = 0
+
+class AppendBatcher:
+    """
+    Group commit for appends: concurrent appends to the same file are written
+    and fsynced together. The first caller of a batch becomes its leader and
+    performs the write; the others join the batch while the leader waits for
+    the previous write to finish, and share its outcome. When other appends to
+    the file are already in flight, the leader also waits up to `max_delay`
+    seconds for more to join; a lone append is written at once.
+    """
+
+    def __init__(self, max_delay: float = DEFAULT_APPEND_DELAY_MS / 1000):
+        self.max_delay = max_delay
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def append(self, path: str, content: str) -> None:
+        """Append content to the file, returning once it is durable on disk."""
+        with self._lock:
+            state = self._paths.get(path)
+            if state is None:
+                state = self._paths[path] = _AppendPath()
+            state.writers += 1
+            busy = state.writers > 1
+            batch = state.batch
+            leader = batch is None
+            if leader:
+                batch = state.batch = _AppendBatch()
+            batch.chunks.append(content.encode("utf-8"))
+        durability_stats.record("appends")
+
+        try:
+            if not leader:
+                batch.done.wait()
+                if batch.error is not None:
+                    raise batch.error
+                return
+            if busy and self.max_delay > 0:
+                time.sleep(self.max_delay)
+            self._write(path, state, batch)
+        finally:
+            with self._lock:
+                state.writers -= 1
+                if not state.writers:
+                    del self._paths[path]
+
+    def _write(self, path: str, state: _AppendPath, batch: _AppendBatch) -> None:
+        try:
+            with state.write_lock:
+                with self._lock:
+                    state.batch = None  # later appends start the next batch
+                # Appends to a compressed file are written as new frames at its end.
+                with open(path, "a+b") as f:
+                    f.write(append_data(f, b"".join(batch.chunks)))
+                    f.flush()
+                    os.fsync(f.fileno())
+            durability_stats.record("fsyncs")
+            durability_stats.record("append_batches")
+        except BaseException as e:
+            batch.error = e
+            raise
+        finally:
+            batch.done.set()
+
+append_batcher = AppendBatcher(float(os.environ.get("FILE_AGENT_APPEND_DELAY_MS", DEFAULT_APPEND_DELAY_MS)) / 1000)
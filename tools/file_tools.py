@@ -1,6 +1,22 @@
+import fnmatch
+import hashlib
+import heapq
 import os
+import re
+import sqlite3
 import time
+from datetime import datetime
+from types import SimpleNamespace
 from pydantic_ai import RunContext
+from tools.change_journal import SOURCE_AGENT, SOURCE_EXTERNAL, get_change_journal, parse_time_point
+from tools.compressed_storage import encode, is_compressed, logical_size, mark_workspace, workspace_has_compressed_files
+from tools.content_cache import content_cache
+from tools.durable_io import append_batcher, atomic_write
+from tools.grep_search import DEFAULT_SEARCH_MAX_COMPRESSED_BYTES, DEFAULT_SEARCH_MAX_FILE_BYTES, compile_pattern, iter_search
+from tools.ranged_read import READ_PAGE_BYTES, parse_cursor, read_range
+from tools.search_index import get_index
+from tools.text_extraction import ExtractionError, extraction_cache
+from tools.workspace import iter_workspace_files, note_change
 
 def _safe_path(ctx: RunContext, filename: str) -> str:
     """Resolve absolute, safe path within allowed base directory."""
@@ -13,31 +29,116 @@ def _safe_path(ctx: RunContext, filename: str) -> str:
     
     return os.path.abspath(os.path.join(base_dir, filename))
 
-def list_files(ctx: RunContext) -> list:
+def _record_change(ctx: RunContext, path: str, sha256: str | None = None, created: bool = False, deleted: bool = False) -> None:
     """
-    List all files in the working directory, returning metadata for each file:
-    - filename
-    - size (bytes)
+    Report a change made through the tools to the workspace indexes and the
+    change journal; if journaling fails, the next rescan records it instead.
+    """
+    note_change(ctx.deps["base_directory"], path)
+    extraction_cache.forget(ctx.deps["base_directory"], path)
+    try:
+        journal = get_change_journal(ctx.deps["base_directory"])
+        if deleted:
+            journal.record_delete(path)
+        else:
+            journal.record_write(path, sha256, created=created)
+    except (OSError, sqlite3.Error):
+        pass
+
+def _wait_for_staged(ctx: RunContext) -> None:
+    """
+    Tools that read many files wait for the filter's decision while writes are
+    staged, so they see those writes committed (or dropped) rather than the
+    workspace as it was; only read_file shows staged content directly. The async
+    tools have already waited on the event loop, so this only blocks direct callers.
+    """
+    journal = ctx.deps.get("mutation_journal")
+    if journal is not None:
+        journal.wait_settled()
+
+LIST_SORT_KEYS = {
+    "name": lambda item: item[0],
+    "size": lambda item: item[2],
+    "modified": lambda item: item[1].st_mtime,
+}
+
+def list_files(
+    ctx: RunContext,
+    recursive: bool = False,
+    pattern: str | None = None,
+    extensions: list[str] | None = None,
+    min_size: int | None = None,
+    max_size: int | None = None,
+    modified_after: float | None = None,
+    modified_before: float | None = None,
+    sort_by: str = "name",
+    descending: bool = False,
+    limit: int = 200,
+    cursor: str | None = None,
+) -> list:
+    """
+    List files in the working directory, returning metadata for each file:
+    - filename (relative to the workspace)
+    - size (bytes); files stored compressed also give their size on disk
     - last modified timestamp (human-readable)
     - last modified timestamp (raw seconds since epoch)
+
+    Optional filters: recursive walk into subdirectories, glob `pattern`,
+    `extensions` (e.g. [".txt", ".md"]), size bounds in bytes and modification
+    time bounds in seconds since epoch. Results are sorted by `sort_by`
+    ("name", "size" or "modified") and returned `limit` at a time; when more
+    remain, the last item holds the `next_cursor` to pass for the next page.
     """
     #print("[DEBUG] list_files tool called")
     base_dir = ctx.deps.get("base_directory")
     if not base_dir:
         raise ValueError("Base directory not provided.")
+    _wait_for_staged(ctx)
 
     try:
+        if sort_by not in LIST_SORT_KEYS:
+            return [{"error": f"Invalid sort_by '{sort_by}'. Use one of: {', '.join(LIST_SORT_KEYS)}."}]
+        start = int(cursor) if cursor else 0
+        limit = max(1, limit)
+        suffixes = tuple(e.lower() if e.startswith(".") else f".{e.lower()}" for e in extensions or [])
+        # Only a workspace with compressed files needs to look inside them for their sizes.
+        compressed = workspace_has_compressed_files(base_dir)
+
+        matches = []
+        for rel_path, stat in iter_workspace_files(base_dir, recursive=recursive):
+            if pattern and not fnmatch.fnmatch(rel_path if "/" in pattern else os.path.basename(rel_path), pattern):
+                continue
+            if suffixes and not rel_path.lower().endswith(suffixes):
+                continue
+            size = logical_size(os.path.join(base_dir, rel_path), stat) if compressed else stat.st_size
+            if min_size is not None and size < min_size:
+                continue
+            if max_size is not None and size > max_size:
+                continue
+            if modified_after is not None and stat.st_mtime < modified_after:
+                continue
+            if modified_before is not None and stat.st_mtime > modified_before:
+                continue
+            matches.append((rel_path, stat, size))
+
+        # Only the entries up to the end of the requested page need to be ordered.
+        key = LIST_SORT_KEYS[sort_by]
+        select = heapq.nlargest if descending else heapq.nsmallest
+        page = select(start + limit, matches, key=key)[start:]
+
         files = []
-        for file in os.listdir(base_dir):
-            file_path = os.path.join(base_dir, file)
-            if os.path.isfile(file_path):
-                stat = os.stat(file_path)
-                files.append({
-                    "filename": file,
-                    "size_bytes": stat.st_size,
-                    "modified_time_human": time.ctime(stat.st_mtime),
-                    "modified_time_raw": stat.st_mtime
-                })
+        for rel_path, stat, size in page:
+            item = {
+                "filename": rel_path,
+                "size_bytes": size,
+                "modified_time_human": time.ctime(stat.st_mtime),
+                "modified_time_raw": stat.st_mtime
+            }
+            if size != stat.st_size:
+                item["stored_bytes"] = stat.st_size
+            files.append(item)
+        if start + limit < len(matches):
+            files.append({"next_cursor": str(start + limit), "total_matches": len(matches)})
         #print(f"[DEBUG] list_files returning {len(files)} files")
         #print(f"[DEBUG] {files}")
         return files
@@ -46,22 +147,64 @@ def list_files(ctx: RunContext) -> list:
         #print(f"[DEBUG] list_files error: {e}")
         return [{"error": str(e)}]
 
-def read_file(ctx: RunContext, filename: str) -> str:
-    """Return the content of a file within base directory."""
+def read_file(
+    ctx: RunContext,
+    filename: str,
+    offset: int | None = None,
+    limit: int | None = None,
+    start_line: int | None = None,
+    end_line: int | None = None,
+    cursor: str | None = None,
+) -> str:
+    """
+    Return the content of a file within base directory, one page at a time.
+
+    - offset/limit: read a byte range (limit defaults to 64 KB)
+    - start_line/end_line: read a 1-based, inclusive line range (defaults to 200 lines)
+    - cursor: continue from the `cursor` given at the end of a previous page
+
+    Small files are returned whole. Larger results end with a footer naming the
+    range served and the cursor to pass for the next page.
+    """
     #print(f"[DEBUG] read_file called for {filename}")
     path = _safe_path(ctx, filename)
+    journal = ctx.deps.get("mutation_journal")
+    staged = journal.preview(path, lambda: _current_text(path)) if journal is not None else None
+    if staged is not None:
+        return staged["content"] if staged["exists"] else f"File '{filename}' does not exist."
     if not os.path.exists(path):
         #print(f"[DEBUG] read_file: {filename} does not exist")
         return f"File '{filename}' does not exist."
     if os.path.isdir(path):
         return f"'{filename}' is a directory, not a file."
     try:
-        with open(path, "r") as f:
-            content = f.read()
-        #print(f"[DEBUG] read_file read {len(content)} characters from {filename}")
-        return content
+        # Documents such as PDF and DOCX are served from their cached extracted text.
+        path = extraction_cache.text_path(ctx.deps["base_directory"], path) or path
+        if cursor is None and offset is None and limit is None and start_line is None and end_line is None:
+            if logical_size(path) <= READ_PAGE_BYTES:
+                return content_cache.read_text(path)
+        if cursor:
+            kind, position = parse_cursor(cursor)
+            if kind == "b":
+                offset, start_line, end_line = position, None, None
+            else:
+                offset, start_line, end_line = None, position, None
+        page = read_range(path, offset=offset, limit=limit, start_line=start_line, end_line=end_line)
+        #print(f"[DEBUG] read_file read {len(page['text'])} characters from {filename}")
+        if page["start"] == 0 and page["end"] == page["size"] and "start_line" not in page:
+            return page["text"]
+        if page.get("end_line") is not None:
+            span = f"lines {page['start_line']}-{page['end_line']} of {page['total_lines']}"
+        else:
+            span = f"bytes {page['start']}-{page['end']} of {page['size']}"
+        more = f"; next cursor: '{page['next_cursor']}'" if page["next_cursor"] else "; end of file"
+        return f"{page['text']}\n[{span}{more}]"
     except PermissionError:
         return f"Permission denied when reading '{filename}'."
+    except ExtractionError as e:
+        return f"Cannot extract text from '{filename}': {e}"
+    except ValueError as e:
+        return f"Invalid range for '{filename}': {e}"
     except Exception as e:
         return f"Error reading '{filename}': {e}"
 
@@ -70,8 +213,10 @@ def write_file(ctx: RunContext, filename: str, content: str, mode: str = "w") ->
     Create, append, or overwrite content in a file within the base directory.
     
     mode:
-      - 'w' = overwrite (default)
-      - 'a' = append (adds newline before content automatically)
+      - 'w' = overwrite (default), atomically via a temp file and rename;
+        stored compressed when FILE_AGENT_COMPRESSION is set
+      - 'a' = append (adds newline before content automatically); concurrent
+        appends to the same file are fsynced together
     """
     if mode not in {"w", "a"}:
         return "Invalid mode. Use 'w' to overwrite or 'a' to append."
@@ -81,71 +226,283 @@ def write_file(ctx: RunContext, filename: str, content: str, mode: str = "w") ->
     if os.path.isdir(path):
         return f"Cannot write to '{filename}': it is a directory."
 
+    journal = ctx.deps.get("mutation_journal")
+    if journal is not None:
+        staged = journal.intercept({"op": "write", "path": path, "filename": filename, "content": content, "mode": mode})
+        if staged is not None:
+            return staged
+
+    return _write(ctx, path, filename, content, mode)[1]
+
+def _write(ctx: RunContext, path: str, filename: str, content: str, mode: str) -> tuple:
+    """Perform a write and return (succeeded, message)."""
     try:
-        with open(path, mode) as f:
-            if mode == "a":
-                f.write(" \n" + content)
-            else:
-                f.write(content)
+        existed = os.path.exists(path)
+        if mode == "a":
+            append_batcher.append(path, " \n" + content)
+        else:
+            stored = encode(content)
+            atomic_write(path, stored)
+            if is_compressed(stored):
+                mark_workspace(ctx.deps["base_directory"])
 
+        content_cache.invalidate(path)
+        _record_change(
+            ctx, path, None if mode == "a" else hashlib.sha256(content.encode("utf-8")).hexdigest(), created=not existed
+        )
         action = "Appended to" if mode == "a" else "Wrote to"
-        return f"{action} file '{filename}' successfully."
+        return True, f"{action} file '{filename}' successfully."
 
     except PermissionError:
-        return f"Permission denied when writing to '{filename}'."
+        return False, f"Permission denied when writing to '{filename}'."
     except Exception as e:
-        return f"Error writing to '{filename}': {e}"
+        return False, f"Error writing to '{filename}': {e}"
 
 def delete_file(ctx: RunContext, filename: str) -> str:
     """Delete a file within base directory."""
     #print(f"[DEBUG] delete_file called for {filename}")
     path = _safe_path(ctx, filename)
-    if not os.path.exists(path):
+    journal = ctx.deps.get("mutation_journal")
+    staged = journal.preview(path, lambda: _current_text(path)) if journal is not None else None
+    if not (staged["exists"] if staged is not None else os.path.exists(path)):
         #print(f"[DEBUG] delete_file: {filename} does not exist")
         return f"File '{filename}' does not exist."
     if os.path.isdir(path):
         return f"'{filename}' is a directory, not a file."
+    if journal is not None:
+        staged = journal.intercept({"op": "delete", "path": path, "filename": filename})
+        if staged is not None:
+            return staged
+    return _delete(ctx, path, filename)[1]
+
+def _delete(ctx: RunContext, path: str, filename: str) -> tuple:
+    """Perform a delete and return (succeeded, message)."""
     try:
         os.remove(path)
+        content_cache.invalidate(path)
+        _record_change(ctx, path, deleted=True)
         #print(f"[DEBUG] delete_file removed {filename}")
-        return f"File '{filename}' deleted successfully."
+        return True, f"File '{filename}' deleted successfully."
+    except FileNotFoundError:
+        return False, f"File '{filename}' does not exist."
     except PermissionError:
-        return f"Permission denied when deleting '{filename}'."
+        return False, f"Permission denied when deleting '{filename}'."
+    except Exception as e:
+        return False, f"Error deleting '{filename}': {e}"
+
+def _current_text(path: str):
+    """Return a file's text, or None if it does not exist (used to preview staged mutations)."""
+    return content_cache.read_text(path) if os.path.isfile(path) else None
+
+def apply_mutation(deps: dict, op: dict) -> dict:
+    """
+    Perform a write or delete staged by a MutationJournal, bypassing the journal.
+    Returns {"op", "filename", "ok", "result"}, where "ok" says whether it succeeded.
+    """
+    ctx = SimpleNamespace(deps={k: v for k, v in deps.items() if k != "mutation_journal"})
+    if op["op"] == "delete":
+        ok, message = _delete(ctx, op["path"], op["filename"])
+    else:
+        ok, message = _write(ctx, op["path"], op["filename"], op["content"], op["mode"])
+    return {"op": op["op"], "filename": op["filename"], "ok": ok, "result": message}
+
+def search_files(
+    ctx: RunContext,
+    pattern: str,
+    regex: bool = False,
+    case_sensitive: bool = False,
+    whole_word: bool = False,
+    context_lines: int = 0,
+    max_results: int = 100,
+    file_pattern: str | None = None,
+) -> list:
+    """
+    Search the contents of workspace files for a keyword or regular expression.
+
+    Returns one item per matching line with its filename, 1-based line and
+    column, the line text and, with context_lines, the lines before and after.
+    `pattern` is literal unless `regex` is true; matching is case-insensitive
+    unless `case_sensitive` is true. `file_pattern` is a glob restricting which
+    files are searched. Binary and very large files are skipped. When results
+    are cut off at max_results or files were skipped, the last item says so.
+    """
+    base_dir = ctx.deps.get("base_directory")
+    if not base_dir:
+        raise ValueError("Base directory not provided.")
+    _wait_for_staged(ctx)
+    if not pattern:
+        return [{"error": "A search pattern must be provided."}]
+
+    try:
+        spec = (pattern, regex, case_sensitive, whole_word)
+        try:
+            compile_pattern(*spec)
+        except re.error as e:
+            return [{"error": f"Invalid regular expression '{pattern}': {e}"}]
+        max_results = max(1, max_results)
+        files = [
+            (os.path.join(base_dir, rel_path), rel_path, stat.st_size)
+            for rel_path, stat in iter_workspace_files(base_dir)
+            if not file_pattern or fnmatch.fnmatch(rel_path if "/" in file_pattern else os.path.basename(rel_path), file_pattern)
+        ]
+        max_file_bytes = int(os.environ.get("FILE_AGENT_SEARCH_MAX_BYTES", DEFAULT_SEARCH_MAX_FILE_BYTES))
+        max_compressed_bytes = int(os.environ.get("FILE_AGENT_SEARCH_MAX_COMPRESSED_BYTES", DEFAULT_SEARCH_MAX_COMPRESSED_BYTES))
+
+        matches = []
+        skipped = {}
+        for result in iter_search(files, spec, max(0, context_lines), max_results, max_file_bytes, max_compressed_bytes):
+            matches.extend(result["matches"])
+            if result["skipped"]:
+                skipped[result["filename"]] = result["skipped"]
+        matches.sort(key=lambda m: (m["filename"], m["line"]))
+
+        if len(matches) >= max_results or skipped:
+            matches.append({
+                "truncated": len(matches) >= max_results,
+                "max_results": max_results,
+                "skipped_files": skipped,
+            })
+        return matches
+
+    except Exception as e:
+        return [{"error": f"Error searching files: {e}"}]
+
+def find_related_files(ctx: RunContext, filename: str | None = None, text: str | None = None, top_k: int = 5) -> list:
+    """
+    Find the workspace files most similar in content to `filename` (or to a
+    free-text description in `text`), using local hashed TF-IDF vectors of file
+    chunks. Returns files ranked by similarity, each with its best-matching
+    chunks as byte ranges and scores.
+    """
+    base_dir = ctx.deps.get("base_directory")
+    if not base_dir:
+        raise ValueError("Base directory not provided.")
+    _wait_for_staged(ctx)
+    if not filename and not text:
+        return [{"error": "Provide a filename or a text to compare against."}]
+
+    try:
+        # Imported here so NumPy is only loaded once the tool is first used.
+        from tools.similarity_index import get_similarity_index
+        index = get_similarity_index(base_dir)
+        rel_path = None
+        if filename:
+            rel_path = os.path.relpath(_safe_path(ctx, filename), os.path.abspath(base_dir))
+        related = index.related(text=text, rel_path=rel_path, top_k=max(1, top_k))
+        if related is None:
+            return [{"error": f"File '{filename}' does not exist."}]
+        return [{
+            "filename": name,
+            "score": round(score, 4),
+            "chunks": [{"start": start, "end": end, "score": round(chunk_score, 4)} for start, end, chunk_score in chunks],
+        } for name, score, chunks in related]
+
+    except Exception as e:
+        return [{"error": f"Error finding related files: {e}"}]
+
+CHANGE_SOURCES = {"agent": SOURCE_AGENT, "external": SOURCE_EXTERNAL}
+
+def list_changes(
+    ctx: RunContext,
+    since: str,
+    until: str | None = None,
+    changed_by: str | None = None,
+    limit: int = 200,
+) -> list:
+    """
+    List the files created, modified or deleted between two points in time,
+    newest first, from the workspace change journal instead of reading files.
+
+    `since` and `until` accept an ISO date or time ("2024-05-01",
+    "2024-05-01T14:30"), an age such as "30m", "2h" or "3d", "today",
+    "yesterday", or "session" for the start of this conversation; `until`
+    defaults to now. `changed_by` is "agent" for changes made through these
+    tools or "external" for edits made outside them. Each item gives the
+    filename, its net change, when it last changed and by whom.
+    """
+    base_dir = ctx.deps.get("base_directory")
+    if not base_dir:
+        raise ValueError("Base directory not provided.")
+    _wait_for_staged(ctx)
+    if changed_by is not None and changed_by not in CHANGE_SOURCES:
+        return [{"error": f"Invalid changed_by '{changed_by}'. Use 'agent' or 'external'."}]
+
+    try:
+        try:
+            session_started = ctx.deps.get("session_started")
+            start = parse_time_point(since, session_started=session_started)
+            end = parse_time_point(until, session_started=session_started) if until else None
+        except ValueError as e:
+            return [{"error": str(e)}]
+
+        limit = max(1, limit)
+        journal = get_change_journal(base_dir)
+        journal.rescan()
+        changes = journal.changes_between(start, end, source=CHANGE_SOURCES.get(changed_by))
+        items = [{
+            "filename": change["filename"],
+            "change": change["change"],
+            "changed_at": datetime.fromtimestamp(change["changed_at"]).isoformat(timespec="seconds"),
+            "changed_by": change["changed_by"],
+            "size_bytes": change["size_bytes"],
+        } for change in changes[:limit]]
+        if len(changes) > limit:
+            items.append({"truncated": True, "total_changes": len(changes)})
+        tracking_since = journal.tracking_since()
+        if start < tracking_since:
+            items.append({"note": (
+                "Changes are only known from "
+                f"{datetime.fromtimestamp(tracking_since).isoformat(timespec='seconds')}, when tracking started."
+            )})
+        return items
+
     except Exception as e:
-        return f"Error deleting '{filename}': {e}"
+        return [{"error": f"Error listing changes: {e}"}]
 
-def answer_question_about_files(ctx: RunContext, query: str) -> str:
+def answer_question_about_files(ctx: RunContext, query: str, top_k: int = 5) -> str:
     """
-    Provide a structured summary of all files and their contents to help answer the query.
-    The model will see file-by-file content, improving its ability to reference sources accurately.
+    Rank passages of workspace files against the query with a persistent BM25 index
+    and return only the top_k passages, each labelled with its filename and byte offsets.
     """
     #print(f"[DEBUG] answer_question_about_files called with query: {query}")
     base_dir = ctx.deps.get("base_directory")
     if not base_dir:
         raise ValueError("Base directory not provided.")
+    _wait_for_staged(ctx)
 
     try:
-        files = os.listdir(base_dir)
-        if not files:
+        index = get_index(base_dir)
+        file_names = index.file_names()
+        if not file_names:
             #print("[DEBUG] Workspace contains no files")
             return "Workspace contains no files."
 
-        combined_content = "FILE SUMMARY:\n"
+        hits = index.search(query, top_k=max(1, top_k))
+        if not hits:
+            return (
+                f"No passages matched the query '{query}'.\n"
+                f"Files in workspace: {', '.join(file_names)}"
+            )
 
-        for file in files:
-            file_path = os.path.join(base_dir, file)
-            if os.path.isfile(file_path):
-                with open(file_path, "r") as f:
-                    file_content = f.read().strip()
-                    combined_content += f"\n--- FILE: {file} ---\n{file_content if file_content else '[Empty file]'}\n"
+        combined_content = f"TOP {len(hits)} PASSAGES:\n"
+        for score, passage in hits:
+            path = os.path.join(base_dir, passage["file"])
+            # Offsets of document passages refer to the extracted text.
+            path = extraction_cache.text_path(base_dir, path) or path
+            data = content_cache.read_slice(path, passage["start"], passage["end"])
+            text = data.decode("utf-8", errors="replace").strip()
+            combined_content += (
+                f"\n--- FILE: {passage['file']} [bytes {passage['start']}-{passage['end']}] "
+                f"(score {score:.2f}) ---\n{text if text else '[Empty passage]'}\n"
+            )
 
         #print("[DEBUG] answer_question_about_files compiled content for LLM")
         return (
             f"{combined_content}\n\n"
-            f"Based on the file contents above, please answer the following question:\n"
+            f"Based on the passages above, please answer the following question:\n"
             f"'{query}'"
         )
 
     except Exception as e:
         #print(f"[DEBUG] answer_question_about_files error: {e}")
-        return f"Error analyzing files: {str(e)}"
\ No newline at end of file
+        return f"Error analyzing files: {str(e)}"
@@ -0,0 +1,217 @@
+import functools
+import mmap
+import multiprocessing
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+
+from tools.compressed_storage import CompressionError, open_compressed
+
+# Files are scanned in line-aligned chunks of this size, so a match never has to
+# look further than one chunk and a scan can stop as soon as enough lines matched.
+SEARCH_CHUNK_BYTES = 4 * 1024 * 1024
+# A NUL byte in the first block marks a file as binary; it is skipped without scanning.
+BINARY_SNIFF_BYTES = 8192
+DEFAULT_SEARCH_MAX_FILE_BYTES = 256 * 1024 * 1024
+# Compressed files are searched decompressed in memory, so they get a lower limit.
+DEFAULT_SEARCH_MAX_COMPRESSED_BYTES = 32 * 1024 * 1024
+# Below this many bytes in total the workspace is scanned in-process: starting
+# the pool would cost more than it saves.
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+# Files are handed to the pool in batches of at most this many files / bytes.
+BATCH_MAX_FILES = 64
+BATCH_MAX_BYTES = 16 * 1024 * 1024
+MAX_LINE_CHARS = 300
+# Newlines (for line numbers) and UTF-8 continuation bytes (for columns) are
+# counted in windows of this size, so counting never copies a range out of the mmap.
+COUNT_WINDOW_BYTES = 64 * 1024
+_NEWLINE = re.compile(b"\n")
+_UTF8_CONTINUATION = re.compile(b"[\x80-\xbf]")
+
+_pool = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Lazily start the search worker pool (forkserver where available, since the caller is threaded)."""
+    global _pool
+    if _pool is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(
+            max_workers=int(os.environ.get("FILE_AGENT_SEARCH_PROCESSES", os.cpu_count() or 1)),
+            mp_context=multiprocessing.get_context(method),
+        )
+    return _pool
+
+@functools.lru_cache(maxsize=64)
+def compile_pattern(pattern: str, regex: bool = False, case_sensitive: bool = False, whole_word: bool = False):
+    """Compile a search pattern to a bytes regex; raises re.error for an invalid regex."""
+    source = pattern if regex else re.escape(pattern)
+    if whole_word:
+        source = rf"\b(?:{source})\b"
+    flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+    return re.compile(source.encode("utf-8"), flags)
+
+def _count(byte_pattern, mm, start: int, end: int) -> int:
+    """Count the matches of a one-byte pattern in mm[start:end] without slicing the mmap."""
+    count = 0
+    for pos in range(start, end, COUNT_WINDOW_BYTES):
+        count += len(byte_pattern.findall(mm, pos, min(pos + COUNT_WINDOW_BYTES, end)))
+    return count
+
+def _decode_line(mm, start: int, end: int) -> str:
+    """A line's text cut to MAX_LINE_CHARS; only the bytes that can be shown are copied."""
+    cut = min(end, start + MAX_LINE_CHARS * 4)  # a UTF-8 character takes at most 4 bytes
+    text = mm[start:cut].rstrip(b"\r").decode("utf-8", errors="replace")
+    return text if len(text) <= MAX_LINE_CHARS and cut == end else text[:MAX_LINE_CHARS] + "..."
+
+def _line_bounds(mm, pos: int) -> tuple:
+    start = mm.rfind(b"\n", 0, pos) + 1
+    end = mm.find(b"\n", pos)
+    return start, len(mm) if end == -1 else end
+
+def _context(mm, line_start: int, line_end: int, count: int) -> tuple:
+    before = []
+    pos = line_start
+    while len(before) < count and pos > 0:
+        start = mm.rfind(b"\n", 0, pos - 1) + 1
+        before.insert(0, _decode_line(mm, start, pos - 1))
+        pos = start
+    after = []
+    pos = line_end
+    while len(after) < count and pos + 1 < len(mm):
+        end = mm.find(b"\n", pos + 1)
+        end = len(mm) if end == -1 else end
+        after.append(_decode_line(mm, pos + 1, end))
+        pos = end
+    return before, after
+
+def search_file(path: str, rel_path: str, spec: tuple, context_lines: int = 0, max_matches: int = 100,
+                max_file_bytes: int = DEFAULT_SEARCH_MAX_FILE_BYTES,
+                max_compressed_bytes: int = DEFAULT_SEARCH_MAX_COMPRESSED_BYTES) -> dict:
+    """
+    Search one file, reporting at most one match per line. Compressed files
+    are searched decompressed in memory, up to max_compressed_bytes.
+
+    Returns {"filename", "matches", "skipped"} where skipped is None or the reason
+    ("binary", "too large", "unreadable") the file was not scanned.
+    """
+    result = {"filename": rel_path, "matches": [], "skipped": None}
+    try:
+        size = os.path.getsize(path)
+        if size > max_file_bytes:
+            result["skipped"] = "too large"
+            return result
+        if size == 0:
+            return result
+        with open(path, "rb") as f:
+            compressed = open_compressed(f, path)
+            if compressed is not None and compressed.size > min(max_file_bytes, max_compressed_bytes):
+                result["skipped"] = "too large"
+                return result
+            head = f.read(BINARY_SNIFF_BYTES) if compressed is None else compressed.read(0, BINARY_SNIFF_BYTES)
+            if b"\0" in head:
+                result["skipped"] = "binary"
+                return result
+            # A compressed file is searched in its decompressed form, held in memory.
+            if compressed is None:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                mm = compressed.read(0, compressed.size)
+    except (OSError, ValueError, CompressionError):
+        result["skipped"] = "unreadable"
+        return result
+
+    pattern = compile_pattern(*spec)
+    matches = result["matches"]
+    with mm if isinstance(mm, mmap.mmap) else nullcontext():
+        size = len(mm)
+        line = 1
+        counted_to = 0
+        chunk_start = 0
+        while chunk_start < size and len(matches) < max_matches:
+            # Extend each chunk to the end of its last line so no line straddles two chunks.
+            chunk_end = mm.find(b"\n", min(chunk_start + SEARCH_CHUNK_BYTES, size) - 1)
+            chunk_end = size if chunk_end == -1 else chunk_end + 1
+            pos = chunk_start
+            while pos < chunk_end and len(matches) < max_matches:
+                match = pattern.search(mm, pos, chunk_end)
+                if match is None:
+                    break
+                line_start, line_end = _line_bounds(mm, match.start())
+                line += _count(_NEWLINE, mm, counted_to, line_start)
+                counted_to = line_start
+                prefix = match.start() - line_start
+                entry = {
+                    "filename": rel_path,
+                    "line": line,
+                    "column": prefix - _count(_UTF8_CONTINUATION, mm, line_start, match.start()) + 1,
+                    "text": _decode_line(mm, line_start, line_end),
+                }
+                if context_lines > 0:
+                    entry["before"], entry["after"] = _context(mm, line_start, line_end, context_lines)
+                matches.append(entry)
+                pos = line_end + 1
+            chunk_start = chunk_end
+    return result
+
+def _search_batch(files: list, spec: tuple, context_lines: int, max_matches: int, max_file_bytes: int,
+                  max_compressed_bytes: int) -> list:
+    """Pool worker: search a batch of (path, rel_path) files, stopping once max_matches lines matched."""
+    results = []
+    for path, rel_path in files:
+        result = search_file(path, rel_path, spec, context_lines, max_matches, max_file_bytes, max_compressed_bytes)
+        results.append(result)
+        max_matches -= len(result["matches"])
+        if max_matches <= 0:
+            break
+    return results
+
+def _batches(files: list):
+    batch, batch_bytes = [], 0
+    for path, rel_path, size in files:
+        batch.append((path, rel_path))
+        batch_bytes += size
+        if len(batch) >= BATCH_MAX_FILES or batch_bytes >= BATCH_MAX_BYTES:
+            yield batch
+            batch, batch_bytes = [], 0
+    if batch:
+        yield batch
+
+def iter_search(files: list, spec: tuple, context_lines: int = 0, max_results: int = 100,
+                max_file_bytes: int = DEFAULT_SEARCH_MAX_FILE_BYTES,
+                max_compressed_bytes: int = DEFAULT_SEARCH_MAX_COMPRESSED_BYTES):
+    """
+    Search (path, rel_path, size) files and yield per-file results as soon as they are ready.
+
+    Large workspaces are scanned in parallel across the process pool; once
+    max_results matching lines have been yielded, batches that have not started
+    are cancelled. Small workspaces are scanned in-process.
+    """
+    remaining = max_results
+    if sum(size for _, _, size in files) < PARALLEL_MIN_BYTES:
+        for path, rel_path, _ in files:
+            result = search_file(path, rel_path, spec, context_lines, remaining, max_file_bytes, max_compressed_bytes)
+            remaining -= len(result["matches"])
+            yield result
+            if remaining <= 0:
+                return
+        return
+
+    pool = _get_pool()
+    pending = {
+        pool.submit(_search_batch, batch, spec, context_lines, max_results, max_file_bytes, max_compressed_bytes)
+        for batch in _batches(files)
+    }
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    result["matches"] = result["matches"][:remaining]
+                    remaining -= len(result["matches"])
+                    yield result
+                    if remaining <= 0:
+                        return
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+
+SPECULATIVE = "speculative"
+COMMITTING = "committing"
+COMMITTED = "committed"
+DISCARDED = "discarded"
+
+class MutationJournal:
+    """
+    Holds side-effecting file operations while the request filter has not decided yet.
+
+    While speculative, write_file and delete_file stage their operation here
+    instead of touching the workspace. `commit` applies the staged operations in
+    order and lets later operations run directly; `discard` drops them and
+    keeps ignoring anything a cancelled agent run still tries to change.
+
+    Only read_file shows staged content (see `preview`). Tools that read many
+    files wait for `settled` (or `wait_settled` off the event loop) instead, and
+    see the workspace once the staged operations are committed or dropped.
+    """
+
+    def __init__(self):
+        self.state = SPECULATIVE
+        self._ops = []
+        self._lock = threading.Lock()
+        self._settled = threading.Condition(self._lock)
+        self._settled_events = []  # (loop, asyncio.Event) of tasks waiting in settled()
+
+    def intercept(self, op: dict):
+        """
+        Offer an operation to the journal. Returns None when the caller should
+        perform it now, or the message to report when it was staged or dropped.
+        """
+        with self._lock:
+            if self.state in (COMMITTING, COMMITTED):
+                return None
+            if self.state == DISCARDED:
+                return f"Request was rejected; '{op['filename']}' was not changed."
+            self._ops.append(op)
+        if op["op"] == "delete":
+            return f"File '{op['filename']}' deleted successfully."
+        action = "Appended to" if op.get("mode") == "a" else "Wrote to"
+        return f"{action} file '{op['filename']}' successfully."
+
+    def preview(self, path: str, read_current):
+        """
+        Return {"exists": bool, "content": str | None} for a path with staged
+        operations, replaying them over `read_current()`; None if nothing is staged.
+        """
+        with self._lock:
+            if self.state not in (SPECULATIVE, COMMITTING):
+                return None
+            ops = [op for op in self._ops if op["path"] == path]
+        if not ops:
+            return None
+        content = read_current()
+        for op in ops:
+            if op["op"] == "delete":
+                content = None
+            elif op["mode"] == "a":
+                content = (content or "") + " \n" + op["content"]
+            else:
+                content = op["content"]
+        return {"exists": content is not None, "content": content}
+
+    def _is_settled(self) -> bool:
+        return not self._ops or self.state in (COMMITTED, DISCARDED)
+
+    def wait_settled(self) -> None:
+        """Block while operations are staged and neither committed nor discarded."""
+        with self._settled:
+            self._settled.wait_for(self._is_settled)
+
+    async def settled(self) -> None:
+        """Like wait_settled, but waits on the event loop instead of holding a thread."""
+        event = asyncio.Event()
+        with self._lock:
+            if self._is_settled():
+                return
+            self._settled_events.append((asyncio.get_running_loop(), event))
+        await event.wait()
+
+    def _notify_settled(self) -> None:
+        """Wake everything waiting for the staged operations; called with the lock held."""
+        self._settled.notify_all()
+        for loop, event in self._settled_events:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # the waiter's loop has closed
+        self._settled_events = []
+
+    def staged_paths(self) -> set:
+        with self._lock:
+            return {op["path"] for op in self._ops}
+
+    def begin_commit(self, locked: set) -> bool:
+        """
+        Stop staging, so later operations run directly once their path is free,
+        if every path with staged operations is in `locked`. Returns False when
+        operations on other paths were staged meanwhile and must be locked first.
+        """
+        with self._lock:
+            if self.state != SPECULATIVE:
+                return True
+            if not {op["path"] for op in self._ops} <= locked:
+                return False
+            self.state = COMMITTING
+            return True
+
+    def commit(self, apply) -> list:
+        """Apply staged operations in order with `apply(op)` and return their results."""
+        with self._lock:
+            if self.state not in (SPECULATIVE, COMMITTING):
+                return []
+            try:
+                results = [apply(op) for op in self._ops]
+            finally:
+                self._ops = []
+                self.state = COMMITTED
+                self._notify_settled()
+        return results
+
+    def discard(self) -> int:
+        """Drop all staged operations and return how many there were."""
+        with self._lock:
+            dropped = len(self._ops)
+            self._ops = []
+            self.state = DISCARDED
+            self._notify_settled()
+        return dropped
@@ -0,0 +1,138 @@
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+from tools.compressed_storage import open_compressed
+
+# Default page sizes for read_file when the caller does not ask for a range.
+READ_PAGE_BYTES = 64 * 1024
+READ_PAGE_LINES = 200
+
+# The line index records how many newlines precede each block of this size,
+# so locating any line is a binary search plus a scan of at most one block.
+LINE_INDEX_BLOCK = 64 * 1024
+LINE_INDEX_CACHE_SIZE = 32
+
+class LineIndex:
+    """Sparse newline index over a file: cumulative newline counts per fixed-size block."""
+
+    def __init__(self, size: int, block_counts: array, total_newlines: int, ends_with_newline: bool):
+        self.size = size
+        self.block_counts = block_counts
+        self.total_newlines = total_newlines
+        self.ends_with_newline = ends_with_newline
+
+    @property
+    def total_lines(self) -> int:
+        if self.size == 0:
+            return 0
+        return self.total_newlines + (0 if self.ends_with_newline else 1)
+
+    @classmethod
+    def build(cls, mm, size: int) -> "LineIndex":
+        """Scan the mapped file once, counting newlines block by block."""
+        block_counts = array("Q")
+        total = 0
+        for start in range(0, size, LINE_INDEX_BLOCK):
+            block_counts.append(total)
+            total += mm[start:start + LINE_INDEX_BLOCK].count(b"\n")
+        ends_with_newline = size > 0 and mm[size - 1:size] == b"\n"
+        return cls(size, block_counts, total, ends_with_newline)
+
+    def line_start(self, mm, line: int) -> int:
+        """Return the byte offset where 1-based `line` starts (file size if past the end)."""
+        if line <= 1:
+            return 0
+        target = line - 1  # number of newlines that precede the line
+        if target > self.total_newlines:
+            return self.size
+        block = bisect_right(self.block_counts, target - 1) - 1
+        seen = self.block_counts[block]
+        pos = block * LINE_INDEX_BLOCK
+        while True:
+            newline = mm.find(b"\n", pos)
+            seen += 1
+            if seen == target:
+                return newline + 1
+            pos = newline + 1
+
+_line_indexes = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+def get_line_index(path: str, stat: os.stat_result, mm) -> LineIndex:
+    """Return a cached LineIndex for the file, rebuilding it if the file changed."""
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _line_indexes_lock:
+        cached = _line_indexes.get(path)
+        if cached and cached[0] == key:
+            _line_indexes.move_to_end(path)
+            return cached[1]
+    index = LineIndex.build(mm, len(mm))
+    with _line_indexes_lock:
+        _line_indexes[path] = (key, index)
+        _line_indexes.move_to_end(path)
+        while len(_line_indexes) > LINE_INDEX_CACHE_SIZE:
+            _line_indexes.popitem(last=False)
+    return index
+
+def _utf8_boundary(mm, start: int, pos: int) -> int:
+    """Move pos back so the page does not end inside a multi-byte UTF-8 sequence."""
+    back = pos
+    while back > start and back > pos - 3 and (mm[back] & 0xC0) == 0x80:
+        back -= 1
+    return back if back > start else pos
+
+def parse_cursor(cursor: str):
+    """Decode a continuation cursor into ('b', offset) or ('l', line)."""
+    kind, _, value = (cursor or "").partition(":")
+    if kind not in {"b", "l"} or not value.isdigit():
+        raise ValueError(f"Invalid cursor '{cursor}'.")
+    return kind, int(value)
+
+def read_range(path: str, offset=None, limit=None, start_line=None, end_line=None) -> dict:
+    """
+    Read part of a file through mmap without loading the rest of it; of a
+    compressed file, only the frames covering the range are decompressed.
+
+    Byte mode uses offset/limit; line mode uses 1-based inclusive start_line/end_line.
+    Returns a dict with the decoded text, the byte span served, the file size,
+    and `next_cursor` when more content follows the page.
+    """
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        compressed = open_compressed(f, path, stat)
+        size = stat.st_size if compressed is None else compressed.size
+        if size == 0:
+            return {"text": "", "start": 0, "end": 0, "size": 0, "next_cursor": None}
+        with compressed or mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            result = {"size": size}
+            if start_line is not None or end_line is not None:
+                index = get_line_index(path, stat, mm)
+                first = max(1, start_line or 1)
+                last = end_line if end_line is not None else first + READ_PAGE_LINES - 1
+                if last < first:
+                    raise ValueError("end_line must be greater than or equal to start_line.")
+                start = index.line_start(mm, first)
+                end = index.line_start(mm, last + 1)
+                max_bytes = limit or READ_PAGE_BYTES
+                result.update(total_lines=index.total_lines, start_line=first)
+                if end - start > max_bytes:
+                    # Lines too long for one page: continue in byte mode.
+                    end = _utf8_boundary(mm, start, start + max_bytes)
+                    result["next_cursor"] = f"b:{end}"
+                    result["end_line"] = None
+                else:
+                    last = min(last, index.total_lines)
+                    result["end_line"] = last if last >= first else None
+                    result["next_cursor"] = f"l:{last + 1}" if last < index.total_lines else None
+            else:
+                start = min(max(0, offset or 0), size)
+                end = min(size, start + (limit or READ_PAGE_BYTES))
+                if end < size:
+                    end = _utf8_boundary(mm, start, end)
+                result["next_cursor"] = f"b:{end}" if end < size else None
+            result.update(text=mm[start:end].decode("utf-8", errors="replace"), start=start, end=end)
+            return result
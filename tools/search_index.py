@@ -0,0 +1,260 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from tools.content_cache import content_cache
+from tools.text_extraction import ExtractionError, extraction_cache
+from tools.workspace import ChangeFeed, state_dir
+
+INDEX_FILENAME = "bm25_index.sqlite3"
+INDEX_VERSION = 2
+
+# Passages are cut on line boundaries once they reach this many bytes, so a
+# ranked hit points at a small region of the file rather than the whole file.
+PASSAGE_BYTES = 1024
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS passages (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    start_byte INTEGER NOT NULL,
+    end_byte INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    tf TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS passages_by_file ON passages (file);
+"""
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by do does for from has have how i in is it its me "
+    "of on or please that the their them there these this to was what when "
+    "where which who why will with you your".split()
+)
+
+def tokenize(text: str) -> list:
+    """Lowercase the text and split it into alphanumeric terms, dropping stopwords."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+def split_passages(data: bytes) -> list:
+    """Split raw file bytes into (start, end) byte ranges aligned to line boundaries."""
+    passages = []
+    start = 0
+    pos = 0
+    size = len(data)
+    while pos < size:
+        newline = data.find(b"\n", pos)
+        line_end = size if newline == -1 else newline + 1
+        if line_end - start >= PASSAGE_BYTES:
+            passages.append((start, line_end))
+            start = line_end
+        pos = line_end
+    if start < size:
+        passages.append((start, size))
+    return passages
+
+class BM25Index:
+    """
+    Incrementally maintained BM25 index over fixed-size passages of workspace files.
+
+    Per-passage term frequencies are kept in SQLite, and an update only writes
+    the rows of the files that changed. Postings lists are rebuilt once when
+    the index is loaded and then kept in memory, so a query only touches the
+    postings of its own terms. Which files to re-check comes from a ChangeFeed,
+    so a query does not walk the workspace.
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.path = os.path.join(state_dir(base_dir), INDEX_FILENAME)
+        self.files = {}
+        self.passages = {}
+        self.postings = {}
+        self.next_id = 0
+        self.total_length = 0
+        self.lock = threading.Lock()
+        self.feed = ChangeFeed(base_dir)
+        self._db = None
+        self._data_version = None
+
+    # -- persistence -----------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                db.executescript(_SCHEMA)
+                row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+                if row is None or row[0] != str(INDEX_VERSION):
+                    db.execute("DELETE FROM files")
+                    db.execute("DELETE FROM passages")
+                    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(INDEX_VERSION),))
+            self._db = db
+        return self._db
+
+    def load(self) -> None:
+        """Load the on-disk index if another process changed it since the last load."""
+        db = self._connect()
+        data_version = db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self.files = {
+            rel_path: {"size": size, "mtime_ns": mtime_ns, "passages": []}
+            for rel_path, size, mtime_ns in db.execute("SELECT path, size, mtime_ns FROM files")
+        }
+        self.passages = {}
+        self.postings = {}
+        self.total_length = 0
+        self.next_id = 0
+        for pid, rel_path, start, end, length, tf in db.execute(
+            "SELECT id, file, start_byte, end_byte, length, tf FROM passages ORDER BY id"
+        ):
+            tf = json.loads(tf)
+            self.passages[pid] = {"file": rel_path, "start": start, "end": end, "length": length, "tf": tf}
+            self.files[rel_path]["passages"].append(pid)
+            self.total_length += length
+            self.next_id = pid + 1
+            for term, count in tf.items():
+                self.postings.setdefault(term, {})[pid] = count
+        self._data_version = data_version
+
+    def save(self, rel_paths) -> None:
+        """Write the rows of the given files, in one transaction."""
+        db = self._connect()
+        with db:
+            for rel_path in rel_paths:
+                db.execute("DELETE FROM passages WHERE file = ?", (rel_path,))
+                entry = self.files.get(rel_path)
+                if entry is None:
+                    db.execute("DELETE FROM files WHERE path = ?", (rel_path,))
+                    continue
+                db.execute(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                    (rel_path, entry["size"], entry["mtime_ns"]),
+                )
+                db.executemany(
+                    "INSERT INTO passages (id, file, start_byte, end_byte, length, tf) VALUES (?, ?, ?, ?, ?, ?)",
+                    ((pid, rel_path, self.passages[pid]["start"], self.passages[pid]["end"],
+                      self.passages[pid]["length"], json.dumps(self.passages[pid]["tf"])) for pid in entry["passages"]),
+                )
+
+    # -- maintenance -----------------------------------------------------
+
+    def _remove_file(self, rel_path: str) -> None:
+        for pid in self.files.pop(rel_path, {}).get("passages", []):
+            passage = self.passages.pop(pid)
+            self.total_length -= passage["length"]
+            for term in passage["tf"]:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(pid, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def _add_file(self, rel_path: str, stat: os.stat_result, data: bytes) -> None:
+        name_terms = tokenize(rel_path)
+        pids = []
+        for start, end in split_passages(data):
+            terms = tokenize(data[start:end].decode("utf-8", errors="replace"))
+            terms.extend(name_terms)
+            tf = dict(Counter(terms))
+            pid = self.next_id
+            self.next_id += 1
+            self.passages[pid] = {"file": rel_path, "start": start, "end": end, "length": len(terms), "tf": tf}
+            self.total_length += len(terms)
+            for term, count in tf.items():
+                self.postings.setdefault(term, {})[pid] = count
+            pids.append(pid)
+        self.files[rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "passages": pids}
+
+    def update(self) -> list:
+        """
+        Bring the index in line with the files the change feed reports, using
+        file size and mtime. Only new or modified files are re-read; documents
+        such as PDF and DOCX are indexed by their extracted text. Returns the
+        files whose entries changed.
+        """
+        walked, current = self.feed.poll()
+        if walked:
+            extraction_cache.prune(self.base_dir, current)
+        stale = []
+        for rel_path, stat in current.items():
+            entry = self.files.get(rel_path)
+            if stat is None or (entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns):
+                continue
+            stale.append((rel_path, stat))
+        gone = [p for p in self.files if p not in current] if walked else [p for p, stat in current.items() if stat is None and p in self.files]
+        changed = []
+        # Documents are indexed by their extracted text; start extracting them all in parallel.
+        extraction_cache.prefetch(self.base_dir, [os.path.join(self.base_dir, rel_path) for rel_path, _ in stale])
+        for rel_path, stat in stale:
+            path = os.path.join(self.base_dir, rel_path)
+            try:
+                data = content_cache.read_bytes(extraction_cache.text_path(self.base_dir, path) or path)
+            except ExtractionError:
+                data = b""  # indexed without passages until the file changes
+            except OSError:
+                continue
+            self._remove_file(rel_path)
+            self._add_file(rel_path, stat, data)
+            changed.append(rel_path)
+        for rel_path in gone:
+            self._remove_file(rel_path)
+            changed.append(rel_path)
+        return changed
+
+    # -- querying --------------------------------------------------------
+
+    def file_names(self) -> list:
+        with self.lock:
+            return sorted(self.files)
+
+    def search(self, query: str, top_k: int = 5) -> list:
+        """Return the top_k passages as (score, passage_dict) ranked by BM25."""
+        terms = set(tokenize(query))
+        with self.lock:
+            n = len(self.passages)
+            if not terms or not n:
+                return []
+            avg_length = self.total_length / n if self.total_length else 1.0
+            scores = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for pid, tf in postings.items():
+                    length = self.passages[pid]["length"]
+                    norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+                    scores[pid] = scores.get(pid, 0.0) + idf * norm
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            return [(score, self.passages[pid]) for pid, score in ranked]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(base_dir: str) -> BM25Index:
+    """Return the process-wide index for a workspace, synced with disk and the changed files."""
+    base_dir = os.path.abspath(base_dir)
+    with _indexes_lock:
+        index = _indexes.get(base_dir)
+        if index is None:
+            index = _indexes[base_dir] = BM25Index(base_dir)
+    with index.lock:
+        index.load()
+        changed = index.update()
+        if changed:
+            index.save(changed)
+    return index
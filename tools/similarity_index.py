@@ -0,0 +1,336 @@
+import math
+import os
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from tools.content_cache import content_cache
+from tools.search_index import split_passages, tokenize
+from tools.text_extraction import ExtractionError, extraction_cache
+from tools.workspace import ChangeFeed, state_dir
+
+METADATA_FILENAME = "similarity_index.sqlite3"
+VECTORS_FILENAME = "similarity_vectors.f32"
+SIMILARITY_INDEX_VERSION = 2
+
+# Terms are hashed into this many signed features (a power of two), so the
+# matrix width is fixed no matter how large the vocabulary grows.
+HASH_FEATURES = 1024
+ROW_BYTES = HASH_FEATURES * 4  # one float32 row of the vector file
+# Dead rows left by changed or deleted files are compacted away once they
+# make up this fraction of the matrix.
+COMPACT_DEAD_FRACTION = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    start_byte INTEGER NOT NULL,
+    end_byte INTEGER NOT NULL
+);
+"""
+
+@lru_cache(maxsize=65536)
+def _feature(term: str) -> tuple:
+    """Stable (bucket, sign) of a term; crc32 rather than hash() so it is the same in every process."""
+    h = zlib.crc32(term.encode("utf-8"))
+    return h & (HASH_FEATURES - 1), 1.0 if h >> 31 else -1.0
+
+def vectorize(text: str) -> np.ndarray:
+    """Hashed, sublinear term-frequency vector (1 + log tf) of a text."""
+    vector = np.zeros(HASH_FEATURES, dtype=np.float32)
+    for term, count in Counter(tokenize(text)).items():
+        bucket, sign = _feature(term)
+        vector[bucket] += sign * (1.0 + math.log(count))
+    return vector
+
+class SimilarityIndex:
+    """
+    Hashed TF-IDF vectors of workspace file chunks, kept as one NumPy matrix.
+
+    Raw term-frequency rows are updated incrementally by file size and mtime,
+    for the files a ChangeFeed reports; IDF weighting and row normalisation are
+    applied once after each change, so a query is a single matrix-vector
+    product. On disk, rows live in a flat float32 file where new rows are
+    appended and rows of changed files are zeroed in place, and the chunk
+    metadata lives in SQLite; only compaction rewrites the whole matrix.
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.metadata_path = os.path.join(state_dir(base_dir), METADATA_FILENAME)
+        self.vectors_path = os.path.join(state_dir(base_dir), VECTORS_FILENAME)
+        self.vectors = np.zeros((0, HASH_FEATURES), dtype=np.float32)
+        self.count = 0
+        self.chunks = []  # per row: [rel_path, start, end], or None once dead
+        self.files = {}  # rel_path -> {"size", "mtime_ns", "rows"}
+        self.df = np.zeros(HASH_FEATURES, dtype=np.float32)
+        self.lock = threading.Lock()
+        self.feed = ChangeFeed(base_dir)
+        self._db = None
+        self._data_version = None
+        self._saved_count = 0
+        self._dirty_rows = set()
+        self._dirty_files = set()
+        self._rewrite = False
+        self._weighted = None
+        self._row_files = None
+        self._file_names = []
+        self.idf = None
+
+    # -- persistence -----------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.metadata_path), exist_ok=True)
+            db = sqlite3.connect(self.metadata_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                db.executescript(_SCHEMA)
+                version = f"{SIMILARITY_INDEX_VERSION}/{HASH_FEATURES}"
+                row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+                if row is None or row[0] != version:
+                    db.execute("DELETE FROM files")
+                    db.execute("DELETE FROM chunks")
+                    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+                    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('count', '0')")
+            self._db = db
+        return self._db
+
+    def load(self) -> None:
+        """Load the on-disk index if another process changed it since the last load."""
+        db = self._connect()
+        data_version = db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        row = db.execute("SELECT value FROM meta WHERE key = 'count'").fetchone()
+        count = int(row[0]) if row else 0
+        try:
+            vectors = np.fromfile(self.vectors_path, dtype=np.float32, count=count * HASH_FEATURES)
+        except (OSError, ValueError):
+            vectors = np.zeros(0, dtype=np.float32)
+        if vectors.size != count * HASH_FEATURES:
+            # The rows are missing or cut short: start over and index the whole workspace again.
+            count, vectors = 0, np.zeros(0, dtype=np.float32)
+            with db:
+                db.execute("DELETE FROM files")
+                db.execute("DELETE FROM chunks")
+            self._rewrite = True
+            self.feed.reset()
+        self.vectors = vectors.reshape(count, HASH_FEATURES)
+        self.count = self._saved_count = count
+        self.chunks = [None] * count
+        self.files = {
+            rel_path: {"size": size, "mtime_ns": mtime_ns, "rows": []}
+            for rel_path, size, mtime_ns in db.execute("SELECT path, size, mtime_ns FROM files")
+        }
+        for row, rel_path, start, end in db.execute("SELECT row, file, start_byte, end_byte FROM chunks ORDER BY row"):
+            self.chunks[row] = [rel_path, start, end]
+            self.files[rel_path]["rows"].append(row)
+        self.df = np.count_nonzero(self.vectors, axis=0).astype(np.float32)
+        self._dirty_rows, self._dirty_files = set(), set()
+        self._weighted = None
+
+    def save(self) -> None:
+        """
+        Write the rows and files changed since the last save: zeroed rows are
+        patched and new rows appended in the vector file, then the metadata that
+        refers to them is committed. After a compaction everything is rewritten.
+        """
+        os.makedirs(os.path.dirname(self.vectors_path), exist_ok=True)
+        if self._rewrite:
+            tmp_path = self.vectors_path + ".tmp"
+            self.vectors[:self.count].tofile(tmp_path)
+            os.replace(tmp_path, self.vectors_path)
+        else:
+            with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+                f.truncate(self._saved_count * ROW_BYTES)  # rows appended before an interrupted save
+                for row in sorted(row for row in self._dirty_rows if row < self._saved_count):
+                    f.seek(row * ROW_BYTES)
+                    f.write(self.vectors[row].tobytes())
+                f.seek(self._saved_count * ROW_BYTES)
+                f.write(self.vectors[self._saved_count:self.count].tobytes())
+
+        db = self._connect()
+        with db:
+            if self._rewrite:
+                db.execute("DELETE FROM chunks")
+                dirty_files = self.files.keys() | self._dirty_files
+            else:
+                db.executemany("DELETE FROM chunks WHERE row = ?", ((row,) for row in self._dirty_rows))
+                dirty_files = self._dirty_files
+            for rel_path in dirty_files:
+                entry = self.files.get(rel_path)
+                if entry is None:
+                    db.execute("DELETE FROM files WHERE path = ?", (rel_path,))
+                    continue
+                db.execute(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                    (rel_path, entry["size"], entry["mtime_ns"]),
+                )
+                db.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, file, start_byte, end_byte) VALUES (?, ?, ?, ?)",
+                    ((row, *self.chunks[row]) for row in entry["rows"]),
+                )
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('count', ?)", (str(self.count),))
+        self._saved_count = self.count
+        self._dirty_rows, self._dirty_files = set(), set()
+        self._rewrite = False
+
+    # -- maintenance -----------------------------------------------------
+
+    def _remove_file(self, rel_path: str) -> None:
+        for row in self.files.pop(rel_path, {}).get("rows", []):
+            self.df -= self.vectors[row] != 0
+            self.vectors[row] = 0.0
+            self.chunks[row] = None
+            self._dirty_rows.add(row)
+        self._dirty_files.add(rel_path)
+
+    def _add_file(self, rel_path: str, stat: os.stat_result, data: bytes) -> None:
+        ranges = split_passages(data)
+        if self.count + len(ranges) > len(self.vectors):
+            capacity = max(self.count + len(ranges), 2 * len(self.vectors), 64)
+            grown = np.zeros((capacity, HASH_FEATURES), dtype=np.float32)
+            grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+        rows = []
+        for start, end in ranges:
+            row = self.count
+            self.vectors[row] = vectorize(data[start:end].decode("utf-8", errors="replace"))
+            self.df += self.vectors[row] != 0
+            self.chunks.append([rel_path, start, end])
+            self.count += 1
+            rows.append(row)
+        self.files[rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "rows": rows}
+        self._dirty_files.add(rel_path)
+
+    def _compact(self) -> None:
+        live = [row for row in range(self.count) if self.chunks[row] is not None]
+        renumber = {old: new for new, old in enumerate(live)}
+        self.vectors = self.vectors[live]
+        self.chunks = [self.chunks[row] for row in live]
+        self.count = len(live)
+        for entry in self.files.values():
+            entry["rows"] = [renumber[row] for row in entry["rows"]]
+        self._rewrite = True
+
+    def update(self) -> bool:
+        """
+        Bring the matrix in line with the files the change feed reports, using
+        file size and mtime. Only new or modified files are re-read. Returns True if anything changed.
+        """
+        walked, current = self.feed.poll()
+        stale = []
+        for rel_path, stat in current.items():
+            entry = self.files.get(rel_path)
+            if stat is None or (entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns):
+                continue
+            stale.append((rel_path, stat))
+        gone = [p for p in self.files if p not in current] if walked else [p for p, stat in current.items() if stat is None and p in self.files]
+        changed = False
+        extraction_cache.prefetch(self.base_dir, [os.path.join(self.base_dir, rel_path) for rel_path, _ in stale])
+        for rel_path, stat in stale:
+            path = os.path.join(self.base_dir, rel_path)
+            try:
+                data = content_cache.read_bytes(extraction_cache.text_path(self.base_dir, path) or path)
+            except ExtractionError:
+                data = b""
+            except OSError:
+                continue
+            self._remove_file(rel_path)
+            self._add_file(rel_path, stat, data)
+            changed = True
+        for rel_path in gone:
+            self._remove_file(rel_path)
+            changed = True
+        if changed:
+            dead = sum(1 for chunk in self.chunks if chunk is None)
+            if dead and dead >= COMPACT_DEAD_FRACTION * self.count:
+                self._compact()
+            self._weighted = None
+        return changed
+
+    # -- querying --------------------------------------------------------
+
+    def _prepare(self) -> None:
+        """Apply IDF weights and L2-normalise every row (once per change)."""
+        if self._weighted is not None:
+            return
+        live = sum(1 for chunk in self.chunks if chunk is not None)
+        self.idf = (np.log((1.0 + live) / (1.0 + self.df)) + 1.0).astype(np.float32)
+        weighted = self.vectors[:self.count] * self.idf
+        norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+        np.divide(weighted, norms, out=weighted, where=norms > 0)
+        self._file_names = sorted(self.files)
+        file_ids = {name: i for i, name in enumerate(self._file_names)}
+        self._row_files = np.full(self.count, -1, dtype=np.int64)
+        for name, entry in self.files.items():
+            self._row_files[entry["rows"]] = file_ids[name]
+        self._weighted = weighted
+
+    def _query_vector(self, text: str = None, rel_path: str = None):
+        """Normalised TF-IDF query vector for free text or for a whole indexed file (None if empty)."""
+        self._prepare()
+        if rel_path is not None:
+            rows = self.files[rel_path]["rows"]
+            vector = self._weighted[rows].sum(axis=0) if rows else np.zeros(HASH_FEATURES, dtype=np.float32)
+        else:
+            vector = vectorize(text or "") * self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def related(self, text: str = None, rel_path: str = None, top_k: int = 5, chunks_per_file: int = 3):
+        """
+        Rank files by the cosine similarity of their best chunk to the query.
+        Returns [(rel_path, score, [(start, end, score), ...])], excluding rel_path
+        itself, or None if rel_path is not indexed.
+        """
+        with self.lock:
+            if rel_path is not None and rel_path not in self.files:
+                return None
+            query = self._query_vector(text=text, rel_path=rel_path)
+            if query is None or not self.count:
+                return []
+            scores = self._weighted @ query
+            scores[self._row_files < 0] = -np.inf
+            if rel_path is not None:
+                scores[self.files[rel_path]["rows"]] = -np.inf
+
+            best = np.full(len(self._file_names), -np.inf, dtype=np.float32)
+            np.maximum.at(best, self._row_files[self._row_files >= 0], scores[self._row_files >= 0])
+            ranked = [i for i in np.argsort(-best)[:top_k] if best[i] > 0]
+
+            results = []
+            for i in ranked:
+                name = self._file_names[i]
+                rows = np.array(self.files[name]["rows"], dtype=np.int64)
+                top_rows = rows[np.argsort(-scores[rows])[:chunks_per_file]]
+                chunks = [(self.chunks[row][1], self.chunks[row][2], float(scores[row])) for row in top_rows if scores[row] > 0]
+                results.append((name, float(best[i]), chunks))
+            return results
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_similarity_index(base_dir: str) -> SimilarityIndex:
+    """Return the process-wide similarity index for a workspace, synced with disk and the changed files."""
+    base_dir = os.path.abspath(base_dir)
+    with _indexes_lock:
+        index = _indexes.get(base_dir)
+        if index is None:
+            index = _indexes[base_dir] = SimilarityIndex(base_dir)
+    with index.lock:
+        index.load()
+        if index.update():
+            index.save()
+        index._prepare()
+    return index
@@ -0,0 +1,273 @@
+import hashlib
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+from tools.durable_io import atomic_write
+from tools.workspace import state_dir
+
+EXTRACTED_DIR_NAME = "extracted"
+SNIFF_BYTES = 4096
+DEFAULT_EXTRACT_WORKERS = 2
+HASH_CHUNK_BYTES = 1024 * 1024
+
+class ExtractionError(Exception):
+    """Raised when a document's text cannot be extracted."""
+
+# (name, sniff(head_bytes, path) -> bool, extract(path) -> str), most recently registered first.
+_extractors = []
+
+def register_extractor(name: str, sniff):
+    """
+    Decorator registering `extract(path) -> str` for files whose first bytes
+    satisfy `sniff(head, path)`. Later registrations take precedence.
+    """
+    def decorator(extract):
+        _extractors.insert(0, (name, sniff, extract))
+        return extract
+    return decorator
+
+def unregister_extractor(name: str) -> None:
+    """Remove a registered extractor, restoring the one it took precedence over."""
+    for i, (registered, _, _) in enumerate(_extractors):
+        if registered == name:
+            del _extractors[i]
+            return
+
+def sniff_format(path: str):
+    """Return the name of the extractor for a file, or None for plain text."""
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    for name, sniff, _ in _extractors:
+        if sniff(head, path):
+            return name
+    return None
+
+def _extractor(name: str):
+    for registered, _, extract in _extractors:
+        if registered == name:
+            return extract
+    raise ExtractionError(f"No extractor named '{name}'.")
+
+@register_extractor("pdf", lambda head, path: head.startswith(b"%PDF-"))
+def extract_pdf(path: str) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ExtractionError("reading PDF files requires the 'pypdf' package (pip install pypdf).")
+    try:
+        reader = PdfReader(path)
+        return "\n\n".join((page.extract_text() or "").strip() for page in reader.pages)
+    except Exception as e:
+        raise ExtractionError(f"invalid PDF: {e}")
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+def _is_docx(head: bytes, path: str) -> bool:
+    if not head.startswith(b"PK\x03\x04"):
+        return False
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return "word/document.xml" in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+@register_extractor("docx", _is_docx)
+def extract_docx(path: str) -> str:
+    """Paragraph text of a Word document, one paragraph per line (stdlib only)."""
+    try:
+        with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as document:
+            paragraphs = []
+            current = []
+            for event, element in ElementTree.iterparse(document, events=("end",)):
+                if element.tag == f"{_W}t":
+                    current.append(element.text or "")
+                elif element.tag == f"{_W}tab":
+                    current.append("\t")
+                elif element.tag in (f"{_W}br", f"{_W}cr"):
+                    current.append("\n")
+                elif element.tag == f"{_W}p":
+                    paragraphs.append("".join(current))
+                    current = []
+                    element.clear()
+            return "\n".join(paragraphs)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise ExtractionError(f"invalid DOCX: {e}")
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _extract_to(name: str, path: str, cache_path: str) -> None:
+    text = _extractor(name)(path)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    atomic_write(cache_path, text)
+
+class ExtractionCache:
+    """
+    Extracted text of non-plain-text documents, cached on disk by content hash.
+
+    Each document is parsed once on a background worker pool and its text is
+    stored as `.file_agent/extracted/<sha256>.txt`; readers are then pointed at
+    that file. Format and hash are remembered per (inode, size, mtime_ns), so an
+    unchanged file is neither re-sniffed nor re-hashed, and a document that
+    failed to parse is not parsed again until it changes. Extracted text is
+    removed once no workspace file has that content any more (see `forget`
+    and `prune`).
+    """
+
+    def __init__(self, max_workers: int = int(os.environ.get("FILE_AGENT_EXTRACT_WORKERS", DEFAULT_EXTRACT_WORKERS))):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract")
+        # Re-entrant: a future that is already done runs its callback while the lock is held.
+        self._lock = threading.RLock()
+        self._known = {}
+        self._inflight = {}
+        self._failed = {}  # cache_path -> the failed extraction's future
+        self.hits = 0
+        self.extractions = 0
+        self.failures = 0
+        self.failure_hits = 0
+        self.pruned = 0
+
+    def _identify(self, path: str, stat: os.stat_result = None):
+        """Return (format, digest) for a file; format is None for plain text."""
+        stat = stat or os.stat(path)
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            known = self._known.get(path)
+        if known is not None and known[0] == key:
+            return known[1], known[2]
+        name = sniff_format(path)
+        digest = _file_digest(path) if name else None
+        with self._lock:
+            self._known[path] = (key, name, digest)
+        return name, digest
+
+    def _submit(self, base_dir: str, path: str):
+        """Start extracting a document unless its text is cached; return (cache_path, future or None)."""
+        name, digest = self._identify(path)
+        if name is None:
+            return None, None
+        cache_path = os.path.join(state_dir(base_dir), EXTRACTED_DIR_NAME, f"{digest}.txt")
+        with self._lock:
+            future = self._inflight.get(cache_path)
+            if future is None and cache_path in self._failed:
+                self.failure_hits += 1
+                return cache_path, self._failed[cache_path]
+            if future is None:
+                if os.path.exists(cache_path):
+                    self.hits += 1
+                    return cache_path, None
+                future = self._inflight[cache_path] = self._executor.submit(_extract_to, name, path, cache_path)
+                self.extractions += 1
+                future.add_done_callback(lambda f: self._finish(cache_path, f))
+        return cache_path, future
+
+    def _finish(self, cache_path: str, future) -> None:
+        with self._lock:
+            self._inflight.pop(cache_path, None)
+            if future.exception() is not None:
+                self._failed[cache_path] = future
+                self.failures += 1
+
+    def _remove(self, cache_path: str) -> None:
+        self._failed.pop(cache_path, None)
+        try:
+            os.remove(cache_path)
+            self.pruned += 1
+        except FileNotFoundError:
+            pass
+
+    def forget(self, base_dir: str, path: str) -> None:
+        """
+        Drop what is known about a file that was just written or deleted, and its
+        extracted text unless another known file of the workspace has the same content.
+        """
+        base_dir = os.path.abspath(base_dir)
+        with self._lock:
+            known = self._known.pop(path, None)
+            if known is None or known[2] is None:
+                return
+            digest = known[2]
+            if any(other[2] == digest for other_path, other in self._known.items() if other_path.startswith(base_dir + os.sep)):
+                return
+            cache_path = os.path.join(state_dir(base_dir), EXTRACTED_DIR_NAME, f"{digest}.txt")
+            if cache_path not in self._inflight:
+                self._remove(cache_path)
+
+    def prune(self, base_dir: str, files: dict) -> int:
+        """
+        Remove extracted text that none of the workspace's files ({rel_path: stat}
+        for all of them) has any more, e.g. after documents were deleted outside
+        the tools. Returns how many were removed.
+        """
+        base_dir = os.path.abspath(base_dir)
+        live = set()
+        for rel_path, stat in files.items():
+            try:
+                _, digest = self._identify(os.path.join(base_dir, rel_path), stat)
+            except OSError:
+                continue
+            if digest is not None:
+                live.add(f"{digest}.txt")
+        directory = os.path.join(state_dir(base_dir), EXTRACTED_DIR_NAME)
+        removed = 0
+        with self._lock:
+            for path in [p for p in self._known if p.startswith(base_dir + os.sep) and os.path.relpath(p, base_dir) not in files]:
+                del self._known[path]
+            try:
+                names = os.listdir(directory)
+            except FileNotFoundError:
+                names = []
+            for name in names:
+                cache_path = os.path.join(directory, name)
+                # Temp files of writes in progress start with a dot.
+                if name.startswith(".") or name in live or cache_path in self._inflight:
+                    continue
+                self._remove(cache_path)
+                removed += 1
+            for cache_path in [p for p in self._failed if os.path.dirname(p) == directory and os.path.basename(p) not in live]:
+                del self._failed[cache_path]
+        return removed
+
+    def prefetch(self, base_dir: str, paths: list) -> None:
+        """Queue extraction of several files without waiting, so they are parsed in parallel."""
+        for path in paths:
+            try:
+                self._submit(base_dir, path)
+            except OSError:
+                continue
+
+    def text_path(self, base_dir: str, path: str):
+        """
+        Return the path of a file holding `path`'s text: the extracted-text cache
+        file for documents, None for plain-text files (read those directly).
+        Raises ExtractionError if the document cannot be parsed.
+        """
+        cache_path, future = self._submit(base_dir, path)
+        if future is not None:
+            try:
+                future.result()
+            except ExtractionError:
+                raise
+            except Exception as e:
+                raise ExtractionError(str(e))
+        return cache_path
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "extractions": self.extractions,
+                "failures": self.failures,
+                "failure_hits": self.failure_hits,
+                "pruned": self.pruned,
+                "in_flight": len(self._inflight),
+            }
+
+extraction_cache = ExtractionCache()
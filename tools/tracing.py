@@ -0,0 +1,183 @@
+import contextvars
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """Fixed-bucket latency histogram in the Prometheus style."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket containing the q-quantile (the last finite bound for overflow)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    """In-process latency histograms per span, counters for tokens and bytes, and gauges such as queue depths."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, kind: str, name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get((kind, name))
+            if histogram is None:
+                histogram = self.histograms[(kind, name)] = Histogram()
+            histogram.observe(seconds)
+
+    def add(self, metric: str, labels: tuple, value: float) -> None:
+        with self._lock:
+            key = (metric, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, metric: str, labels: tuple, value: float) -> None:
+        with self._lock:
+            self.gauges[(metric, labels)] = value
+
+    def snapshot(self) -> dict:
+        """JSON-friendly summary: count, mean and approximate p50/p95/p99 per span."""
+        with self._lock:
+            return {
+                "latency": {
+                    f"{kind}:{name}": {
+                        "count": h.count,
+                        "mean_ms": round(h.sum / h.count * 1000, 3) if h.count else 0.0,
+                        "p50_ms": h.quantile(0.5) * 1000,
+                        "p95_ms": h.quantile(0.95) * 1000,
+                        "p99_ms": h.quantile(0.99) * 1000,
+                    }
+                    for (kind, name), h in sorted(self.histograms.items())
+                },
+                "counters": {
+                    f"{metric}{{{','.join(f'{k}={v}' for k, v in labels)}}}": value
+                    for (metric, labels), value in sorted(self.counters.items())
+                },
+                "gauges": {
+                    f"{metric}{{{','.join(f'{k}={v}' for k, v in labels)}}}": value
+                    for (metric, labels), value in sorted(self.gauges.items())
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP file_agent_span_duration_seconds Duration of traced spans.",
+            "# TYPE file_agent_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (kind, name), h in sorted(self.histograms.items()):
+                labels = f'span="{kind}",name="{_escape(name)}"'
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'file_agent_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'file_agent_span_duration_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"file_agent_span_duration_seconds_sum{{{labels}}} {h.sum}")
+                lines.append(f"file_agent_span_duration_seconds_count{{{labels}}} {h.count}")
+            for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+                for metric in sorted({metric for metric, _ in values}):
+                    lines.append(f"# TYPE {metric} {kind}")
+                    for (name, labels), value in sorted(values.items()):
+                        if name == metric:
+                            rendered = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels)
+                            lines.append(f"{metric}{{{rendered}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Atomically write the Prometheus text file for a local scraper (e.g. node_exporter's textfile collector)."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metrics = MetricsRegistry()
+
+class Trace:
+    """The spans recorded while serving one request."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str):
+        self.request_id = f"{os.getpid()}-{next(self._ids)}"
+        self.name = name
+        self.spans = []
+
+    def to_dict(self) -> dict:
+        return {"request_id": self.request_id, "name": self.name, "spans": list(self.spans)}
+
+_current_trace = contextvars.ContextVar("file_agent_trace", default=None)
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def span(kind: str, name: str, **attrs):
+    """
+    Time a block as a span of the current trace and record it in the latency histograms.
+    Attributes may be added to the yielded dict; `bytes_read`, `bytes_written`
+    and token counts are also accumulated as counters.
+    """
+    attrs = dict(attrs)
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe(kind, name, duration)
+        for key in ("bytes_read", "bytes_written"):
+            if attrs.get(key):
+                metrics.add(f"file_agent_tool_{key}_total", (("name", name),), attrs[key])
+        for key in ("request_tokens", "response_tokens"):
+            if attrs.get(key):
+                metrics.add("file_agent_model_tokens_total", (("model", name), ("kind", key[:-7])), attrs[key])
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append({"kind": kind, "name": name, "duration_ms": round(duration * 1000, 3), **attrs})
+
+@contextmanager
+def trace(name: str):
+    """Start a trace for one request; the whole block is recorded as its 'request' span."""
+    current = Trace(name)
+    token = _current_trace.set(current)
+    try:
+        with span("request", name):
+            yield current
+    finally:
+        _current_trace.reset(token)
@@ -0,0 +1,110 @@
+import os
+import stat as stat_module
+import threading
+import time
+import weakref
+
+STATE_DIR_NAME = ".file_agent"
+# Edits made outside the file tools are picked up by a walk of the workspace at most this often.
+DEFAULT_RESCAN_SECONDS = 5.0
+
+def state_dir(base_dir: str) -> str:
+    """Return the hidden directory used for agent state inside the workspace."""
+    return os.path.join(base_dir, STATE_DIR_NAME)
+
+def workspace_rel_path(base_dir: str, path: str):
+    """The workspace-relative path of a file, or None for files a workspace walk would not see."""
+    rel_path = os.path.relpath(os.path.abspath(path), os.path.abspath(base_dir))
+    directories = rel_path.split(os.sep)[:-1]
+    if rel_path.startswith(os.pardir) or any(name.startswith(".") for name in directories):
+        return None
+    return rel_path
+
+def iter_workspace_files(base_dir: str, recursive: bool = True):
+    """
+    Yield (relative_path, os.stat_result) for every regular file in the workspace.
+
+    Built on os.scandir, so file type comes from the directory entry and each
+    file costs a single stat call. Hidden directories (including the agent
+    state directory) are skipped.
+    """
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(base_dir, rel_dir)) as it:
+                for entry in it:
+                    rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and not entry.name.startswith("."):
+                            stack.append(rel_path)
+                    elif entry.is_file():
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue  # removed while walking
+                        yield rel_path, stat
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+
+_feeds = {}  # base_dir -> the ChangeFeeds of that workspace
+_feeds_lock = threading.Lock()
+
+def note_change(base_dir: str, path: str) -> None:
+    """Tell every index of a workspace that a file was written or deleted."""
+    rel_path = workspace_rel_path(base_dir, path)
+    if rel_path is None:
+        return
+    with _feeds_lock:
+        feeds = list(_feeds.get(os.path.abspath(base_dir), ()))
+    for feed in feeds:
+        feed.mark(rel_path)
+
+class ChangeFeed:
+    """
+    Which workspace files an index has to re-check, without walking the
+    workspace on every query. Files written through the file tools (or seen
+    by the workspace watcher) are reported with note_change; edits made any
+    other way are found by a full walk at most once per FILE_AGENT_RESCAN_SECONDS.
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = os.path.abspath(base_dir)
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self._last_walk = None
+        with _feeds_lock:
+            _feeds.setdefault(self.base_dir, weakref.WeakSet()).add(self)
+
+    def mark(self, rel_path: str) -> None:
+        with self.lock:
+            self.dirty.add(rel_path)
+
+    def reset(self) -> None:
+        """Make the next poll walk the whole workspace."""
+        with self.lock:
+            self._last_walk = None
+
+    def poll(self):
+        """
+        Return (walked, files). When a walk is due, files maps every workspace
+        file to its stat and files missing from it are gone. Otherwise it maps
+        only the files reported since the last poll, to their stat or to None
+        if they no longer exist.
+        """
+        interval = float(os.environ.get("FILE_AGENT_RESCAN_SECONDS", DEFAULT_RESCAN_SECONDS))
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            walk = self._last_walk is None or time.monotonic() - self._last_walk >= interval
+            if walk:
+                self._last_walk = time.monotonic()
+        if walk:
+            return True, dict(iter_workspace_files(self.base_dir))
+        files = {}
+        for rel_path in dirty:
+            try:
+                stat = os.stat(os.path.join(self.base_dir, rel_path))
+            except OSError:
+                stat = None
+            files[rel_path] = stat if stat is not None and stat_module.S_ISREG(stat.st_mode) else None
+        return False, files
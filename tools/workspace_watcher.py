@@ -0,0 +1,220 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+
+from tools.workspace import iter_workspace_files
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 1.0
+# Bursts of events (e.g. a write followed by close) are coalesced for this long
+# before the callback runs, so one save produces one notification.
+DEBOUNCE_SECONDS = 0.05
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+def _load_inotify():
+    """Return libc with the inotify functions, or None where inotify is unavailable."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+    except OSError:
+        return None
+    required = ("inotify_init1", "inotify_add_watch", "inotify_rm_watch")
+    return libc if all(hasattr(libc, name) for name in required) else None
+
+def snapshot(base_dir: str) -> dict:
+    """Map every workspace file to (size, mtime_ns), for mtime polling."""
+    return {rel_path: (stat.st_size, stat.st_mtime_ns) for rel_path, stat in iter_workspace_files(base_dir)}
+
+def diff_snapshots(before: dict, after: dict) -> dict:
+    """Return {rel_path: "created" | "modified" | "deleted"} between two snapshots."""
+    changes = {rel_path: "deleted" for rel_path in before.keys() - after.keys()}
+    for rel_path, state in after.items():
+        if rel_path not in before:
+            changes[rel_path] = "created"
+        elif before[rel_path] != state:
+            changes[rel_path] = "modified"
+    return changes
+
+class WorkspaceWatcher:
+    """
+    Report created, modified and deleted workspace files to an async callback.
+
+    Uses inotify on Linux and falls back to polling file sizes and mtimes
+    elsewhere. Hidden directories (including the agent state directory) are
+    not watched. The callback receives {rel_path: change} after each debounced
+    burst of events.
+    """
+
+    def __init__(self, base_dir: str, on_change, poll_interval: float = None, use_inotify: bool = True):
+        self.base_dir = os.path.abspath(base_dir)
+        self.on_change = on_change
+        self.poll_interval = poll_interval or float(os.environ.get("FILE_AGENT_WATCH_POLL_SECONDS", DEFAULT_POLL_INTERVAL))
+        self.use_inotify = use_inotify
+        self.backend = None
+        self._pending = {}
+        self._changed = asyncio.Event()
+        self._tasks = []
+        self._fd = None
+        self._libc = None
+        self._watches = {}  # watch descriptor -> relative directory
+        self._known = set()  # files seen so far, so a rename onto one reads as a modification
+
+    async def start(self) -> None:
+        libc = _load_inotify() if self.use_inotify else None
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._libc, self._fd = libc, fd
+                self._watch_tree("")
+                self._known = set((await asyncio.to_thread(snapshot, self.base_dir)).keys())
+                asyncio.get_running_loop().add_reader(fd, self._read_events)
+                self.backend = "inotify"
+        if self.backend is None:
+            self._snapshot = await asyncio.to_thread(snapshot, self.base_dir)
+            self._tasks.append(asyncio.create_task(self._poll()))
+            self.backend = "polling"
+        self._tasks.append(asyncio.create_task(self._dispatch()))
+        logger.info(f"Watching {self.base_dir} for changes ({self.backend})")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def _record(self, changes: dict) -> None:
+        for rel_path, change in changes.items():
+            previous = self._pending.get(rel_path)
+            # A file created and then written within one burst is still "created".
+            self._pending[rel_path] = previous if previous == "created" and change == "modified" else change
+        if changes:
+            self._changed.set()
+
+    async def _dispatch(self) -> None:
+        while True:
+            await self._changed.wait()
+            await asyncio.sleep(DEBOUNCE_SECONDS)
+            self._changed.clear()
+            changes, self._pending = self._pending, {}
+            try:
+                await self.on_change(changes)
+            except Exception as e:
+                logger.error(f"Workspace change handler failed: {e}", exc_info=True)
+
+    # -- mtime polling ---------------------------------------------------
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = await asyncio.to_thread(snapshot, self.base_dir)
+            changes = diff_snapshots(self._snapshot, current)
+            self._snapshot = current
+            self._record(changes)
+
+    # -- inotify ---------------------------------------------------------
+
+    def _watch_tree(self, rel_dir: str) -> None:
+        """Watch a directory and, recursively, its non-hidden subdirectories."""
+        stack = [rel_dir]
+        while stack:
+            rel_dir = stack.pop()
+            path = os.path.join(self.base_dir, rel_dir)
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                continue
+            self._watches[wd] = rel_dir
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."):
+                            stack.append(os.path.join(rel_dir, entry.name) if rel_dir else entry.name)
+            except OSError:
+                continue
+
+    def _read_events(self) -> None:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        changes = {}
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, pos)
+            name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0").decode("utf-8", errors="surrogateescape")
+            pos += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; report every file as modified rather than miss a change.
+                current = {rel_path for rel_path, _ in iter_workspace_files(self.base_dir)}
+                changes.update({rel_path: "deleted" for rel_path in self._known - current})
+                changes.update({rel_path: "modified" for rel_path in current})
+                self._known = current
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            rel_dir = self._watches.get(wd)
+            if rel_dir is None or not name or name.startswith("."):
+                continue
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(rel_path)
+                    for inner, _ in iter_workspace_files(os.path.join(self.base_dir, rel_path)):
+                        inner = os.path.join(rel_path, inner)
+                        changes[inner] = "modified" if inner in self._known else "created"
+                        self._known.add(inner)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    # A directory moved away reports nothing for the files inside it.
+                    prefix = rel_path + os.sep
+                    for inner in [known for known in self._known if known.startswith(prefix)]:
+                        changes[inner] = "deleted"
+                        self._known.discard(inner)
+                    for watched, watched_dir in list(self._watches.items()):
+                        if watched_dir == rel_path or watched_dir.startswith(prefix):
+                            del self._watches[watched]
+                            # A deleted directory drops its own watch; one moved elsewhere keeps it alive.
+                            if mask & IN_MOVED_FROM:
+                                self._libc.inotify_rm_watch(self._fd, watched)
+                continue
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # atomic_write renames a temp file over the target: that is an edit, not a new file.
+                changes[rel_path] = "modified" if rel_path in self._known else "created"
+                self._known.add(rel_path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                changes[rel_path] = "deleted"
+                self._known.discard(rel_path)
+            elif rel_path not in changes:
+                changes[rel_path] = "modified"
+        self._record(changes)